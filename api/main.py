@@ -1,16 +1,31 @@
-from fastapi import FastAPI, HTTPException, Depends
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+import time
+
+_import_started = time.perf_counter()
+
+from fastapi import FastAPI, HTTPException, Depends, Request
+from fastapi.responses import ORJSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
-from database.database import get_db, init_db
+from database.database import get_db, init_db, engine, SessionLocal
 from database.models import Character, GameSession
-from api.routes import character, game
+from api.routes import character, game, bootstrap, ws, admin
+from api.static import PrecompressedStaticFiles, webapp_directory
+from api.middleware import IdempotencyMiddleware, MetricsMiddleware, ProfilerMiddleware
+from api.services.idempotency import idempotency_store
+from api.services.metrics import registry, worker_metrics, instrument_engine
+from api.services.tracing import tracer
+from api.services.profiling import profiler
+from api.services.lifecycle import lifecycle
+from api.services.warmup import warm_up
+from api.services.workers import sync_loop
 from config.settings import settings
-import uvicorn
+import asyncio
 import logging
 import os
 
+lifecycle.record_phase("imports", time.perf_counter() - _import_started)
+_setup_started = time.perf_counter()
+
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -19,7 +34,19 @@ logger = logging.getLogger(__name__)
 app = FastAPI(
     title="Daggerheart Bot API",
     description="API для телеграм-бота игры Daggerheart",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
+)
+
+# Профилирование запросов по команде администратора (/api/admin/profiler)
+app.add_middleware(ProfilerMiddleware, profiler=profiler)
+
+# Повторы POST-запросов с Idempotency-Key (Telegram WebView повторяет сбойные запросы)
+app.add_middleware(
+    IdempotencyMiddleware,
+    store=idempotency_store,
+    path_prefixes=("/api/game", "/api/character"),
+    poll_interval=settings.IDEMPOTENCY_POLL_INTERVAL
 )
 
 # Настройка CORS
@@ -44,12 +71,29 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Метрики, Server-Timing и трассировка запросов (внешний слой: учитывает и ответы из кэша идемпотентности)
+app.add_middleware(MetricsMiddleware, tracer=tracer)
+instrument_engine(engine, SessionLocal)
+
 # Подключение роутов
 app.include_router(character.router, prefix="/api/character", tags=["character"])
 app.include_router(game.router, prefix="/api/game", tags=["game"])
+app.include_router(ws.router, prefix="/api/game", tags=["game"])
+app.include_router(bootstrap.router, prefix="/api/bootstrap", tags=["bootstrap"])
+app.include_router(admin.router, prefix="/api/admin", tags=["admin"], include_in_schema=False)
+
+# Бот в режиме webhook: обновления Telegram принимает этот же процесс
+webhook = None
+if settings.BOT_MODE == "webhook":
+    from bot import webhook
+    app.include_router(webhook.router)
 
-# Статические файлы для веб-приложения
-app.mount("/webapp", StaticFiles(directory="webapp", html=True), name="webapp")
+# Статические файлы для веб-приложения (webapp/dist после python build_webapp.py)
+webapp_files = PrecompressedStaticFiles(directory=webapp_directory(), html=True)
+app.mount("/webapp", webapp_files, name="webapp")
+
+
+lifecycle.record_phase("app_setup", time.perf_counter() - _setup_started)
 
 
 @app.get("/")
@@ -64,15 +108,15 @@ async def root():
 
 
 @app.get("/webapp")
-async def webapp_redirect():
-    """Редирект на главную страницу веб-приложения"""
-    return FileResponse("webapp/index.html")
+async def webapp_redirect(request: Request):
+    """Главная страница веб-приложения без завершающего слэша"""
+    return await webapp_files.get_response("index.html", request.scope)
 
 
 @app.get("/webapp/")
-async def webapp_index():
+async def webapp_index(request: Request):
     """Главная страница веб-приложения"""
-    return FileResponse("webapp/index.html")
+    return await webapp_files.get_response("index.html", request.scope)
 
 
 @app.get("/health")
@@ -84,24 +128,67 @@ async def health_check():
     }
 
 
+@app.get("/ready", include_in_schema=False)
+async def readiness_check():
+    """Готовность принимать запросы: 503 до завершения запуска и во время остановки"""
+    if not lifecycle.accepting:
+        return ORJSONResponse({"status": "draining" if lifecycle.draining else "starting"}, status_code=503)
+    return {"status": "ready"}
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Метрики в текстовом формате Prometheus (в run.py — сумма по всем рабочим процессам)"""
+    text = worker_metrics.render() if worker_metrics is not None else registry.render()
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4")
+
+
 @app.on_event("startup")
 async def startup_event():
     """Инициализация при запуске"""
     logger.info("Запуск Daggerheart Bot API...")
 
-    # Инициализация базы данных
-    await init_db()
+    # Проверка версии схемы базы данных (таблицы создаются только при ее несовпадении)
+    with lifecycle.phase("schema_check"):
+        await init_db()
 
-    logger.info("API успешно запущен!")
+    lifecycle.ready = True
+    logger.info(f"API успешно запущен! Этапы запуска: {lifecycle.startup_report()}")
+
+    # Отложенные импорты, соединения и кэши прогреваются в фоне, пока процесс уже отвечает
+    app.state.warmup = asyncio.create_task(warm_up(game.deepseek_service))
+    if webhook is not None:
+        app.state.webhook = asyncio.create_task(webhook.startup())
+    if worker_metrics is not None:
+        # Метрики процесса и команды профилировщика синхронизируются через общий каталог
+        app.state.worker_sync = asyncio.create_task(
+            sync_loop(settings.WORKER_SYNC_INTERVAL, worker_metrics.flush, profiler.sync)
+        )
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Очистка при остановке"""
     logger.info("Остановка Daggerheart Bot API...")
+    app.state.warmup.cancel()
+
+    # Соединения уже закрыты сервером; дожидаемся ходов WebSocket, ожидающих DeepSeek
+    await lifecycle.drain(settings.SHUTDOWN_TIMEOUT)
+    await game.deepseek_service.aclose()
+    if webhook is not None:
+        await webhook.shutdown()
+    if tracer.exporter is not None:
+        await asyncio.to_thread(tracer.exporter.flush)
+    if worker_metrics is not None:
+        # Последние значения процесса остаются в сумме счетчиков после его остановки
+        app.state.worker_sync.cancel()
+        worker_metrics.flush()
+        profiler.sync()
 
 
 if __name__ == "__main__":
+    import uvicorn
+
     uvicorn.run(
         "api.main:app",
         host=settings.API_HOST,
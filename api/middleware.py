@@ -0,0 +1,241 @@
+import asyncio
+import functools
+import hashlib
+import json
+import time
+from typing import Tuple
+from fastapi.routing import APIRoute
+from starlette.types import ASGIApp, Receive, Scope, Send, Message
+from api.services.idempotency import IdempotencyStore, StoredResponse
+from api.services.metrics import current_timings, record_stage, http_requests, http_request_duration
+from api.services.tracing import Tracer
+from api.services.profiling import Profiler
+import logging
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = b"idempotency-key"
+MAX_KEY_LENGTH = 255
+# Ошибки клиента, которые повторятся при том же запросе; 409 и 429 — временные, их повтор выполняется заново
+REPLAYED_CLIENT_ERRORS = {400, 401, 403, 404, 405, 410, 413, 415, 422}
+
+
+class IdempotencyMiddleware:
+    """Повтор POST-запроса с тем же Idempotency-Key возвращает сохраненный ответ.
+
+    Сохраняются успешные ответы и ошибки клиента, которые не изменятся при
+    повторе (REPLAYED_CLIENT_ERRORS); 5xx, 409 и 429 не сохраняются: такой
+    запрос можно повторить с тем же ключом. Тот же ключ с другим телом
+    запроса — ошибка клиента (422). Ключ занимается в базе до вызова
+    обработчика, поэтому дубликат, попавший в другой рабочий процесс, ждет
+    ответа первого запроса, а не выполняет ход повторно.
+    """
+
+    def __init__(self, app: ASGIApp, store: IdempotencyStore, path_prefixes: Tuple[str, ...],
+                 poll_interval: float = 0.2):
+        self.app = app
+        self.store = store
+        self.path_prefixes = path_prefixes
+        self.poll_interval = poll_interval
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["method"] != "POST" or not scope["path"].startswith(self.path_prefixes):
+            await self.app(scope, receive, send)
+            return
+
+        client_key = dict(scope["headers"]).get(IDEMPOTENCY_HEADER)
+        if client_key is None:
+            await self.app(scope, receive, send)
+            return
+
+        client_key = client_key.decode("latin-1").strip()
+        if not client_key or len(client_key) > MAX_KEY_LENGTH:
+            await _send_error(send, 400, f"Idempotency-Key должен содержать от 1 до {MAX_KEY_LENGTH} символов")
+            return
+
+        body = await _read_body(receive)
+        request_hash = hashlib.sha256(body).hexdigest()
+        key = f"{scope['path']} {client_key}"
+
+        while True:
+            stored = self.store.get(key)
+            if stored is not None:
+                if stored.request_hash != request_hash:
+                    await _send_error(send, 422, "Idempotency-Key уже использован с другим телом запроса")
+                else:
+                    await _replay(send, stored)
+                return
+
+            # Дубликат ждет завершения первого запроса с этим ключом
+            pending = self.store.in_flight(key)
+            if pending is not None:
+                await asyncio.shield(pending)
+                continue
+            if self.store.claim(key, request_hash):
+                break
+            # Ключ занят запросом в другом рабочем процессе: ждем его ответа в базе
+            await asyncio.sleep(self.poll_interval)
+
+        status_code = None
+        content_type = "application/json"
+        chunks = []
+
+        body_sent = False
+
+        async def replay_body() -> Message:
+            nonlocal body_sent
+            if body_sent:
+                return await receive()
+            body_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        async def capture(message: Message):
+            nonlocal status_code, content_type
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                for name, value in message.get("headers", []):
+                    if name.lower() == b"content-type":
+                        content_type = value.decode("latin-1")
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, replay_body, capture)
+        finally:
+            if status_code is not None and (status_code < 400 or status_code in REPLAYED_CLIENT_ERRORS):
+                self.store.complete(key, request_hash, status_code, content_type, b"".join(chunks))
+            else:
+                self.store.complete(key, request_hash)
+
+
+class MetricsMiddleware:
+    """Число и длительность HTTP-запросов по шаблону маршрута, Server-Timing и трассировка.
+
+    Время от возврата из обработчика до начала ответа (валидация и кодирование
+    ответа FastAPI) учитывается как этап serialization; для этого маршруты
+    создаются с TimedRoute.
+    """
+
+    def __init__(self, app: ASGIApp, tracer: Tracer):
+        self.app = app
+        self.tracer = tracer
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        traceparent = headers.get(b"traceparent")
+        timings = self.tracer.begin(traceparent.decode("latin-1") if traceparent else None)
+        started = timings.started
+        token = current_timings.set(timings)
+        status_code = 500
+
+        async def timed_send(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if timings.endpoint_finished is not None:
+                    record_stage("serialization", time.perf_counter() - timings.endpoint_finished)
+                if self.tracer.server_timing_enabled:
+                    server_timing = self.tracer.server_timing(timings, time.perf_counter() - started)
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"server-timing", server_timing.encode("latin-1")),
+                        (b"x-trace-id", timings.trace_id.encode("latin-1")),
+                    ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, timed_send)
+        finally:
+            current_timings.reset(token)
+            route = _route_label(scope)
+            total = time.perf_counter() - started
+            http_requests.inc(scope["method"], route, str(status_code))
+            http_request_duration.observe(total, scope["method"], route)
+            self.tracer.finish(timings, scope["method"], route, scope["path"], status_code, total)
+
+
+class TimedRoute(APIRoute):
+    """Маршрут, отмечающий момент возврата из обработчика (для этапа serialization)"""
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        if asyncio.iscoroutinefunction(endpoint):
+            original = endpoint
+
+            @functools.wraps(original)
+            async def endpoint(*args, **kw):
+                try:
+                    return await original(*args, **kw)
+                finally:
+                    timings = current_timings.get()
+                    if timings is not None:
+                        timings.endpoint_finished = time.perf_counter()
+
+        super().__init__(path, endpoint, **kwargs)
+
+
+def _route_label(scope: Scope) -> str:
+    """Шаблон пути вместо самого пути, чтобы не плодить метки"""
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    if scope["path"].startswith("/webapp"):
+        return "/webapp"
+    return "unmatched"
+
+
+class ProfilerMiddleware:
+    """Включает профилировщик на время запросов, выбранных текущим профилированием"""
+
+    def __init__(self, app: ASGIApp, profiler: Profiler, exclude_prefix: str = "/api/admin"):
+        self.app = app
+        self.profiler = profiler
+        self.exclude_prefix = exclude_prefix
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        capture = self.profiler.capture
+        if (capture is None or scope["type"] != "http" or scope["path"].startswith(self.exclude_prefix)
+                or not capture.claim(scope["path"])):
+            await self.app(scope, receive, send)
+            return
+
+        capture.enter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            capture.exit()
+
+
+async def _read_body(receive: Receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            return b"".join(chunks)
+
+
+async def _replay(send: Send, stored: StoredResponse):
+    await send({
+        "type": "http.response.start",
+        "status": stored.status_code,
+        "headers": [
+            (b"content-type", stored.content_type.encode("latin-1")),
+            (b"content-length", str(len(stored.body)).encode()),
+            (b"idempotent-replayed", b"true"),
+        ],
+    })
+    await send({"type": "http.response.body", "body": stored.body})
+
+
+async def _send_error(send: Send, status_code: int, detail: str):
+    body = json.dumps({"detail": detail}, ensure_ascii=False).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status_code,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
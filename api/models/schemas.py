@@ -0,0 +1,45 @@
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Optional, List, Dict, Any
+
+
+# Типизированные схемы ответов: pydantic-core сериализует их без обхода произвольных dict
+class CharacterSchema(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+
+    id: int
+    user_id: int
+    name: str
+    character_class: str = Field(..., alias="class")
+    ancestry: str
+    hope: int
+    fear: int
+    agility: int
+    strength: int
+    finesse: int
+    instinct: int
+    presence: int
+    knowledge: int
+    armor_score: int
+    hit_points: int
+    current_hit_points: int
+    stress: int
+    abilities: List[str] = []
+    equipment: List[Any] = []
+    spells: List[Any] = []
+    created_at: Optional[str] = None
+    is_active: bool
+    version: Optional[int] = None
+
+
+class SessionSchema(BaseModel):
+    id: int
+    user_id: int
+    character_id: int
+    is_active: bool
+    current_scene: Optional[str] = None
+    game_state: Dict[str, Any] = {}
+    event_seq: Optional[int] = None
+    version: Optional[int] = None
+    created_at: Optional[str] = None
+    updated_at: Optional[str] = None
+    last_action_at: Optional[str] = None
@@ -0,0 +1,113 @@
+import secrets
+from fastapi import APIRouter, HTTPException, Depends, Header, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Optional, Literal
+from api.services.profiling import profiler
+from database.transfer import stream_campaign
+from config.settings import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Доступ только с токеном ADMIN_TOKEN; без настроенного токена эндпоинты отключены"""
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not secrets.compare_digest(x_admin_token, settings.ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Нет доступа")
+
+
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+
+# Pydantic модели
+class ProfileStartRequest(BaseModel):
+    mode: Literal["cprofile", "sample"] = "cprofile"
+    requests: int = Field(default=20, ge=1, le=10000)
+    route: Optional[str] = None  # Шаблон маршрута, например /api/game/roll-dice
+
+
+class ContinuousRequest(BaseModel):
+    enabled: bool
+    interval: Optional[float] = Field(default=None, ge=0.001, le=10.0)
+
+
+@router.post("/profiler/start")
+async def start_profiling(request: ProfileStartRequest):
+    """Профилирование следующих N запросов (в каждом рабочем процессе)"""
+    try:
+        status = profiler.start_capture(request.mode, request.requests, request.route)
+        return {"success": True, "message": "Профилирование начато", "status": status}
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@router.get("/profiler/status")
+async def profiling_status():
+    """Состояние текущего профилирования и постоянного сэмплирования"""
+    return {
+        "capture": profiler.capture_status(),
+        "continuous": profiler.continuous_status()
+    }
+
+
+@router.post("/profiler/stop")
+async def stop_profiling():
+    """Досрочное завершение профилирования (результат доступен для скачивания)"""
+    profiler.stop_capture()
+    return {"success": True, "message": "Профилирование остановлено"}
+
+
+@router.get("/profiler/result")
+async def download_profile(format: str = "pstats"):
+    """Результат профилирования: pstats / text (cprofile) или collapsed (sample)"""
+    try:
+        content, media_type, filename = profiler.capture_result(format)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return Response(content=content, media_type=media_type,
+                    headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+
+@router.post("/profiler/continuous")
+async def set_continuous_sampling(request: ContinuousRequest):
+    """Включение/выключение постоянного сэмплирования с низкой частотой"""
+    if request.enabled:
+        profiler.enable_continuous(request.interval)
+        logger.info(f"Постоянное сэмплирование включено, интервал {request.interval or profiler.continuous_interval} с")
+    else:
+        profiler.disable_continuous()
+        logger.info("Постоянное сэмплирование выключено")
+    return {"success": True, "enabled": request.enabled}
+
+
+@router.get("/profiler/continuous")
+async def download_continuous_samples(reset: bool = False):
+    """Свернутые стеки постоянного сэмплирования (для flamegraph)"""
+    collapsed = profiler.continuous_result(reset=reset)
+    if collapsed is None:
+        raise HTTPException(status_code=409, detail="Постоянное сэмплирование выключено")
+    return Response(content=collapsed.encode(), media_type="text/plain",
+                    headers={"Content-Disposition": 'attachment; filename="continuous.collapsed"'})
+
+
+@router.get("/export")
+async def export_campaign(user_id: Optional[int] = None, gzip: bool = True):
+    """Потоковый экспорт кампании пользователя (или всей базы) в NDJSON.
+
+    Файл импортируется командой python -m database.transfer import.
+    """
+    name = f"campaign-{user_id}" if user_id is not None else "backup"
+    filename = f"{name}.ndjson.gz" if gzip else f"{name}.ndjson"
+    logger.info(f"Экспорт кампании: {'пользователь ' + str(user_id) if user_id is not None else 'вся база'}")
+    # Синхронный генератор: StreamingResponse читает его в пуле потоков, порциями
+    return StreamingResponse(
+        stream_campaign(user_id, compress=gzip),
+        media_type="application/gzip" if gzip else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
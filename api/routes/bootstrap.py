@@ -0,0 +1,67 @@
+from fastapi import APIRouter, HTTPException, Depends, Header
+from sqlalchemy.orm import Session
+from pydantic import BaseModel
+from typing import Optional, List, Dict, Any
+from database.database import get_db, get_character_by_user_id
+from api.models.schemas import CharacterSchema, SessionSchema
+from api.services.cache import response_cache, conditional_response, make_etag, render_model, version_of
+from api.services import sessions
+from api.services.game_logic import DaggerheartGameLogic
+from api.middleware import TimedRoute
+import logging
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(route_class=TimedRoute)
+
+# Справочники не меняются во время работы - собираем один раз
+GAME_TABLES = DaggerheartGameLogic().get_game_tables()
+
+
+class BootstrapResponse(BaseModel):
+    success: bool
+    message: str
+    character: Optional[CharacterSchema] = None
+    session: Optional[SessionSchema] = None
+    narrative: List[str] = []
+    tables: Dict[str, Any]
+
+
+@router.get("/{user_id}", response_model=BootstrapResponse)
+async def bootstrap(user_id: int, if_none_match: Optional[str] = Header(None), db: Session = Depends(get_db)):
+    """Все данные для запуска Mini App одним запросом"""
+    try:
+        cached = response_cache.get("bootstrap", user_id)
+        if cached:
+            return conditional_response(if_none_match, *cached)
+        generation = response_cache.generation(user_id)
+
+        character = get_character_by_user_id(db, user_id)
+        session, state = sessions.load_active_session(db, user_id)
+
+        session_data = None
+        narrative = []
+        if session:
+            narrative = state.pop("recent_narrative", [])
+            session_data = session.to_dict(state)
+
+        response = BootstrapResponse(
+            success=True,
+            message="Данные для запуска получены",
+            character=character.to_dict() if character else None,
+            session=session_data,
+            narrative=narrative,
+            tables=GAME_TABLES
+        )
+        etag = make_etag(
+            "bootstrap", user_id, version_of(character),
+            session.id if session else "none", session.event_seq if session else 0
+        )
+
+        body = render_model(response)
+        response_cache.set("bootstrap", user_id, etag, body, generation)
+        return conditional_response(if_none_match, etag, body)
+
+    except Exception as e:
+        logger.error(f"Ошибка загрузки данных для запуска: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка загрузки данных для запуска: {str(e)}")
@@ -1,21 +1,32 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Header, Query
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, List
 from database.database import (
     get_db, create_game_session, get_active_game_session,
-    update_game_session, add_narrative_to_session, add_action_to_session,
-    create_dice_roll, get_character_by_id, update_character,
-    close_all_user_sessions
+    create_dice_roll, get_character_by_id,
+    close_all_user_sessions, get_characters_by_ids,
+    get_game_session_by_id, get_session_dice_rolls, get_session_events, iter_session_history,
+    modify_character, release_connection, ConcurrentUpdateError
 )
 from api.services.deepseek import DeepSeekService
 from api.services.game_logic import DaggerheartGameLogic
+from api.services.combat import CombatEngine
+from api.services.dice import DiceService, generate_seed
+from api.services import event_store as events
+from api.services import sessions
+from api.services.event_store import event_store
+from api.services.locks import user_locks
+from api.services.metrics import observe_stage
+from api.models.schemas import CharacterSchema, SessionSchema
+from api.services.cache import response_cache, conditional_response, make_etag, render_model, version_of
+from api.middleware import TimedRoute
+from config.settings import settings
 import logging
-import random
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter()
+router = APIRouter(route_class=TimedRoute)
 
 
 # Pydantic модели
@@ -38,240 +49,537 @@ class GameActionRequest(BaseModel):
     description: Optional[str] = ""
 
 
+class AdversaryState(BaseModel):
+    name: str
+    hit_points: int = 10
+    current_hit_points: Optional[int] = None
+    difficulty: int = 12
+    armor_score: int = 0
+    attack_bonus: int = 2
+    damage_die: int = 6
+    damage_bonus: int = 0
+
+
+class CombatRoundRequest(BaseModel):
+    characterId: int
+    userId: int
+    partyIds: Optional[List[int]] = None  # Остальные участники группы
+    adversaries: Optional[List[AdversaryState]] = None  # Новое столкновение
+
+
+class CombatRoundResponse(BaseModel):
+    success: bool
+    message: str
+    narrative: Optional[str] = None
+    round: dict
+    party: List[dict]
+    adversaries: List[dict]
+
+
 class GameResponse(BaseModel):
     success: bool
     message: str
     narrative: Optional[str] = None
-    character: Optional[dict] = None
-    game_state: Optional[dict] = None
+    character: Optional[CharacterSchema] = None
+    game_state: Optional[SessionSchema] = None
+
+
+class SessionResponse(BaseModel):
+    success: bool
+    message: str
+    session: Optional[SessionSchema] = None
+    character: Optional[CharacterSchema] = None
 
 
 # Инициализация сервисов
 deepseek_service = DeepSeekService()
 game_logic = DaggerheartGameLogic()
+combat_engine = CombatEngine(max_hope=settings.MAX_HOPE, max_fear=settings.MAX_FEAR)
+dice_service = DiceService(block_size=settings.DICE_POOL_BLOCK_SIZE)
 
 
 @router.post("/start", response_model=GameResponse)
 async def start_game_session(request: GameStartRequest, db: Session = Depends(get_db)):
     """Начало новой игровой сессии"""
     try:
-        logger.info(f"Начало игровой сессии для пользователя {request.userId}")
+        # Ходы одного пользователя выполняются по очереди
+        async with user_locks.hold(request.userId):
+            logger.info(f"Начало игровой сессии для пользователя {request.userId}")
+
+            # Получаем персонажа
+            character = get_character_by_id(db, request.characterId)
+            if not character:
+                raise HTTPException(status_code=404, detail="Персонаж не найден")
+
+            if character.user_id != request.userId:
+                raise HTTPException(status_code=403, detail="Нет доступа к этому персонажу")
+
+            # Закрываем все активные сессии пользователя
+            close_all_user_sessions(db, request.userId)
+
+            # Создаем новую сессию
+            session_data = {
+                "user_id": request.userId,
+                "character_id": request.characterId,
+                "rng_seed": generate_seed()
+            }
+            session = create_game_session(db, session_data)
+
+            # Генерируем начальное повествование с помощью DeepSeek
+            character_data = character.to_dict()
+            with observe_stage("prompt_build"):
+                initial_prompt = game_logic.create_initial_prompt(character)
+            release_connection(db)
+            narrative = await deepseek_service.generate_narrative(initial_prompt, character_data)
+
+            # Записываем начальную сцену и повествование в журнал событий
+            session.current_scene = "Начало приключения"
+            state = event_store.record(db, session, [
+                (events.SCENE_CHANGED, {
+                    "scene": "Начало приключения",
+                    "location": "starting_area",
+                    "details": {"scene": "intro", "location": "starting_area"}
+                }),
+                (events.NARRATIVE_EMITTED, {"text": narrative})
+            ])
+
+            logger.info(f"Игровая сессия {session.id} создана успешно")
+
+            return GameResponse(
+                success=True,
+                message="Игровая сессия начата",
+                narrative=narrative,
+                character=character_data,
+                game_state=session.to_dict(state)
+            )
 
-        # Получаем персонажа
-        character = get_character_by_id(db, request.characterId)
-        if not character:
-            raise HTTPException(status_code=404, detail="Персонаж не найден")
+    except HTTPException:
+        raise
+    except ConcurrentUpdateError:
+        raise HTTPException(status_code=409, detail="Состояние игры изменилось, повторите запрос")
+    except Exception as e:
+        logger.error(f"Ошибка начала игровой сессии: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка начала игровой сессии: {str(e)}")
 
-        if character.user_id != request.userId:
-            raise HTTPException(status_code=403, detail="Нет доступа к этому персонажу")
 
-        # Закрываем все активные сессии пользователя
-        close_all_user_sessions(db, request.userId)
+@router.post("/roll-dice", response_model=GameResponse)
+async def roll_dice(request: DiceRollRequest, db: Session = Depends(get_db)):
+    """Бросок костей"""
+    try:
+        # Ходы одного пользователя выполняются по очереди
+        async with user_locks.hold(request.userId):
+            logger.info(f"Бросок костей для персонажа {request.characterId}")
+
+            # Получаем персонажа и активную сессию
+            character = get_character_by_id(db, request.characterId)
+            if not character:
+                raise HTTPException(status_code=404, detail="Персонаж не найден")
+
+            session = get_active_game_session(db, request.userId)
+            if not session:
+                raise HTTPException(status_code=404, detail="Активная игровая сессия не найдена")
+
+            # Бросаем кости из пула сессии
+            dice = dice_service.get_pool(session)
+            rng_offset = dice.cursor
+            hope_die, fear_die = (int(value) for value in dice.roll(12, 2))
+
+            # Вычисляем результат
+            result = game_logic.calculate_dice_result(hope_die, fear_die, request.difficulty)
+
+            # Повествование строится по Hope/Fear после броска; в базу ничего не пишется до ответа DeepSeek
+            character_data = {**character.to_dict(), **game_logic.update_hope_fear(character, result)}
+            context = {
+                "dice_result": result,
+                "character": character_data
+            }
+            with observe_stage("prompt_build"):
+                narrative_prompt = game_logic.create_dice_result_prompt(context)
+            release_connection(db)
+            narrative = await deepseek_service.generate_narrative(narrative_prompt, character_data)
+
+            # Hope/Fear, бросок, курсор пула и события — одной транзакцией: при конфликте
+            # (409) не сохраняется ничего. Бросок применяется к свежей строке персонажа
+            before = {}
+
+            def apply_roll(current):
+                before.update(hope=current.hope, fear=current.fear)
+                return game_logic.update_hope_fear(current, result)
+
+            updated_character = modify_character(db, character.id, apply_roll, commit=False)
+            character_data = updated_character.to_dict()
+            create_dice_roll(db, {
+                "session_id": session.id,
+                "user_id": request.userId,
+                "hope_die": hope_die,
+                "fear_die": fear_die,
+                "action_type": request.actionType,
+                "difficulty": request.difficulty,
+                "success": result["success"],
+                "description": f"Бросок: Hope {hope_die}, Fear {fear_die}",
+                "result_description": result["description"],
+                "rng_offset": rng_offset
+            }, commit=False)
+            session.rng_cursor = dice.cursor
+
+            state = event_store.record(db, session, [
+                (events.DICE_ROLLED, {
+                    "hope_die": hope_die,
+                    "fear_die": fear_die,
+                    "difficulty": request.difficulty,
+                    "action_type": request.actionType,
+                    "success": result["success"],
+                    "description": result["description"],
+                    "rng_offset": rng_offset
+                }),
+                (events.HOPE_CHANGED, {
+                    "hope": character_data["hope"],
+                    "fear": character_data["fear"],
+                    "hope_delta": character_data["hope"] - before["hope"],
+                    "fear_delta": character_data["fear"] - before["fear"]
+                }),
+                (events.NARRATIVE_EMITTED, {"text": narrative})
+            ])
+
+            logger.info(f"Бросок костей выполнен: Hope {hope_die}, Fear {fear_die}, Успех: {result['success']}")
+
+            return GameResponse(
+                success=True,
+                message="Кости брошены",
+                narrative=narrative,
+                character=character_data,
+                game_state=session.to_dict(state)
+            )
 
-        # Создаем новую сессию
-        session_data = {
-            "user_id": request.userId,
-            "character_id": request.characterId
-        }
-        session = create_game_session(db, session_data)
+    except HTTPException:
+        raise
+    except ConcurrentUpdateError:
+        raise HTTPException(status_code=409, detail="Состояние игры изменилось, повторите запрос")
+    except Exception as e:
+        logger.error(f"Ошибка броска костей: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка броска костей: {str(e)}")
 
-        # Генерируем начальное повествование с помощью DeepSeek
-        initial_prompt = game_logic.create_initial_prompt(character)
-        narrative = await deepseek_service.generate_narrative(initial_prompt, character.to_dict())
 
-        # Сохраняем повествование
-        add_narrative_to_session(db, session.id, narrative)
+@router.post("/action", response_model=GameResponse)
+async def perform_action(request: GameActionRequest, db: Session = Depends(get_db)):
+    """Выполнение игрового действия"""
+    try:
+        # Ходы одного пользователя выполняются по очереди
+        async with user_locks.hold(request.userId):
+            logger.info(f"Действие '{request.action}' для персонажа {request.characterId}")
+
+            # Получаем персонажа и активную сессию
+            character = get_character_by_id(db, request.characterId)
+            if not character:
+                raise HTTPException(status_code=404, detail="Персонаж не найден")
+
+            session = get_active_game_session(db, request.userId)
+            if not session:
+                raise HTTPException(status_code=404, detail="Активная игровая сессия не найдена")
+
+            # Обрабатываем действие
+            action_result = game_logic.process_action(request.action, character, session)
+
+            # Генерируем повествование
+            character_data = character.to_dict()
+            context = {
+                "action": request.action,
+                "description": request.description,
+                "character": character_data,
+                "result": action_result
+            }
+            with observe_stage("prompt_build"):
+                narrative_prompt = game_logic.create_action_prompt(context)
+            release_connection(db)
+            narrative = await deepseek_service.generate_narrative(narrative_prompt, character_data)
+
+            # Дописываем действие, смену сцены и повествование в журнал
+            turn_events = [(events.ACTION_PERFORMED, {
+                "action": request.action,
+                "description": request.description,
+                "action_type": action_result.get("action_type")
+            })]
+            if action_result.get("scene_change"):
+                session.current_scene = action_result["new_scene"]
+                turn_events.append((events.SCENE_CHANGED, {
+                    "scene": action_result["new_scene"],
+                    "details": action_result.get("new_game_state")
+                }))
+            turn_events.append((events.NARRATIVE_EMITTED, {"text": narrative}))
+            state = event_store.record(db, session, turn_events)
+
+            logger.info(f"Действие '{request.action}' выполнено успешно")
+
+            return GameResponse(
+                success=True,
+                message="Действие выполнено",
+                narrative=narrative,
+                character=character_data,
+                game_state=session.to_dict(state)
+            )
 
-        # Обновляем состояние сессии
-        update_game_session(db, session.id, {
-            "current_scene": "Начало приключения",
-            "game_state": {"scene": "intro", "location": "starting_area"}
-        })
+    except HTTPException:
+        raise
+    except ConcurrentUpdateError:
+        raise HTTPException(status_code=409, detail="Состояние игры изменилось, повторите запрос")
+    except Exception as e:
+        logger.error(f"Ошибка выполнения действия: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка выполнения действия: {str(e)}")
 
-        logger.info(f"Игровая сессия {session.id} создана успешно")
 
-        return GameResponse(
-            success=True,
-            message="Игровая сессия начата",
-            narrative=narrative,
-            character=character.to_dict(),
-            game_state=session.to_dict()
-        )
+@router.post("/combat/round", response_model=CombatRoundResponse)
+async def combat_round(request: CombatRoundRequest, db: Session = Depends(get_db)):
+    """Расчет целого раунда боя: группа против всех противников"""
+    try:
+        # Ходы одного пользователя выполняются по очереди
+        async with user_locks.hold(request.userId):
+            session = get_active_game_session(db, request.userId)
+            if not session:
+                raise HTTPException(status_code=404, detail="Активная игровая сессия не найдена")
+
+            combat = event_store.load_state(db, session)["combat"]
+
+            if request.adversaries:
+                # Начинаем новое столкновение
+                party_ids = [request.characterId] + [i for i in (request.partyIds or []) if i != request.characterId]
+                combat = {
+                    "round": 0,
+                    "party_ids": party_ids,
+                    "adversaries": [
+                        adversary.model_dump(exclude_none=True) for adversary in request.adversaries
+                    ],
+                    "finished": False
+                }
+            elif not combat or combat.get("finished"):
+                raise HTTPException(status_code=400, detail="Нет активного боя")
+
+            # Загружаем всю группу одним запросом
+            party = get_characters_by_ids(db, combat["party_ids"])
+            if not any(c.id == request.characterId for c in party):
+                raise HTTPException(status_code=403, detail="Нет доступа к этому персонажу")
+            # Раунд записывает Hope/Fear и здоровье всей группы: чужие персонажи в нее не входят
+            if any(c.user_id != request.userId for c in party):
+                raise HTTPException(status_code=403, detail="Нет доступа к персонажам группы")
+
+            dice = dice_service.get_pool(session)
+            party_data = [c.to_dict() for c in party]
+            result = combat_engine.resolve_round(party_data, combat["adversaries"], dice)
+            combat = {
+                **combat,
+                "round": combat["round"] + 1,
+                "adversaries": result["adversaries"],
+                "finished": result["summary"]["finished"]
+            }
+
+            # Одно сводное повествование на весь раунд
+            with observe_stage("prompt_build"):
+                narrative_prompt = game_logic.create_combat_round_prompt({**result, "round": combat["round"]})
+            leader = next(c for c in party_data if c["id"] == request.characterId)
+            release_connection(db)
+            narrative = await deepseek_service.generate_narrative(narrative_prompt, leader)
+
+            # Одна запись в базу на весь раунд
+            character_updates = {
+                member["id"]: {
+                    "current_hit_points": member["current_hit_points"],
+                    "hope": member["hope"],
+                    "fear": member["fear"]
+                }
+                for member in result["party"]
+            }
+            session.rng_cursor = dice.cursor
+            event_store.record(db, session, [
+                (events.COMBAT_ROUND, {"combat": combat, "summary": result["summary"]}),
+                (events.NARRATIVE_EMITTED, {"text": narrative})
+            ], character_updates)
+
+            logger.info(f"Раунд боя {combat['round']} сессии {session.id}: {result['summary']}")
+
+            return CombatRoundResponse(
+                success=True,
+                message="Бой окончен" if combat["finished"] else "Раунд боя завершен",
+                narrative=narrative,
+                round={**result["summary"], "number": combat["round"]},
+                party=result["party"],
+                adversaries=result["adversaries"]
+            )
 
     except HTTPException:
         raise
+    except ConcurrentUpdateError:
+        raise HTTPException(status_code=409, detail="Состояние игры изменилось, повторите запрос")
     except Exception as e:
-        logger.error(f"Ошибка начала игровой сессии: {e}")
-        raise HTTPException(status_code=500, detail=f"Ошибка начала игровой сессии: {str(e)}")
+        logger.error(f"Ошибка раунда боя: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка раунда боя: {str(e)}")
 
 
-@router.post("/roll-dice", response_model=GameResponse)
-async def roll_dice(request: DiceRollRequest, db: Session = Depends(get_db)):
-    """Бросок костей"""
+@router.get("/session/{user_id}", response_model=SessionResponse)
+async def get_game_session(user_id: int, if_none_match: Optional[str] = Header(None),
+                           db: Session = Depends(get_db)):
+    """Получение активной игровой сессии (с поддержкой ETag / If-None-Match)"""
     try:
-        logger.info(f"Бросок костей для персонажа {request.characterId}")
+        # Повторный опрос без изменений отвечаем из кэша, не обращаясь к базе
+        cached = response_cache.get("session", user_id)
+        if cached:
+            return conditional_response(if_none_match, *cached)
+        generation = response_cache.generation(user_id)
 
-        # Получаем персонажа и активную сессию
-        character = get_character_by_id(db, request.characterId)
-        if not character:
-            raise HTTPException(status_code=404, detail="Персонаж не найден")
+        session, state = sessions.load_active_session(db, user_id)
 
-        session = get_active_game_session(db, request.userId)
         if not session:
-            raise HTTPException(status_code=404, detail="Активная игровая сессия не найдена")
-
-        # Бросаем кости
-        hope_die = random.randint(1, 12)
-        fear_die = random.randint(1, 12)
-
-        # Вычисляем результат
-        result = game_logic.calculate_dice_result(hope_die, fear_die, request.difficulty)
-
-        # Обновляем Hope и Fear персонажа
-        character_updates = game_logic.update_hope_fear(character, result)
-        updated_character = update_character(db, character.id, character_updates)
-
-        # Сохраняем бросок в базу
-        dice_roll_data = {
-            "session_id": session.id,
-            "user_id": request.userId,
-            "hope_die": hope_die,
-            "fear_die": fear_die,
-            "action_type": request.actionType,
-            "difficulty": request.difficulty,
-            "success": result["success"],
-            "description": f"Бросок: Hope {hope_die}, Fear {fear_die}",
-            "result_description": result["description"]
-        }
-        create_dice_roll(db, dice_roll_data)
+            response = SessionResponse(
+                success=False,
+                message="Активная игровая сессия не найдена"
+            )
+            etag = make_etag("session", user_id, "none")
+        else:
+            character = get_character_by_id(db, session.character_id)
+
+            response = SessionResponse(
+                success=True,
+                message="Игровая сессия найдена",
+                session=session.to_dict(state),
+                character=character.to_dict() if character else None
+            )
+            etag = make_etag("session", session.id, session.event_seq, version_of(session), version_of(character))
+
+        body = render_model(response)
+        response_cache.set("session", user_id, etag, body, generation)
+        return conditional_response(if_none_match, etag, body)
 
-        # Генерируем повествование на основе результата
-        context = {
-            "dice_result": result,
-            "character": updated_character.to_dict(),
-            "session": session.to_dict()
-        }
-        narrative_prompt = game_logic.create_dice_result_prompt(context)
-        narrative = await deepseek_service.generate_narrative(narrative_prompt, updated_character.to_dict())
+    except Exception as e:
+        logger.error(f"Ошибка получения игровой сессии: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка получения игровой сессии: {str(e)}")
 
-        # Сохраняем повествование и действие
-        add_narrative_to_session(db, session.id, narrative)
-        add_action_to_session(db, session.id, f"dice_roll: {result['description']}")
 
-        logger.info(f"Бросок костей выполнен: Hope {hope_die}, Fear {fear_die}, Успех: {result['success']}")
+@router.get("/session/{session_id}/replay")
+async def replay_session_dice(session_id: int, user_id: int, db: Session = Depends(get_db)):
+    """Воспроизведение бросков сессии по seed и сверка с сохраненными результатами"""
+    try:
+        session = get_game_session_by_id(db, session_id)
+
+        if not session or session.user_id != user_id:
+            raise HTTPException(status_code=404, detail="Игровая сессия не найдена")
 
-        return GameResponse(
-            success=True,
-            message="Кости брошены",
-            narrative=narrative,
-            character=updated_character.to_dict(),
-            game_state=session.to_dict()
-        )
+        if session.rng_seed is None:
+            raise HTTPException(status_code=400, detail="Сессия создана без seed и не может быть воспроизведена")
+
+        rolls = [
+            roll.to_dict() for roll in get_session_dice_rolls(db, session_id, limit=None)
+            if roll.rng_offset is not None
+        ]
+        report = dice_service.replay_rolls(session.rng_seed, rolls)
+
+        return {
+            "success": True,
+            "message": "Броски воспроизведены" if report["consistent"] else "Найдены расхождения",
+            "seed": session.rng_seed,
+            "cursor": session.rng_cursor,
+            **report
+        }
 
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Ошибка броска костей: {e}")
-        raise HTTPException(status_code=500, detail=f"Ошибка броска костей: {str(e)}")
+        logger.error(f"Ошибка воспроизведения сессии: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка воспроизведения сессии: {str(e)}")
 
 
-@router.post("/action", response_model=GameResponse)
-async def perform_action(request: GameActionRequest, db: Session = Depends(get_db)):
-    """Выполнение игрового действия"""
+# Записи журнала, которые показываются в истории сессии
+HISTORY_KINDS = {
+    events.NARRATIVE_EMITTED: "narrative",
+    events.ACTION_PERFORMED: "action",
+    events.DICE_ROLLED: "dice_roll",
+    events.COMBAT_ROUND: "combat_round",
+}
+
+
+@router.get("/session/{session_id}/history")
+async def get_session_history(session_id: int, user_id: int, cursor: Optional[int] = None,
+                              limit: int = Query(default=settings.HISTORY_PAGE_SIZE, ge=1),
+                              order: str = Query(default="desc", pattern="^(asc|desc)$"),
+                              db: Session = Depends(get_db)):
+    """История сессии (повествование, действия, броски) постранично.
+
+    cursor — значение next_cursor предыдущей страницы; order=desc начинает с последних записей.
+    """
     try:
-        logger.info(f"Действие '{request.action}' для персонажа {request.characterId}")
+        session = get_game_session_by_id(db, session_id)
 
-        # Получаем персонажа и активную сессию
-        character = get_character_by_id(db, request.characterId)
-        if not character:
-            raise HTTPException(status_code=404, detail="Персонаж не найден")
+        if not session or session.user_id != user_id:
+            raise HTTPException(status_code=404, detail="Игровая сессия не найдена")
 
-        session = get_active_game_session(db, request.userId)
-        if not session:
-            raise HTTPException(status_code=404, detail="Активная игровая сессия не найдена")
-
-        # Обрабатываем действие
-        action_result = game_logic.process_action(request.action, character, session)
-
-        # Генерируем повествование
-        context = {
-            "action": request.action,
-            "description": request.description,
-            "character": character.to_dict(),
-            "session": session.to_dict(),
-            "result": action_result
-        }
-        narrative_prompt = game_logic.create_action_prompt(context)
-        narrative = await deepseek_service.generate_narrative(narrative_prompt, character.to_dict())
-
-        # Сохраняем повествование и действие
-        add_narrative_to_session(db, session.id, narrative)
-        add_action_to_session(db, session.id, f"action: {request.action} - {request.description}")
-
-        # Обновляем состояние сессии если нужно
-        if action_result.get("scene_change"):
-            update_game_session(db, session.id, {
-                "current_scene": action_result["new_scene"],
-                "game_state": action_result.get("new_game_state", session.game_state)
+        limit = min(limit, settings.HISTORY_MAX_PAGE_SIZE)
+        # Лишняя запись показывает, есть ли следующая страница
+        rows = iter_session_history(db, session_id, list(HISTORY_KINDS), cursor, limit + 1, order == "desc")
+
+        entries = []
+        has_more = False
+        for seq, event_type, payload, created_at in rows:
+            if len(entries) == limit:
+                has_more = True
+                break
+            entries.append({
+                "seq": seq,
+                "kind": HISTORY_KINDS[event_type],
+                "created_at": created_at.isoformat() if created_at else None,
+                "data": payload
             })
+        rows.close()
 
-        logger.info(f"Действие '{request.action}' выполнено успешно")
-
-        return GameResponse(
-            success=True,
-            message="Действие выполнено",
-            narrative=narrative,
-            character=character.to_dict(),
-            game_state=session.to_dict()
-        )
+        return {
+            "success": True,
+            "message": "История сессии получена",
+            "entries": entries,
+            "next_cursor": entries[-1]["seq"] if has_more else None,
+            "last_seq": session.event_seq or 0
+        }
 
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Ошибка выполнения действия: {e}")
-        raise HTTPException(status_code=500, detail=f"Ошибка выполнения действия: {str(e)}")
+        logger.error(f"Ошибка получения истории сессии: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка получения истории сессии: {str(e)}")
 
 
-@router.get("/session/{user_id}")
-async def get_game_session(user_id: int, db: Session = Depends(get_db)):
-    """Получение активной игровой сессии"""
+@router.get("/session/{session_id}/state")
+async def get_session_state(session_id: int, user_id: int, at_seq: Optional[int] = None,
+                            include_events: bool = False, db: Session = Depends(get_db)):
+    """Состояние сессии на момент события at_seq (по умолчанию - текущее)"""
     try:
-        session = get_active_game_session(db, user_id)
+        session = get_game_session_by_id(db, session_id)
 
-        if not session:
-            return {
-                "success": False,
-                "message": "Активная игровая сессия не найдена"
-            }
+        if not session or session.user_id != user_id:
+            raise HTTPException(status_code=404, detail="Игровая сессия не найдена")
 
-        character = get_character_by_id(db, session.character_id)
+        state = event_store.load_state(db, session, at_seq)
+        seq = session.event_seq if at_seq is None else min(at_seq, session.event_seq or 0)
 
-        return {
+        response = {
             "success": True,
-            "message": "Игровая сессия найдена",
-            "session": session.to_dict(),
-            "character": character.to_dict() if character else None
+            "message": "Состояние сессии получено",
+            "seq": seq,
+            "state": state
         }
+        if include_events:
+            response["events"] = [event.to_dict() for event in get_session_events(db, session_id, 0, seq)]
 
+        return response
+
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Ошибка получения игровой сессии: {e}")
-        raise HTTPException(status_code=500, detail=f"Ошибка получения игровой сессии: {str(e)}")
+        logger.error(f"Ошибка получения состояния сессии: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка получения состояния сессии: {str(e)}")
 
 
 @router.post("/session/{session_id}/end")
 async def end_game_session(session_id: int, user_id: int, db: Session = Depends(get_db)):
     """Завершение игровой сессии"""
     try:
-        session = get_active_game_session(db, user_id)
-
-        if not session or session.id != session_id:
+        if not await sessions.end_session(db, user_id, session_id):
             raise HTTPException(status_code=404, detail="Игровая сессия не найдена")
 
-        # Завершаем сессию
-        update_game_session(db, session_id, {"is_active": False})
-
-        logger.info(f"Игровая сессия {session_id} завершена")
-
         return {
             "success": True,
             "message": "Игровая сессия завершена"
@@ -279,6 +587,8 @@ async def end_game_session(session_id: int, user_id: int, db: Session = Depends(
 
     except HTTPException:
         raise
+    except ConcurrentUpdateError:
+        raise HTTPException(status_code=409, detail="Состояние игры изменилось, повторите запрос")
     except Exception as e:
         logger.error(f"Ошибка завершения игровой сессии: {e}")
         raise HTTPException(status_code=500, detail=f"Ошибка завершения игровой сессии: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,202 @@
+"""
+Маршруты упрощенного API (без DeepSeek и журнала событий) поверх GameRepository.
+
+Правила — общие с основным API (DaggerheartGameLogic, initial_stats);
+хранилище берется из app.state.repository, поэтому одни и те же маршруты
+работают с памятью, SQLite и асинхронным SQLite.
+"""
+
+import random
+from fastapi import APIRouter, HTTPException, Depends, Request
+from pydantic import BaseModel, Field
+from typing import Optional
+from api.services.game_logic import DaggerheartGameLogic, initial_stats
+from database.errors import ConcurrentUpdateError
+from database.repository import GameRepository
+import logging
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+game_logic = DaggerheartGameLogic()
+
+
+# Pydantic модели
+class CharacterCreate(BaseModel):
+    name: str
+    character_class: str = Field(..., alias="class")
+    ancestry: str
+    userId: int
+
+
+class DiceRollRequest(BaseModel):
+    characterId: int
+    userId: int
+    actionType: Optional[str] = "general"
+    difficulty: Optional[int] = 12
+
+
+class GameStartRequest(BaseModel):
+    characterId: int
+    userId: int
+
+
+def get_repository(request: Request) -> GameRepository:
+    return request.app.state.repository
+
+
+def new_character(character_data: CharacterCreate) -> dict:
+    """Персонаж со значениями по умолчанию и начальными характеристиками класса и происхождения"""
+    character = {
+        "name": character_data.name,
+        "class": character_data.character_class,
+        "ancestry": character_data.ancestry,
+        "hope": 5,
+        "fear": 3,
+        "agility": 0,
+        "strength": 0,
+        "finesse": 0,
+        "instinct": 0,
+        "presence": 0,
+        "knowledge": 0,
+        "armor_score": 0,
+        "hit_points": 20,
+        "current_hit_points": 20,
+        "stress": 0,
+        "abilities": [],
+        "equipment": [],
+        "spells": []
+    }
+    character.update(initial_stats(character_data.character_class, character_data.ancestry))
+    return character
+
+
+@router.post("/character/")
+async def create_character(character_data: CharacterCreate, repository: GameRepository = Depends(get_repository)):
+    """Создание нового персонажа"""
+    try:
+        character = await repository.create_character(character_data.userId, new_character(character_data))
+
+        return {
+            "success": True,
+            "message": "Персонаж создан успешно",
+            "character": character
+        }
+
+    except Exception as e:
+        logger.error(f"Ошибка создания персонажа: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка создания персонажа: {str(e)}")
+
+
+@router.get("/character/{user_id}")
+async def get_character(user_id: int, repository: GameRepository = Depends(get_repository)):
+    """Получение персонажа пользователя"""
+    try:
+        character = await repository.get_active_character(user_id)
+        if character:
+            return {
+                "success": True,
+                "message": "Персонаж найден",
+                "character": character
+            }
+
+        return {
+            "success": False,
+            "message": "Персонаж не найден"
+        }
+
+    except Exception as e:
+        logger.error(f"Ошибка получения персонажа: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка получения персонажа: {str(e)}")
+
+
+@router.post("/game/start")
+async def start_game(request: GameStartRequest, repository: GameRepository = Depends(get_repository)):
+    """Начало игровой сессии"""
+    try:
+        character = await repository.get_character(request.userId, request.characterId)
+
+        if not character:
+            raise HTTPException(status_code=404, detail="Персонаж не найден")
+
+        # Создаем игровую сессию
+        session = await repository.create_session(request.userId, {
+            "character_id": request.characterId,
+            "current_scene": "Начало приключения"
+        })
+
+        # Генерируем начальное повествование
+        narratives = [
+            f"Приветствую, {character['name']}! Ты стоишь на пороге великого приключения. Перед тобой расстилается мир, полный тайн и опасностей.",
+            f"Твоя история начинается здесь, {character['name']}. Магия этого мира уже чувствует твое присутствие...",
+            f"Добро пожаловать в мир Daggerheart, {character['name']}! Твой путь героя только начинается."
+        ]
+
+        narrative = random.choice(narratives)
+
+        return {
+            "success": True,
+            "message": "Игровая сессия начата",
+            "narrative": narrative,
+            "character": character,
+            "game_state": session
+        }
+
+    except HTTPException:
+        raise
+    except ConcurrentUpdateError:
+        raise HTTPException(status_code=409, detail="Состояние игры изменилось, повторите запрос")
+    except Exception as e:
+        logger.error(f"Ошибка начала игровой сессии: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка начала игровой сессии: {str(e)}")
+
+
+@router.post("/game/roll-dice")
+async def roll_dice(request: DiceRollRequest, repository: GameRepository = Depends(get_repository)):
+    """Бросок костей"""
+    try:
+        # Бросаем кости
+        hope_die = random.randint(1, 12)
+        fear_die = random.randint(1, 12)
+        result = game_logic.calculate_dice_result(hope_die, fear_die, request.difficulty)
+
+        # Hope и Fear — по тем же правилам, что и в основном API
+        character = await repository.modify_character(
+            request.userId, request.characterId,
+            lambda current: game_logic.update_hope_fear(current, result)
+        )
+
+        if not character:
+            raise HTTPException(status_code=404, detail="Персонаж не найден")
+
+        # Генерируем описание результата
+        if result["success"]:
+            narratives = [
+                f"Отличный бросок! (Hope: {hope_die}, Fear: {fear_die}) Твое действие увенчалось успехом!",
+                f"Удача на твоей стороне! Результат {result['total']} превышает сложность {request.difficulty}.",
+                f"Превосходно! Боги благосклонны к тебе в этот момент."
+            ]
+        else:
+            narratives = [
+                f"Не все прошло гладко... (Hope: {hope_die}, Fear: {fear_die}) Но это лишь новая возможность для роста!",
+                f"Результат {result['total']} недостаточен, но неудачи делают нас сильнее!",
+                f"Испытание оказалось сложнее ожидаемого, но твой дух не сломлен!"
+            ]
+
+        narrative = random.choice(narratives)
+
+        return {
+            "success": True,
+            "message": "Кости брошены",
+            "narrative": narrative,
+            "character": character,
+            "dice_result": result
+        }
+
+    except HTTPException:
+        raise
+    except ConcurrentUpdateError:
+        raise HTTPException(status_code=409, detail="Состояние игры изменилось, повторите запрос")
+    except Exception as e:
+        logger.error(f"Ошибка броска костей: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка броска костей: {str(e)}")
@@ -0,0 +1,128 @@
+import asyncio
+import time
+from typing import Optional, Dict, Any
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, HTTPException
+from pydantic import ValidationError
+from database.database import SessionLocal
+from api.routes import game
+from api.services.deepseek import narrative_listener
+from api.services.lifecycle import lifecycle
+from api.services.realtime import ChannelManager, GameChannel
+from config.settings import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+channel_manager = ChannelManager(
+    replay_size=settings.WS_REPLAY_BUFFER,
+    queue_size=settings.WS_SEND_QUEUE
+)
+
+# Ходы, доступные через канал: тип сообщения -> (модель запроса, обработчик REST-роута)
+TURN_HANDLERS = {
+    "start": (game.GameStartRequest, game.start_game_session),
+    "roll_dice": (game.DiceRollRequest, game.roll_dice),
+    "action": (game.GameActionRequest, game.perform_action),
+}
+
+
+@router.websocket("/ws/{user_id}")
+async def game_channel(websocket: WebSocket, user_id: int, last_seq: Optional[int] = None):
+    """Постоянный канал игрока.
+
+    Клиент отправляет {"id", "type": "start"|"roll_dice"|"action", "data"},
+    сервер отвечает нумерованными сообщениями narrative_delta/state/error.
+    После переподключения с ?last_seq=N сервер досылает пропущенные сообщения
+    или присылает resync, если они уже вытеснены из буфера.
+    """
+    await websocket.accept()
+    channel = channel_manager.get(user_id)
+
+    if not channel.attach(websocket, last_seq):
+        await channel.send_control("resync", {"seq": channel.seq})
+
+    heartbeat = asyncio.create_task(_heartbeat(websocket, channel))
+    try:
+        while True:
+            message = await websocket.receive_json()
+            channel.last_seen = time.monotonic()
+
+            message_type = message.get("type")
+            if message_type == "ping":
+                await channel.send_control("pong")
+            elif message_type == "pong":
+                continue
+            elif message_type in TURN_HANDLERS:
+                if lifecycle.draining:
+                    await channel.send_control("error", {
+                        "id": message.get("id"), "status": 503, "detail": "Сервер перезапускается, повторите ход"
+                    })
+                    continue
+                if channel.busy:
+                    await channel.send_control("error", {
+                        "id": message.get("id"), "status": 409, "detail": "Предыдущий ход еще обрабатывается"
+                    })
+                    continue
+                channel.busy = True
+                # Ход дорабатывает и при закрытии соединения: при остановке процесса его дожидаются
+                lifecycle.track(asyncio.create_task(_run_turn(channel, message)))
+            else:
+                await channel.send_control("error", {
+                    "id": message.get("id"), "status": 400, "detail": f"Неизвестный тип сообщения: {message_type}"
+                })
+
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.error(f"Ошибка канала пользователя {user_id}: {e}")
+    finally:
+        heartbeat.cancel()
+        channel.detach(websocket)
+
+
+async def _heartbeat(websocket: WebSocket, channel: GameChannel):
+    """Периодический ping; соединение закрывается, если клиент молчит три интервала"""
+    interval = settings.WS_HEARTBEAT_INTERVAL
+    try:
+        while True:
+            await asyncio.sleep(interval)
+            if time.monotonic() - channel.last_seen > interval * 3:
+                logger.info(f"Канал пользователя {channel.user_id} не отвечает, закрываем")
+                await websocket.close(code=1001)
+                return
+            await channel.send_control("ping")
+    except asyncio.CancelledError:
+        pass
+    except Exception as e:
+        logger.info(f"Heartbeat пользователя {channel.user_id} остановлен: {e}")
+
+
+async def _run_turn(channel: GameChannel, message: Dict[str, Any]):
+    """Выполнение хода через обработчик REST-роута с потоковой отправкой повествования"""
+    request_id = message.get("id")
+    request_model, handler = TURN_HANDLERS[message["type"]]
+    token = narrative_listener.set(channel.send_delta)
+    db = SessionLocal()
+    try:
+        data = dict(message.get("data") or {})
+        data["userId"] = channel.user_id
+        response = await handler(request_model(**data), db)
+        await channel.send("state", {
+            "id": request_id,
+            "type": message["type"],
+            **response.model_dump(mode="json", by_alias=True)
+        })
+
+    except ValidationError as e:
+        await channel.send("error", {"id": request_id, "status": 422, "detail": e.errors(include_url=False)})
+    except HTTPException as e:
+        await channel.send("error", {"id": request_id, "status": e.status_code, "detail": e.detail})
+    except Exception as e:
+        logger.error(f"Ошибка хода через WebSocket: {e}")
+        await channel.send("error", {"id": request_id, "status": 500, "detail": "Внутренняя ошибка сервера"})
+    finally:
+        db.close()
+        narrative_listener.reset(token)
+        channel.busy = False
@@ -0,0 +1,121 @@
+import multiprocessing
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple, Dict, Any
+from fastapi import Response
+from pydantic import BaseModel
+from database.database import on_user_write
+from api.services.metrics import track_cache
+from config.settings import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class SharedGenerations:
+    """Счетчики изменений пользователей в памяти, общей для рабочих процессов.
+
+    Массив создается при импорте, то есть до fork в run.py, и наследуется
+    всеми рабочими процессами: изменение, сделанное в одном процессе,
+    сразу делает недействительными кэшированные ответы в остальных.
+    Пользователи распределены по слотам, совпадение слота дает лишний промах.
+    """
+
+    def __init__(self, slots: int = 65536):
+        self.slots = slots
+        self._values = multiprocessing.RawArray("Q", slots)
+        self._lock = multiprocessing.Lock()
+
+    def get(self, user_id: int) -> int:
+        return self._values[hash(user_id) % self.slots]
+
+    def bump(self, user_id: int):
+        with self._lock:
+            self._values[hash(user_id) % self.slots] += 1
+
+
+class ResponseCache:
+    """LRU-кэш готовых ответов на чтение с их ETag.
+
+    Записи сгруппированы по user_id и сбрасываются после commit любых
+    изменений пользователя, в том числе сделанных другим рабочим процессом
+    (см. SharedGenerations). TTL ограничивает устаревание, если запись
+    сделал процесс вне этой группы (бот, другой сервер).
+    """
+
+    def __init__(self, max_users: int = 10000, ttl: float = 5.0, generations: Optional[SharedGenerations] = None):
+        self.max_users = max_users
+        self.ttl = ttl
+        self.generations = generations or SharedGenerations()
+        self.hits = 0
+        self.misses = 0
+        # user_id -> {тип ответа: (истекает, поколение, etag, тело)}
+        self._entries: "OrderedDict[int, Dict[str, Tuple[float, int, str, bytes]]]" = OrderedDict()
+
+    def get(self, kind: str, user_id: int) -> Optional[Tuple[str, bytes]]:
+        """(etag, тело ответа) или None"""
+        entry = self._entries.get(user_id, {}).get(kind)
+        if entry is None or entry[0] < time.monotonic() or entry[1] != self.generations.get(user_id):
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(user_id)
+        self.hits += 1
+        return entry[2], entry[3]
+
+    def generation(self, user_id: int) -> int:
+        """Текущее поколение пользователя: читается до загрузки данных и передается в set"""
+        return self.generations.get(user_id)
+
+    def set(self, kind: str, user_id: int, etag: str, body: bytes, generation: Optional[int] = None):
+        """Сохранение ответа; без generation берется текущее поколение пользователя"""
+        if generation is None:
+            generation = self.generations.get(user_id)
+        self._entries.setdefault(user_id, {})[kind] = (time.monotonic() + self.ttl, generation, etag, body)
+        self._entries.move_to_end(user_id)
+        if len(self._entries) > self.max_users:
+            self._entries.popitem(last=False)
+
+    def invalidate_user(self, user_id: int):
+        """Сброс всех ответов пользователя во всех рабочих процессах"""
+        self.generations.bump(user_id)
+        self._entries.pop(user_id, None)
+
+
+def make_etag(*parts: Any) -> str:
+    """Слабый ETag из версии данных"""
+    return 'W/"' + "-".join(str(part) for part in parts) + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Проверка заголовка If-None-Match"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in (tag.strip() for tag in if_none_match.split(","))
+
+
+def conditional_response(if_none_match: Optional[str], etag: str, body: bytes) -> Response:
+    """304 без тела, если клиент уже имеет эту версию, иначе полный ответ"""
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def render_model(model: BaseModel) -> bytes:
+    """JSON-тело ответа из pydantic-модели (сериализация в pydantic-core)"""
+    return model.model_dump_json(by_alias=True).encode()
+
+
+def version_of(obj: Any) -> str:
+    """Версия строки (счетчик version, увеличивается при каждом UPDATE)"""
+    if obj is None or obj.version is None:
+        return "0"
+    return str(obj.version)
+
+
+response_cache = ResponseCache(settings.RESPONSE_CACHE_SIZE, settings.RESPONSE_CACHE_TTL)
+on_user_write(response_cache.invalidate_user)
+track_cache("response", response_cache)
@@ -0,0 +1,155 @@
+"""
+Персонажи: общие операции для маршрутов API и обработчиков бота.
+
+Бот вызывает эти функции в своем процессе (или в процессе API в режиме
+webhook) напрямую, без HTTP-запроса к собственному API.
+"""
+
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from database.database import (
+    create_character, get_character_by_user_id, get_character_by_id, update_character, deactivate_user_characters
+)
+from api.services.game_logic import initial_stats, CLASS_NAMES, ANCESTRY_NAMES, TRAITS
+from api.services.locks import user_locks
+from api.services.metrics import track_cache
+from config.settings import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+TRAIT_NAMES = {
+    "agility": "Ловкость",
+    "strength": "Сила",
+    "finesse": "Точность",
+    "instinct": "Чутье",
+    "presence": "Харизма",
+    "knowledge": "Знание"
+}
+
+
+class ProfileCards:
+    """Готовые тексты профиля по id персонажа вместе с версией строки.
+
+    Версия увеличивается при каждом UPDATE персонажа (в том числе из другого
+    процесса), поэтому карточка устаревшей версии просто не совпадает —
+    отдельный сброс кэша не нужен.
+    """
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[int, Tuple[Any, str]]" = OrderedDict()
+
+    def get(self, character) -> str:
+        entry = self._entries.get(character.id)
+        if entry is not None and entry[0] == character.version:
+            self._entries.move_to_end(character.id)
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        card = render_profile(character)
+        self._entries[character.id] = (character.version, card)
+        self._entries.move_to_end(character.id)
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return card
+
+
+def render_profile(character) -> str:
+    """Текст профиля персонажа для сообщения в Telegram"""
+    traits = "\n".join(f"• {TRAIT_NAMES[trait]}: {getattr(character, trait) or 0:+d}" for trait in TRAITS)
+    lines = [
+        f"🧙 {character.name}",
+        f"{CLASS_NAMES.get(character.character_class, character.character_class)}, "
+        f"{ANCESTRY_NAMES.get(character.ancestry, character.ancestry)}",
+        "",
+        f"❤️ Здоровье: {character.current_hit_points}/{character.hit_points}",
+        f"✨ Hope: {character.hope}   🌑 Fear: {character.fear}",
+        f"😰 Стресс: {character.stress}   🛡️ Броня: {character.armor_score}",
+        "",
+        traits
+    ]
+    if character.abilities:
+        lines += ["", "Способности: " + ", ".join(character.abilities)]
+    if character.equipment:
+        lines += ["Снаряжение: " + ", ".join(
+            item.get("name", "?") if isinstance(item, dict) else str(item) for item in character.equipment
+        )]
+    return "\n".join(lines)
+
+
+profile_cards = ProfileCards(settings.PROFILE_CARD_CACHE_SIZE)
+track_cache("profile_card", profile_cards)
+
+
+def get_profile_card(db, user_id: int) -> Optional[str]:
+    """Профиль активного персонажа (один запрос к базе) или None"""
+    character = get_character_by_user_id(db, user_id)
+    if character is None:
+        return None
+    return profile_cards.get(character)
+
+
+async def create_new_character(db, user_id: int, name: str, character_class: str, ancestry: str):
+    """Новый активный персонаж с начальными характеристиками; прежний деактивируется"""
+    # Запросы одного пользователя выполняются по очереди
+    async with user_locks.hold(user_id):
+        logger.info(f"Создание персонажа для пользователя {user_id}")
+
+        # Проверяем, есть ли уже активный персонаж у пользователя
+        if get_character_by_user_id(db, user_id):
+            deactivate_user_characters(db, user_id)
+            logger.info(f"Деактивирован старый персонаж пользователя {user_id}")
+
+        character = create_character(db, {
+            "user_id": user_id,
+            "name": name,
+            "class": character_class,
+            "ancestry": ancestry
+        })
+
+        # Начальные характеристики в зависимости от класса и происхождения
+        updates = initial_stats(character_class, ancestry)
+        if updates:
+            character = update_character(db, character.id, updates)
+
+        logger.info(f"Персонаж {character.name} создан успешно")
+        return character
+
+
+async def update_existing_character(db, character_id: int, updates: Dict[str, Any]):
+    """Обновление персонажа с ограничением Hope и Fear; None — персонаж не найден"""
+    character = get_character_by_id(db, character_id)
+    if not character:
+        return None
+
+    # Проверяем ограничения
+    if "hope" in updates:
+        updates["hope"] = max(0, min(10, updates["hope"]))
+    if "fear" in updates:
+        updates["fear"] = max(0, min(10, updates["fear"]))
+
+    async with user_locks.hold(character.user_id):
+        # Перечитываем строку: пока ждали блокировку, ее мог изменить ход игрока
+        db.refresh(character)
+        character = update_character(db, character_id, updates)
+
+    logger.info(f"Персонаж {character_id} обновлен")
+    return character
+
+
+async def deactivate_character(db, character_id: int) -> bool:
+    """Деактивация персонажа вместо удаления; False — персонаж не найден"""
+    character = get_character_by_id(db, character_id)
+    if not character:
+        return False
+
+    async with user_locks.hold(character.user_id):
+        db.refresh(character)
+        update_character(db, character_id, {"is_active": False})
+
+    logger.info(f"Персонаж {character_id} деактивирован")
+    return True
@@ -0,0 +1,171 @@
+import numpy as np
+from typing import Dict, Any, List, Optional
+from api.services.dice import DicePool
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Характеристики противника по умолчанию
+DEFAULT_ADVERSARY = {
+    "name": "Противник",
+    "hit_points": 10,
+    "difficulty": 12,
+    "armor_score": 0,
+    "attack_bonus": 2,
+    "damage_die": 6,
+    "damage_bonus": 0
+}
+
+
+class CombatEngine:
+    """Пакетный расчет боевых раундов: вся группа против всех противников сразу.
+
+    Броски атаки, урон и броня считаются векторно (numpy) для всех участников
+    раунда, поэтому стоимость раунда почти не зависит от числа сражающихся.
+    Раунд разрешается одновременно: все атакуют по состоянию на начало раунда.
+    """
+
+    def __init__(self, weapon_die: int = 6, max_hope: int = 10, max_fear: int = 10):
+        self.weapon_die = weapon_die
+        self.max_hope = max_hope
+        self.max_fear = max_fear
+
+    def resolve_round(self, party: List[Dict[str, Any]], adversaries: List[Dict[str, Any]],
+                      dice: Optional[DicePool] = None) -> Dict[str, Any]:
+        """Расчет одного раунда боя.
+
+        party - словари персонажей (как в Character.to_dict()),
+        adversaries - словари противников (см. DEFAULT_ADVERSARY),
+        dice - пул бросков сессии (для воспроизводимости).
+        """
+        dice = dice or DicePool()
+        adversaries = [{**DEFAULT_ADVERSARY, **adversary} for adversary in adversaries]
+        for adversary in adversaries:
+            adversary.setdefault("current_hit_points", adversary["hit_points"])
+
+        # Состояние группы
+        p_hp = np.array([c["current_hit_points"] for c in party], dtype=np.int64)
+        p_strength = np.array([c["strength"] for c in party], dtype=np.int64)
+        p_agility = np.array([c["agility"] for c in party], dtype=np.int64)
+        p_armor = np.array([c["armor_score"] for c in party], dtype=np.int64)
+        p_hope = np.array([c["hope"] for c in party], dtype=np.int64)
+        p_fear = np.array([c["fear"] for c in party], dtype=np.int64)
+
+        # Состояние противников
+        a_hp = np.array([a["current_hit_points"] for a in adversaries], dtype=np.int64)
+        a_difficulty = np.array([a["difficulty"] for a in adversaries], dtype=np.int64)
+        a_armor = np.array([a["armor_score"] for a in adversaries], dtype=np.int64)
+        a_attack = np.array([a["attack_bonus"] for a in adversaries], dtype=np.int64)
+        a_damage_die = np.array([a["damage_die"] for a in adversaries], dtype=np.int64)
+        a_damage_bonus = np.array([a["damage_bonus"] for a in adversaries], dtype=np.int64)
+
+        party_alive = p_hp > 0
+        adversaries_alive = a_hp > 0
+        living_adversaries = np.flatnonzero(adversaries_alive)
+        living_party = np.flatnonzero(party_alive)
+
+        # Атаки группы: двойные кости Hope/Fear против сложности цели
+        party_damage = np.zeros(len(adversaries), dtype=np.int64)
+        hope_dice = dice.roll(12, len(party))
+        fear_dice = dice.roll(12, len(party))
+        party_hits = np.zeros(len(party), dtype=bool)
+        party_crits = np.zeros(len(party), dtype=bool)
+        attacking = np.zeros(len(party), dtype=bool)
+
+        if len(living_adversaries):
+            attacking = party_alive
+            p_targets = living_adversaries[dice.roll(len(living_adversaries), len(party)) - 1]
+            totals = np.maximum(hope_dice, fear_dice) + p_strength
+            party_hits = party_alive & (totals >= a_difficulty[p_targets])
+            party_crits = party_hits & (hope_dice == fear_dice)
+
+            damage = dice.roll(self.weapon_die, len(party)) + p_strength - a_armor[p_targets]
+            damage = np.maximum(1, damage) * np.where(party_crits, 2, 1)
+            np.add.at(party_damage, p_targets[party_hits], damage[party_hits])
+        else:
+            p_targets = np.full(len(party), -1)
+
+        # Атаки противников: d20 + бонус атаки против уклонения (10 + ловкость)
+        adversary_damage = np.zeros(len(party), dtype=np.int64)
+        adversary_hits = np.zeros(len(adversaries), dtype=bool)
+
+        if len(living_party):
+            a_targets = living_party[dice.roll(len(living_party), len(adversaries)) - 1]
+            attack_rolls = dice.roll(20, len(adversaries)) + a_attack
+            adversary_hits = adversaries_alive & (attack_rolls >= 10 + p_agility[a_targets])
+
+            damage = dice.roll(a_damage_die) + a_damage_bonus - p_armor[a_targets]
+            damage = np.maximum(1, damage)
+            np.add.at(adversary_damage, a_targets[adversary_hits], damage[adversary_hits])
+        else:
+            a_targets = np.full(len(adversaries), -1)
+
+        new_a_hp = np.maximum(0, a_hp - party_damage)
+        new_p_hp = np.maximum(0, p_hp - adversary_damage)
+
+        # Hope/Fear — правила одиночного броска (DaggerheartGameLogic.calculate_dice_result
+        # и update_hope_fear) для всех атаковавших сразу: успех +1 Hope, крит +2,
+        # неудача +1 Fear, критическая неудача +2; доминирующая кость добавляет еще 1
+        tied = hope_dice == fear_dice
+        misses = attacking & ~party_hits
+        hope_gain = np.where(party_crits, 2, np.where(party_hits, 1, 0)) \
+            + (party_hits & (hope_dice > fear_dice))
+        fear_gain = np.where(misses & tied, 2, np.where(misses, 1, 0)) \
+            + (misses & (fear_dice > hope_dice))
+        new_hope = np.clip(p_hope + hope_gain, 0, self.max_hope)
+        new_fear = np.clip(p_fear + fear_gain, 0, self.max_fear)
+
+        # Спасброски от смерти для тех, кто упал в этом раунде
+        fallen = party_alive & (new_p_hp <= 0)
+        save_hope = dice.roll(12, len(party))
+        save_fear = dice.roll(12, len(party))
+        stabilized = fallen & (save_hope > save_fear)
+
+        party_results = [
+            {
+                "id": character["id"],
+                "name": character["name"],
+                "target": int(p_targets[i]),
+                "hit": bool(party_hits[i]),
+                "critical": bool(party_crits[i]),
+                "damage_taken": int(adversary_damage[i]),
+                "current_hit_points": int(new_p_hp[i]),
+                "hope": int(new_hope[i]),
+                "fear": int(new_fear[i]),
+                "fallen": bool(fallen[i]),
+                "stabilized": bool(stabilized[i])
+            }
+            for i, character in enumerate(party)
+        ]
+
+        adversary_results = [
+            {
+                **adversary,
+                "current_hit_points": int(new_a_hp[i]),
+                "target": int(a_targets[i]),
+                "hit": bool(adversary_hits[i]),
+                "damage_taken": int(party_damage[i])
+            }
+            for i, adversary in enumerate(adversaries)
+        ]
+
+        defeated = int(np.count_nonzero(adversaries_alive & (new_a_hp <= 0)))
+        party_down = not np.any(new_p_hp > 0)
+        adversaries_down = not np.any(new_a_hp > 0)
+
+        return {
+            "party": party_results,
+            "adversaries": adversary_results,
+            "summary": {
+                "party_hits": int(np.count_nonzero(party_hits)),
+                "party_criticals": int(np.count_nonzero(party_crits)),
+                "damage_dealt": int(party_damage.sum()),
+                "adversary_hits": int(np.count_nonzero(adversary_hits)),
+                "damage_taken": int(adversary_damage.sum()),
+                "adversaries_defeated": defeated,
+                "adversaries_remaining": int(np.count_nonzero(new_a_hp > 0)),
+                "party_fallen": int(np.count_nonzero(fallen)),
+                "finished": bool(party_down or adversaries_down),
+                "victory": bool(adversaries_down and not party_down)
+            }
+        }
@@ -1,11 +1,23 @@
-import httpx
+import asyncio
 import json
 import logging
-from typing import Dict, Any, Optional
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Dict, Any, Optional, AsyncIterator, Awaitable, Callable, TYPE_CHECKING
+from api.services.metrics import observe_stage, record_stage, deepseek_requests, deepseek_tokens
 from config.settings import settings
 
+if TYPE_CHECKING:
+    import httpx
+
 logger = logging.getLogger(__name__)
 
+# Получатель фрагментов потокового повествования для текущего запроса
+narrative_listener: ContextVar[Optional[Callable[[str], Awaitable[None]]]] = ContextVar(
+    "narrative_listener", default=None
+)
+
 
 class DeepSeekService:
     """Сервис для взаимодействия с DeepSeek API"""
@@ -18,6 +30,9 @@ class DeepSeekService:
             "Content-Type": "application/json"
         }
         self.system_prompt = self._create_system_prompt()
+        self.max_concurrency = settings.DEEPSEEK_MAX_CONCURRENCY
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._client: Optional["httpx.AsyncClient"] = None
 
     def _create_system_prompt(self) -> str:
         """Создание системного промпта для ГМ"""
@@ -51,13 +66,135 @@ class DeepSeekService:
 - Используй элементы фантастического мира с магией"""
 
     async def generate_narrative(self, prompt: str, character_context: Dict[str, Any]) -> str:
-        """Генерация повествования от ГМ"""
+        """Генерация повествования от ГМ.
+
+        Если в текущем контексте установлен narrative_listener (например, открыт
+        WebSocket-канал), ответ запрашивается потоком и фрагменты передаются слушателю.
+        """
+        listener = narrative_listener.get()
+        if listener is not None:
+            chunks = []
+            async for delta in self.stream_narrative(prompt, character_context):
+                chunks.append(delta)
+                await listener(delta)
+            return "".join(chunks).strip()
+
         try:
-            # Подготавливаем контекст персонажа
-            character_summary = self._format_character_context(character_context)
+            # Сборка запроса к DeepSeek — отдельный этап: prompt_build замеряют роуты
+            with observe_stage("payload_build"):
+                payload = self._build_payload(prompt, character_context, stream=False)
+
+            async with self._slot():
+                started = time.perf_counter()
+                # Отправляем запрос к DeepSeek
+                async with self._get_client().stream("POST", self.api_url, headers=self.headers,
+                                                     json=payload) as response:
+                    record_stage("deepseek_ttfb", time.perf_counter() - started)
+                    await response.aread()
+                record_stage("deepseek_total", time.perf_counter() - started)
+
+            if response.status_code != 200:
+                logger.error(f"DeepSeek API error: {response.status_code} - {response.text}")
+                return self._fallback(prompt)
+
+            result = response.json()
+            narrative = result["choices"][0]["message"]["content"].strip()
+            self._record_usage(result.get("usage"))
+            deepseek_requests.inc("ok")
+
+            logger.info(f"Narrative generated successfully: {narrative[:100]}...")
+            return narrative
 
-            # Создаем полный промпт
-            full_prompt = f"""
+        except Exception as e:
+            logger.error(f"Error generating narrative: {e}")
+            return self._fallback(prompt)
+
+    async def stream_narrative(self, prompt: str, character_context: Dict[str, Any]) -> AsyncIterator[str]:
+        """Потоковая генерация повествования: отдает фрагменты текста по мере поступления"""
+        received = False
+        try:
+            with observe_stage("payload_build"):
+                payload = self._build_payload(prompt, character_context, stream=True)
+
+            async with self._slot():
+                started = time.perf_counter()
+                async with self._get_client().stream("POST", self.api_url, headers=self.headers,
+                                                     json=payload) as response:
+                    if response.status_code != 200:
+                        body = await response.aread()
+                        logger.error(f"DeepSeek API error: {response.status_code} - {body[:500]!r}")
+                    else:
+                        # Ответ в формате server-sent events: строки "data: {...}"
+                        async for line in response.aiter_lines():
+                            if not line.startswith("data:"):
+                                continue
+                            data = line[5:].strip()
+                            if data == "[DONE]":
+                                break
+                            chunk = json.loads(data)
+                            # Последний фрагмент содержит usage (stream_options.include_usage)
+                            self._record_usage(chunk.get("usage"))
+                            if not chunk.get("choices"):
+                                continue
+                            delta = chunk["choices"][0].get("delta", {}).get("content")
+                            if delta:
+                                if not received:
+                                    record_stage("deepseek_ttfb", time.perf_counter() - started)
+                                received = True
+                                yield delta
+                record_stage("deepseek_total", time.perf_counter() - started)
+
+        except Exception as e:
+            logger.error(f"Error streaming narrative: {e}")
+
+        if received:
+            deepseek_requests.inc("ok")
+        else:
+            yield self._fallback(prompt)
+
+    def _get_client(self) -> "httpx.AsyncClient":
+        """Общий HTTP-клиент: соединения с DeepSeek переиспользуются между запросами"""
+        if self._client is None or self._client.is_closed:
+            # httpx импортируется при первом запросе (или при прогреве), а не при запуске
+            import httpx
+            self._client = httpx.AsyncClient(
+                timeout=30.0,
+                limits=httpx.Limits(max_connections=self.max_concurrency,
+                                    max_keepalive_connections=self.max_concurrency)
+            )
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @asynccontextmanager
+    async def _slot(self):
+        """Ограничение одновременных запросов к DeepSeek; ожидание учитывается как этап deepseek_queue"""
+        started = time.perf_counter()
+        async with self._semaphore:
+            record_stage("deepseek_queue", time.perf_counter() - started)
+            yield
+
+    def _record_usage(self, usage: Optional[Dict[str, Any]]):
+        if not usage:
+            return
+        for kind in ("prompt_tokens", "completion_tokens"):
+            if usage.get(kind):
+                deepseek_tokens.inc(kind.replace("_tokens", ""), amount=usage[kind])
+
+    def _fallback(self, prompt: str) -> str:
+        deepseek_requests.inc("fallback")
+        return self._get_fallback_narrative(prompt)
+
+    def _build_payload(self, prompt: str, character_context: Dict[str, Any], stream: bool) -> Dict[str, Any]:
+        """Тело запроса к DeepSeek"""
+        # Подготавливаем контекст персонажа
+        character_summary = self._format_character_context(character_context)
+
+        # Создаем полный промпт
+        full_prompt = f"""
 {character_summary}
 
 {prompt}
@@ -65,38 +202,17 @@ class DeepSeekService:
 Создай яркое и увлекательное повествование, учитывая контекст персонажа и ситуации. 
 Ответ должен быть на русском языке, 2-4 предложения."""
 
-            # Отправляем запрос к DeepSeek
-            payload = {
-                "model": "deepseek-chat",
-                "messages": [
-                    {"role": "system", "content": self.system_prompt},
-                    {"role": "user", "content": full_prompt}
-                ],
-                "temperature": 0.8,
-                "max_tokens": 300,
-                "stream": False
-            }
-
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(
-                    self.api_url,
-                    headers=self.headers,
-                    json=payload
-                )
-
-                if response.status_code != 200:
-                    logger.error(f"DeepSeek API error: {response.status_code} - {response.text}")
-                    return self._get_fallback_narrative(prompt)
-
-                result = response.json()
-                narrative = result["choices"][0]["message"]["content"].strip()
-
-                logger.info(f"Narrative generated successfully: {narrative[:100]}...")
-                return narrative
-
-        except Exception as e:
-            logger.error(f"Error generating narrative: {e}")
-            return self._get_fallback_narrative(prompt)
+        return {
+            "model": "deepseek-chat",
+            "messages": [
+                {"role": "system", "content": self.system_prompt},
+                {"role": "user", "content": full_prompt}
+            ],
+            "temperature": 0.8,
+            "max_tokens": 300,
+            "stream": stream,
+            **({"stream_options": {"include_usage": True}} if stream else {})
+        }
 
     def _format_character_context(self, character: Dict[str, Any]) -> str:
         """Форматирование контекста персонажа"""
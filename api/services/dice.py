@@ -0,0 +1,121 @@
+import numpy as np
+import secrets
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Union
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def generate_seed() -> int:
+    """Новый seed для сессии (влезает в знаковое 64-битное целое SQLite)"""
+    return secrets.randbits(63)
+
+
+class DicePool:
+    """Детерминированный пул бросков для одной игровой сессии.
+
+    Случайные числа генерируются блоками (PCG64) и раздаются из буфера.
+    Значение с номером N в потоке зависит только от seed, поэтому любой бросок
+    можно воспроизвести по seed и позиции курсора.
+    """
+
+    def __init__(self, seed: Optional[int] = None, cursor: int = 0, block_size: int = 1024):
+        self.seed = generate_seed() if seed is None else seed
+        self.block_size = block_size
+        self._buffer = np.empty(0)
+        self._position = 0
+        self._cursor = 0
+        self.seek(cursor)
+
+    @property
+    def cursor(self) -> int:
+        """Сколько случайных чисел уже выдано из потока"""
+        return self._cursor
+
+    def seek(self, cursor: int):
+        """Перемещение на позицию потока без генерации пропущенных чисел"""
+        bit_generator = np.random.PCG64(self.seed)
+        bit_generator.advance(cursor)
+        self._generator = np.random.Generator(bit_generator)
+        self._buffer = np.empty(0)
+        self._position = 0
+        self._cursor = cursor
+
+    def uniform(self, count: int) -> np.ndarray:
+        """count чисел из [0, 1)"""
+        chunks = []
+        needed = count
+        while needed > 0:
+            if self._position >= len(self._buffer):
+                self._refill(needed)
+            chunk = self._buffer[self._position:self._position + needed]
+            self._position += len(chunk)
+            needed -= len(chunk)
+            chunks.append(chunk)
+
+        self._cursor += count
+        if len(chunks) == 1:
+            return chunks[0]
+        return np.concatenate(chunks) if chunks else np.empty(0)
+
+    def roll(self, sides: Union[int, np.ndarray], count: Optional[int] = None) -> np.ndarray:
+        """Бросок костей; sides может быть массивом (по кости на элемент)"""
+        if count is None:
+            count = len(sides)
+        return (self.uniform(count) * sides).astype(np.int64) + 1
+
+    def roll_one(self, sides: int) -> int:
+        """Бросок одной кости"""
+        return int(self.roll(sides, 1)[0])
+
+    def _refill(self, needed: int):
+        """Пополнение буфера целыми блоками"""
+        size = max(self.block_size, needed)
+        self._buffer = self._generator.random(size)
+        self._position = 0
+
+
+class DiceService:
+    """Реестр пулов бросков по игровым сессиям"""
+
+    def __init__(self, block_size: int = 1024, max_pools: int = 1000):
+        self.block_size = block_size
+        self.max_pools = max_pools
+        self._pools: "OrderedDict[int, DicePool]" = OrderedDict()
+
+    def get_pool(self, session: Any) -> DicePool:
+        """Пул сессии, синхронизированный с сохраненным курсором"""
+        cursor = session.rng_cursor or 0
+        pool = self._pools.get(session.id)
+
+        if pool is None or pool.seed != session.rng_seed:
+            pool = DicePool(session.rng_seed, cursor, self.block_size)
+            self._pools[session.id] = pool
+            if len(self._pools) > self.max_pools:
+                self._pools.popitem(last=False)
+        elif pool.cursor != cursor:
+            # Курсор сдвинул другой процесс - переходим на сохраненную позицию
+            pool.seek(cursor)
+
+        self._pools.move_to_end(session.id)
+        return pool
+
+    def replay_rolls(self, seed: int, rolls: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Воспроизведение бросков сессии по seed и сверка с журналом"""
+        mismatches = []
+        for roll in rolls:
+            pool = DicePool(seed, roll["rng_offset"], block_size=2)
+            hope_die, fear_die = (int(value) for value in pool.roll(12, 2))
+            if (hope_die, fear_die) != (roll["hope_die"], roll["fear_die"]):
+                mismatches.append({
+                    "id": roll["id"],
+                    "expected": {"hope_die": hope_die, "fear_die": fear_die},
+                    "recorded": {"hope_die": roll["hope_die"], "fear_die": roll["fear_die"]}
+                })
+
+        return {
+            "checked": len(rolls),
+            "mismatches": mismatches,
+            "consistent": not mismatches
+        }
@@ -0,0 +1,137 @@
+from collections import OrderedDict
+from copy import deepcopy
+from typing import Dict, Any, List, Optional, Tuple
+from database.database import append_game_events, get_latest_snapshot, get_session_events
+from api.services.metrics import track_cache
+from config.settings import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Типы событий игровой сессии
+DICE_ROLLED = "dice_rolled"
+HOPE_CHANGED = "hope_changed"
+SCENE_CHANGED = "scene_changed"
+NARRATIVE_EMITTED = "narrative_emitted"
+ACTION_PERFORMED = "action_performed"
+COMBAT_ROUND = "combat_round"
+
+# Сколько последних фрагментов повествования держать в состоянии
+RECENT_NARRATIVE_SIZE = 5
+
+
+def initial_state(base: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Пустое состояние сессии до первого события"""
+    return {
+        "scene": "",
+        "location": None,
+        "details": dict(base or {}),
+        "hope": None,
+        "fear": None,
+        "last_roll": None,
+        "rolls": 0,
+        "actions": 0,
+        "recent_narrative": [],
+        "combat": None
+    }
+
+
+def apply_event(state: Dict[str, Any], event_type: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Применение одного события к состоянию (состояние меняется на месте)"""
+
+    if event_type == DICE_ROLLED:
+        state["last_roll"] = payload
+        state["rolls"] += 1
+
+    elif event_type == HOPE_CHANGED:
+        state["hope"] = payload["hope"]
+        state["fear"] = payload["fear"]
+
+    elif event_type == SCENE_CHANGED:
+        state["scene"] = payload["scene"]
+        state["location"] = payload.get("location", state["location"])
+        if payload.get("details"):
+            state["details"] = payload["details"]
+
+    elif event_type == NARRATIVE_EMITTED:
+        state["recent_narrative"] = (state["recent_narrative"] + [payload["text"]])[-RECENT_NARRATIVE_SIZE:]
+
+    elif event_type == ACTION_PERFORMED:
+        state["actions"] += 1
+
+    elif event_type == COMBAT_ROUND:
+        state["combat"] = payload["combat"]
+
+    else:
+        logger.warning(f"Неизвестный тип события: {event_type}")
+
+    return state
+
+
+class GameEventStore:
+    """Состояние сессии как свертка журнала событий со снимками каждые N событий"""
+
+    def __init__(self, snapshot_interval: int = 50, cache_size: int = 1000):
+        self.snapshot_interval = snapshot_interval
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+        # session_id -> (seq, state): последнее известное состояние в этом процессе
+        self._cache: "OrderedDict[int, Tuple[int, Dict[str, Any]]]" = OrderedDict()
+
+    def load_state(self, db, session: Any, at_seq: Optional[int] = None) -> Dict[str, Any]:
+        """Состояние сессии: последний снимок + хвост событий.
+
+        at_seq позволяет получить состояние на любой момент в прошлом.
+        """
+        current_seq = session.event_seq or 0
+        target_seq = current_seq if at_seq is None else min(at_seq, current_seq)
+
+        cached = self._cache.get(session.id)
+        if cached and cached[0] == target_seq:
+            self._cache.move_to_end(session.id)
+            self.hits += 1
+            return deepcopy(cached[1])
+        self.misses += 1
+
+        snapshot = get_latest_snapshot(db, session.id, target_seq)
+        if snapshot:
+            state, seq = deepcopy(snapshot.state), snapshot.seq
+        else:
+            state, seq = initial_state(session.game_state), 0
+
+        for event in get_session_events(db, session.id, seq, target_seq):
+            apply_event(state, event.event_type, event.payload)
+
+        if target_seq == current_seq:
+            self._remember(session.id, target_seq, state)
+        return state
+
+    def record(self, db, session: Any, events: List[Tuple[str, Dict[str, Any]]],
+               character_updates: Optional[Dict[int, Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """Дописывание событий в журнал одной транзакцией; возвращает новое состояние"""
+        state = self.load_state(db, session)
+        old_seq = session.event_seq or 0
+        new_seq = old_seq + len(events)
+
+        for event_type, payload in events:
+            apply_event(state, event_type, payload)
+
+        # Снимок, если пересекли границу интервала
+        snapshot = None
+        if new_seq // self.snapshot_interval > old_seq // self.snapshot_interval:
+            snapshot = deepcopy(state)
+
+        append_game_events(db, session.id, events, snapshot, character_updates)
+        self._remember(session.id, new_seq, state)
+        return deepcopy(state)
+
+    def _remember(self, session_id: int, seq: int, state: Dict[str, Any]):
+        self._cache[session_id] = (seq, deepcopy(state))
+        self._cache.move_to_end(session_id)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+
+event_store = GameEventStore(snapshot_interval=settings.EVENT_SNAPSHOT_INTERVAL)
+track_cache("event_state", event_store)
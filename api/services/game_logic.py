@@ -4,6 +4,167 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# Базовые характеристики по классам
+CLASS_STATS = {
+    "warrior": {
+        "agility": 1,
+        "strength": 2,
+        "finesse": 0,
+        "instinct": 1,
+        "presence": 0,
+        "knowledge": 0,
+        "hit_points": 25,
+        "abilities": ["Combat Mastery", "Weapon Training"]
+    },
+    "ranger": {
+        "agility": 2,
+        "strength": 1,
+        "finesse": 1,
+        "instinct": 2,
+        "presence": 0,
+        "knowledge": 0,
+        "hit_points": 22,
+        "abilities": ["Nature's Bond", "Tracking"]
+    },
+    "guardian": {
+        "agility": 0,
+        "strength": 1,
+        "finesse": 0,
+        "instinct": 1,
+        "presence": 2,
+        "knowledge": 1,
+        "hit_points": 28,
+        "abilities": ["Divine Protection", "Healing Touch"]
+    },
+    "seraph": {
+        "agility": 1,
+        "strength": 0,
+        "finesse": 1,
+        "instinct": 0,
+        "presence": 2,
+        "knowledge": 1,
+        "hit_points": 20,
+        "abilities": ["Divine Magic", "Sacred Light"]
+    },
+    "sorcerer": {
+        "agility": 0,
+        "strength": 0,
+        "finesse": 1,
+        "instinct": 1,
+        "presence": 1,
+        "knowledge": 2,
+        "hit_points": 18,
+        "abilities": ["Arcane Power", "Spell Weaving"]
+    },
+    "wizard": {
+        "agility": 0,
+        "strength": 0,
+        "finesse": 1,
+        "instinct": 0,
+        "presence": 1,
+        "knowledge": 3,
+        "hit_points": 16,
+        "abilities": ["Arcane Studies", "Spell Preparation"]
+    }
+}
+
+# Модификаторы происхождения
+ANCESTRY_MODIFIERS = {
+    "human": {
+        "agility": 0,
+        "strength": 0,
+        "finesse": 0,
+        "instinct": 0,
+        "presence": 1,
+        "knowledge": 0,
+        "abilities": ["Adaptability"]
+    },
+    "elf": {
+        "agility": 1,
+        "strength": 0,
+        "finesse": 1,
+        "instinct": 0,
+        "presence": 0,
+        "knowledge": 0,
+        "abilities": ["Elven Grace"]
+    },
+    "dwarf": {
+        "agility": 0,
+        "strength": 1,
+        "finesse": 0,
+        "instinct": 0,
+        "presence": 0,
+        "knowledge": 1,
+        "abilities": ["Dwarven Resilience"]
+    },
+    "halfling": {
+        "agility": 1,
+        "strength": 0,
+        "finesse": 1,
+        "instinct": 1,
+        "presence": 0,
+        "knowledge": 0,
+        "abilities": ["Lucky"]
+    },
+    "orc": {
+        "agility": 0,
+        "strength": 2,
+        "finesse": 0,
+        "instinct": 1,
+        "presence": 0,
+        "knowledge": 0,
+        "abilities": ["Orcish Fury"]
+    }
+}
+
+# Названия для интерфейса
+CLASS_NAMES = {
+    "warrior": "Воин",
+    "ranger": "Рейнджер",
+    "guardian": "Страж",
+    "seraph": "Серафим",
+    "sorcerer": "Чародей",
+    "wizard": "Волшебник"
+}
+
+ANCESTRY_NAMES = {
+    "human": "Человек",
+    "elf": "Эльф",
+    "dwarf": "Дварф",
+    "halfling": "Полурослик",
+    "orc": "Орк"
+}
+
+# Характеристики, к которым применяются модификаторы происхождения
+TRAITS = ("agility", "strength", "finesse", "instinct", "presence", "knowledge")
+
+
+def initial_stats(character_class: str, ancestry: str) -> Dict[str, Any]:
+    """Начальные характеристики персонажа: класс плюс модификаторы происхождения.
+
+    Для неизвестного класса — пустой словарь (остаются значения по умолчанию).
+    """
+    if character_class not in CLASS_STATS:
+        return {}
+
+    stats = CLASS_STATS[character_class]
+    updates = {trait: stats[trait] for trait in TRAITS}
+    updates["hit_points"] = stats["hit_points"]
+    updates["current_hit_points"] = stats["hit_points"]
+    updates["abilities"] = list(stats["abilities"])
+
+    ancestry_stats = ANCESTRY_MODIFIERS.get(ancestry)
+    if ancestry_stats:
+        for trait in TRAITS:
+            if trait in ancestry_stats:
+                updates[trait] += ancestry_stats[trait]
+
+        # Добавляем способности происхождения
+        if "abilities" in ancestry_stats:
+            updates["abilities"].extend(ancestry_stats["abilities"])
+
+    return updates
+
 
 class DaggerheartGameLogic:
     """Класс для обработки игровой логики Daggerheart"""
@@ -17,6 +178,20 @@ class DaggerheartGameLogic:
             "extreme": 18
         }
 
+    def get_game_tables(self) -> Dict[str, Any]:
+        """Справочные таблицы игры для клиента"""
+        return {
+            "classes": [
+                {"id": class_id, "name": CLASS_NAMES.get(class_id, class_id), **stats}
+                for class_id, stats in CLASS_STATS.items()
+            ],
+            "ancestries": [
+                {"id": ancestry_id, "name": ANCESTRY_NAMES.get(ancestry_id, ancestry_id), **mods}
+                for ancestry_id, mods in ANCESTRY_MODIFIERS.items()
+            ],
+            "difficulty_levels": dict(self.difficulty_levels)
+        }
+
     def calculate_dice_result(self, hope_die: int, fear_die: int, difficulty: int = 12, modifier: int = 0) -> Dict[
         str, Any]:
         """Вычисление результата броска костей по правилам Daggerheart"""
@@ -102,9 +277,11 @@ class DaggerheartGameLogic:
         elif dice_result["dominant_die"] == "fear" and not dice_result["success"]:
             fear_change += 1
 
-        # Применяем изменения с учетом лимитов
-        new_hope = max(0, min(10, character.hope + hope_change))
-        new_fear = max(0, min(10, character.fear + fear_change))
+        # Применяем изменения с учетом лимитов (персонаж — модель или словарь хранилища)
+        hope, fear = (character["hope"], character["fear"]) if isinstance(character, dict) \
+            else (character.hope, character.fear)
+        new_hope = max(0, min(10, hope + hope_change))
+        new_fear = max(0, min(10, fear + fear_change))
 
         return {
             "hope": new_hope,
@@ -182,6 +359,46 @@ Fear персонажа изменился с {character['fear'] - (character['f
 
 Опиши, как это действие развивается, какие препятствия или возможности возникают.
 Если нужен бросок костей, намекни на это в повествовании.
+"""
+
+    def create_combat_round_prompt(self, context: Dict[str, Any]) -> str:
+        """Создание одного сводного промпта для целого раунда боя"""
+
+        summary = context["summary"]
+        party = context["party"]
+        adversaries = context["adversaries"]
+
+        party_lines = "\n".join(
+            f"- {member['name']}: {'попал' if member['hit'] else 'промахнулся'}"
+            f"{' (критический удар)' if member['critical'] else ''}, "
+            f"получил урона {member['damage_taken']}, здоровье {member['current_hit_points']}"
+            f"{', пал' if member['fallen'] else ''}"
+            for member in party
+        )
+        adversary_lines = "\n".join(
+            f"- {adversary['name']}: здоровье {adversary['current_hit_points']}/{adversary['hit_points']}"
+            for adversary in adversaries
+        )
+
+        if summary["finished"]:
+            outcome = "Бой окончен победой героев." if summary["victory"] else "Бой окончен поражением героев."
+        else:
+            outcome = "Бой продолжается."
+
+        return f"""
+Раунд {context.get('round', 1)} боя.
+
+Группа героев:
+{party_lines}
+
+Противники:
+{adversary_lines}
+
+Итог раунда: попаданий героев {summary['party_hits']}, нанесено урона {summary['damage_dealt']},
+повержено противников {summary['adversaries_defeated']}, получено урона {summary['damage_taken']}.
+{outcome}
+
+Опиши весь раунд одной сценой, не перечисляя каждый удар по отдельности.
 """
 
     def process_action(self, action: str, character: Any, session: Any) -> Dict[str, Any]:
@@ -272,12 +489,15 @@ Fear персонажа изменился с {character['fear'] - (character['f
 
         return total_damage
 
-    def check_death_saves(self, character: Any) -> Dict[str, Any]:
-        """Проверка спасбросков от смерти"""
+    def check_death_saves(self, character: Any, dice: Any = None) -> Dict[str, Any]:
+        """Проверка спасбросков от смерти (dice - пул бросков сессии)"""
 
         if character.current_hit_points <= 0:
-            hope_roll = random.randint(1, 12)
-            fear_roll = random.randint(1, 12)
+            if dice is not None:
+                hope_roll, fear_roll = (int(value) for value in dice.roll(12, 2))
+            else:
+                hope_roll = random.randint(1, 12)
+                fear_roll = random.randint(1, 12)
 
             # Успешный спасбросок если Hope больше Fear
             success = hope_roll > fear_roll
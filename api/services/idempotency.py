@@ -0,0 +1,146 @@
+import asyncio
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, NamedTuple, Optional
+from database.database import (
+    SessionLocal, get_idempotency_record, save_idempotency_record, delete_expired_idempotency_records,
+    claim_idempotency_key, release_idempotency_key
+)
+from api.services.metrics import track_cache
+from config.settings import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class StoredResponse(NamedTuple):
+    request_hash: str
+    status_code: int
+    content_type: str
+    body: bytes
+    expires: float
+
+
+class IdempotencyStore:
+    """Хранилище завершенных ответов по Idempotency-Key.
+
+    Горячие ключи лежат в LRU в памяти, все ключи — в таблице idempotency_keys,
+    чтобы повтор дошел до ответа и после перезапуска или в другом процессе.
+    Перед выполнением запроса ключ занимается в базе строкой без ответа: дубликат
+    в том же процессе ждет future первого запроса, в другом рабочем процессе —
+    опрашивает базу, пока ответ не будет сохранен или заявка не будет снята.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl: int = 86400, claim_timeout: float = 120.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.claim_timeout = claim_timeout
+        self._entries: "OrderedDict[str, StoredResponse]" = OrderedDict()
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._next_cleanup = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[StoredResponse]:
+        """Сохраненный ответ из памяти или базы данных"""
+        stored = self._entries.get(key)
+        if stored is not None:
+            if stored.expires >= time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return stored
+            del self._entries[key]
+
+        db = SessionLocal()
+        try:
+            record = get_idempotency_record(db, key)
+        finally:
+            db.close()
+
+        if record is None or record.created_at is None or record.status_code is None:
+            self.misses += 1
+            return None
+        # created_at хранится в UTC без часового пояса
+        expires = record.created_at.replace(tzinfo=timezone.utc).timestamp() + self.ttl
+        if expires < time.time():
+            self.misses += 1
+            return None
+        self.hits += 1
+
+        stored = StoredResponse(record.request_hash, record.status_code, record.content_type, record.body, expires)
+        self._remember(key, stored)
+        return stored
+
+    def in_flight(self, key: str) -> Optional[asyncio.Future]:
+        """Future выполняющегося запроса с этим ключом"""
+        return self._in_flight.get(key)
+
+    def claim(self, key: str, request_hash: str) -> bool:
+        """Занятие ключа в базе; False — запрос с этим ключом выполняется в другом процессе"""
+        db = SessionLocal()
+        try:
+            now = datetime.utcnow()
+            if not claim_idempotency_key(db, key, request_hash, now - timedelta(seconds=self.claim_timeout),
+                                         now - timedelta(seconds=self.ttl)):
+                return False
+        finally:
+            db.close()
+        self._in_flight[key] = asyncio.get_running_loop().create_future()
+        return True
+
+    def complete(self, key: str, request_hash: str, status_code: Optional[int] = None,
+                 content_type: str = "application/json", body: bytes = b""):
+        """Завершение запроса; без status_code заявка снимается и повтор выполнится заново"""
+        if status_code is not None:
+            stored = StoredResponse(request_hash, status_code, content_type, body, time.time() + self.ttl)
+            self._remember(key, stored)
+            self._persist(key, stored)
+        else:
+            self._release(key)
+
+        future = self._in_flight.pop(key, None)
+        if future is not None and not future.done():
+            future.set_result(None)
+
+    def _remember(self, key: str, stored: StoredResponse):
+        self._entries[key] = stored
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _persist(self, key: str, stored: StoredResponse):
+        db = SessionLocal()
+        try:
+            save_idempotency_record(db, {
+                "key": key,
+                "request_hash": stored.request_hash,
+                "status_code": stored.status_code,
+                "content_type": stored.content_type,
+                "body": stored.body
+            })
+
+            # Устаревшие ключи чистим не чаще раза в час
+            if time.time() >= self._next_cleanup:
+                self._next_cleanup = time.time() + min(self.ttl, 3600)
+                deleted = delete_expired_idempotency_records(db, datetime.utcnow() - timedelta(seconds=self.ttl))
+                if deleted:
+                    logger.info(f"Удалено устаревших ключей идемпотентности: {deleted}")
+        except Exception as e:
+            logger.error(f"Ошибка сохранения ответа по ключу идемпотентности: {e}")
+        finally:
+            db.close()
+
+    def _release(self, key: str):
+        db = SessionLocal()
+        try:
+            release_idempotency_key(db, key)
+        except Exception as e:
+            logger.error(f"Ошибка снятия заявки по ключу идемпотентности: {e}")
+        finally:
+            db.close()
+
+
+idempotency_store = IdempotencyStore(settings.IDEMPOTENCY_CACHE_SIZE, settings.IDEMPOTENCY_TTL,
+                                     settings.IDEMPOTENCY_CLAIM_TIMEOUT)
+track_cache("idempotency", idempotency_store)
@@ -0,0 +1,79 @@
+import asyncio
+import time
+from contextlib import contextmanager
+from typing import Dict, Set
+from api.services.metrics import registry
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Lifecycle:
+    """Состояние процесса API для проверки готовности и плавной остановки.
+
+    ready — запуск завершен и процесс принимает запросы (GET /ready),
+    draining — получен сигнал остановки: новые запросы не направляются,
+    фоновые ходы (WebSocket) дорабатывают до конца.
+    """
+
+    def __init__(self):
+        self.ready = False
+        self.draining = False
+        # Этап запуска -> длительность, сек (отчет в лог и метрика startup_phase_seconds)
+        self.phases: Dict[str, float] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    @property
+    def accepting(self) -> bool:
+        return self.ready and not self.draining
+
+    def record_phase(self, name: str, seconds: float):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, name: str):
+        """Замер этапа запуска"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_phase(name, time.perf_counter() - started)
+
+    def startup_report(self) -> str:
+        return ", ".join(f"{name} {seconds:.3f} с" for name, seconds in self.phases.items())
+
+    def track(self, task: asyncio.Task) -> asyncio.Task:
+        """Учет фоновой задачи, которую нужно дождаться при остановке"""
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def begin_drain(self):
+        if not self.draining:
+            self.draining = True
+            logger.info("Остановка: процесс больше не принимает новые ходы")
+
+    async def drain(self, timeout: float):
+        """Ожидание фоновых задач (ходы с запросами к DeepSeek) не дольше timeout"""
+        self.begin_drain()
+        if not self._tasks:
+            return
+
+        started = time.monotonic()
+        logger.info(f"Ожидание незавершенных ходов: {len(self._tasks)}")
+        done, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+        if pending:
+            logger.warning(f"Не дождались завершения ходов: {len(pending)}, отменяем")
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        else:
+            logger.info(f"Незавершенные ходы выполнены за {time.monotonic() - started:.1f} с")
+
+
+lifecycle = Lifecycle()
+
+registry.callback(
+    "startup_phase_seconds", "Длительность этапов запуска процесса", "gauge", ("phase",),
+    lambda: (((name,), seconds) for name, seconds in list(lifecycle.phases.items()))
+)
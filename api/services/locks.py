@@ -0,0 +1,34 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import List
+from api.services.metrics import record_stage
+from config.settings import settings
+
+
+class UserLocks:
+    """Таблица асинхронных блокировок, разбитая на шарды по user_id.
+
+    Ходы одного пользователя выполняются по очереди, разные пользователи
+    почти никогда не ждут друг друга (только при совпадении шарда).
+    Блокировки действуют внутри процесса; между процессами порядок
+    обеспечивает версия строки в базе данных.
+    """
+
+    def __init__(self, shards: int = 256):
+        self._locks: List[asyncio.Lock] = [asyncio.Lock() for _ in range(shards)]
+
+    def lock_for(self, user_id: int) -> asyncio.Lock:
+        return self._locks[hash(user_id) % len(self._locks)]
+
+    @asynccontextmanager
+    async def hold(self, user_id: int):
+        """Выполнение блока под блокировкой пользователя (ожидание учитывается как этап lock_wait)"""
+        lock = self.lock_for(user_id)
+        started = time.perf_counter()
+        async with lock:
+            record_stage("lock_wait", time.perf_counter() - started)
+            yield
+
+
+user_locks = UserLocks(settings.USER_LOCK_SHARDS)
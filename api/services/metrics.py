@@ -0,0 +1,357 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+from api.services.workers import pid_alive, read_json, state_dir, write_json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм задержек, сек
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    """Монотонный счетчик с метками"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def values(self) -> Iterable[Tuple[Sequence[str], float]]:
+        return list(self._values.items())
+
+
+class Histogram:
+    """Гистограмма: счетчики по корзинам, сумма и количество наблюдений"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # метки -> [счетчики корзин (последняя = +Inf), сумма]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labels: str):
+        entry = self._values.get(labels)
+        if entry is None:
+            entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    def count(self, *labels: str) -> int:
+        entry = self._values.get(labels)
+        return sum(entry[0]) if entry else 0
+
+    def values(self) -> Iterable[Tuple[Sequence[str], list]]:
+        """(метки, [счетчики корзин, сумма])"""
+        return [(labels, [list(counts), total]) for labels, (counts, total) in list(self._values.items())]
+
+
+class CallbackMetric:
+    """Метрика, значения которой вычисляются в момент выгрузки (счетчики кэшей и т.п.)"""
+
+    def __init__(self, name: str, documentation: str, kind: str, labelnames: Sequence[str],
+                 collect: Callable[[], Iterable[Tuple[Sequence[str], float]]]):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+
+    def values(self) -> Iterable[Tuple[Sequence[str], float]]:
+        return list(self.collect())
+
+
+class MetricsRegistry:
+    """Реестр метрик процесса с выгрузкой в текстовом формате Prometheus.
+
+    Запись метрики — поиск в dict и сложение, без блокировок: все обработчики
+    выполняются в одном event loop.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, name: str, documentation: str, kind: str, labelnames: Sequence[str],
+                 collect: Callable[[], Iterable[Tuple[Sequence[str], float]]]) -> CallbackMetric:
+        return self._register(CallbackMetric(name, documentation, kind, labelnames, collect))
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Текущие значения всех метрик (JSON-совместимые, для объединения рабочих процессов)"""
+        data = {}
+        for metric in self._metrics.values():
+            try:
+                values = [[[str(label) for label in labels], value] for labels, value in metric.values()]
+            except Exception as e:
+                logger.error(f"Ошибка сбора метрики {metric.name}: {e}")
+                continue
+            data[metric.name] = {
+                "kind": metric.kind,
+                "help": metric.documentation,
+                "labelnames": list(metric.labelnames),
+                "buckets": list(getattr(metric, "buckets", ())),
+                "values": values
+            }
+        return data
+
+    def render(self) -> str:
+        return render_snapshot(self.snapshot())
+
+
+def render_snapshot(snapshot: Dict[str, Dict[str, Any]]) -> str:
+    """Текстовый формат Prometheus из снимка метрик"""
+    lines: List[str] = []
+    for name, metric in snapshot.items():
+        labelnames = metric["labelnames"]
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['kind']}")
+        if metric["kind"] != "histogram":
+            for labels, value in metric["values"]:
+                lines.append(f"{name}{_format_labels(labelnames, labels)} {_format_value(value)}")
+            continue
+
+        bounds = list(metric["buckets"]) + [float("inf")]
+        for labels, (counts, total) in metric["values"]:
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{name}_bucket{_format_labels(labelnames, labels, le)} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labelnames, labels)} {_format_value(total)}")
+            lines.append(f"{name}_count{_format_labels(labelnames, labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+def merge_snapshots(snapshots: Iterable[Tuple[int, bool, Dict[str, Dict[str, Any]]]]) -> Dict[str, Dict[str, Any]]:
+    """Объединение снимков рабочих процессов: (pid, процесс жив, снимок).
+
+    Счетчики и гистограммы складываются, включая завершившиеся процессы: иначе
+    после перезапуска процесса сумма уменьшилась бы, и Prometheus счел бы это
+    сбросом. Gauge нельзя складывать (доли, глубины очередей процесса): они
+    выгружаются для живых процессов с меткой worker.
+    """
+    merged: Dict[str, Dict[str, Any]] = {}
+    for pid, alive, snapshot in snapshots:
+        for name, metric in snapshot.items():
+            gauge = metric["kind"] == "gauge"
+            if gauge and not alive:
+                continue
+            target = merged.get(name)
+            if target is None:
+                target = merged[name] = {**metric, "values": {}}
+                if gauge:
+                    target["labelnames"] = list(metric["labelnames"]) + ["worker"]
+            values = target["values"]
+            for labels, value in metric["values"]:
+                key = tuple(labels) + ((str(pid),) if gauge else ())
+                current = values.get(key)
+                if current is None:
+                    values[key] = value
+                elif metric["kind"] == "histogram":
+                    values[key] = [[a + b for a, b in zip(current[0], value[0])], current[1] + value[1]]
+                else:
+                    values[key] = current + value
+
+    for metric in merged.values():
+        metric["values"] = [[list(labels), value] for labels, value in metric["values"].items()]
+    return merged
+
+
+class WorkerMetrics:
+    """Метрики всех рабочих процессов run.py.
+
+    Каждый процесс периодически (и при каждом /metrics) записывает снимок своих
+    метрик в <каталог>/<pid>.json; /metrics в любом процессе объединяет файлы
+    (см. merge_snapshots). Значения других процессов отстают не больше чем на
+    интервал записи, а счетчики не уменьшаются: процесс записывает файл до того,
+    как отдать значения из него.
+    """
+
+    def __init__(self, registry: "MetricsRegistry", directory: str):
+        self.registry = registry
+        self.directory = directory
+
+    def flush(self) -> Dict[str, Dict[str, Any]]:
+        snapshot = self.registry.snapshot()
+        write_json(os.path.join(self.directory, f"{os.getpid()}.json"), snapshot)
+        return snapshot
+
+    def render(self) -> str:
+        snapshots = [(os.getpid(), True, self.flush())]
+        for filename in sorted(os.listdir(self.directory)):
+            name, extension = os.path.splitext(filename)
+            if extension != ".json" or not name.isdigit() or int(name) == os.getpid():
+                continue
+            snapshot = read_json(os.path.join(self.directory, filename))
+            if snapshot is not None:
+                snapshots.append((int(name), pid_alive(int(name)), snapshot))
+        return render_snapshot(merge_snapshots(snapshots))
+
+
+registry = MetricsRegistry()
+# В run.py метрики рабочих процессов объединяются через общий каталог
+_metrics_dir = state_dir("metrics")
+worker_metrics = WorkerMetrics(registry, _metrics_dir) if _metrics_dir else None
+
+http_requests = registry.counter(
+    "http_requests_total", "Число HTTP-запросов", ("method", "route", "status")
+)
+http_request_duration = registry.histogram(
+    "http_request_duration_seconds", "Время обработки HTTP-запроса", ("method", "route")
+)
+stage_duration = registry.histogram(
+    "turn_stage_duration_seconds", "Время этапов обработки хода", ("stage",)
+)
+deepseek_requests = registry.counter(
+    "deepseek_requests_total", "Запросы к DeepSeek по исходу (ok / fallback)", ("outcome",)
+)
+deepseek_tokens = registry.counter(
+    "deepseek_tokens_total", "Токены DeepSeek из поля usage", ("kind",)
+)
+
+
+class RequestTimings:
+    """Время этапов одного запроса (для Server-Timing и расчета сериализации).
+
+    Если запрос трассируется, дополнительно хранятся отдельные спаны:
+    (этап, начало от старта запроса, длительность).
+    """
+
+    __slots__ = ("stages", "endpoint_finished", "trace_id", "spans", "started")
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+        self.endpoint_finished: Optional[float] = None
+        self.trace_id: Optional[str] = None
+        self.spans: Optional[List[Tuple[str, float, float]]] = None
+        self.started = time.perf_counter()
+
+    def start_trace(self):
+        self.spans = []
+
+    def add(self, stage: str, seconds: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+        if self.spans is not None:
+            self.spans.append((stage, time.perf_counter() - seconds - self.started, seconds))
+
+
+current_timings: ContextVar[Optional[RequestTimings]] = ContextVar("current_timings", default=None)
+
+
+def record_stage(stage: str, seconds: float):
+    """Учет времени этапа в гистограмме и в таймингах текущего запроса"""
+    stage_duration.observe(seconds, stage)
+    timings = current_timings.get()
+    if timings is not None:
+        timings.add(stage, seconds)
+
+
+@contextmanager
+def observe_stage(stage: str):
+    """Замер времени блока кода как этапа хода"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - started)
+
+
+# Кэши, для которых выгружаются попадания и промахи (объекты с атрибутами hits и misses)
+_tracked_caches: Dict[str, object] = {}
+
+
+def track_cache(name: str, cache: object):
+    _tracked_caches[name] = cache
+
+
+def _collect_cache_lookups():
+    for name, cache in list(_tracked_caches.items()):
+        yield (name, "hit"), cache.hits
+        yield (name, "miss"), cache.misses
+
+
+def _collect_cache_ratios():
+    for name, cache in list(_tracked_caches.items()):
+        total = cache.hits + cache.misses
+        yield (name,), cache.hits / total if total else 0.0
+
+
+registry.callback("cache_lookups_total", "Обращения к кэшам", "counter", ("cache", "result"), _collect_cache_lookups)
+registry.callback("cache_hit_ratio", "Доля попаданий в кэш", "gauge", ("cache",), _collect_cache_ratios)
+
+
+def instrument_engine(engine, session_factory):
+    """Замер SQL-запросов (db_read / db_write) и commit через события SQLAlchemy"""
+    from sqlalchemy import event
+
+    local = threading.local()
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _statement_started(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("statement_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _statement_finished(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["statement_started"].pop()
+        stage = "db_read" if statement.lstrip()[:6].upper() == "SELECT" else "db_write"
+        record_stage(stage, time.perf_counter() - started)
+
+    # Событие commit движка срабатывает перед COMMIT, after_commit сессии — после него
+    @event.listens_for(engine, "commit")
+    def _commit_started(conn):
+        local.commit_started = time.perf_counter()
+
+    @event.listens_for(session_factory, "after_commit")
+    def _commit_finished(db):
+        started = getattr(local, "commit_started", None)
+        if started is not None:
+            local.commit_started = None
+            record_stage("db_write", time.perf_counter() - started)
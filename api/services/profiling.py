@@ -0,0 +1,506 @@
+import cProfile
+import io
+import os
+import pstats
+import re
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Any, Dict, Optional, Tuple
+from api.services.workers import pid_alive, read_json, state_dir, write_json
+from config.settings import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Сколько различных стеков хранить; остальные сэмплы учитываются как [other]
+MAX_STACKS = 10000
+MAX_DEPTH = 64
+STDLIB_DIR = os.path.dirname(os.__file__) + os.sep
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    filename = code.co_filename
+    # Короткий путь: файлы проекта относительно корня, библиотеки — по имени пакета
+    for marker in ("site-packages" + os.sep, os.getcwd() + os.sep, STDLIB_DIR):
+        index = filename.find(marker)
+        if index >= 0:
+            filename = filename[index + len(marker):]
+            break
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Статистический профилировщик: периодически снимает стек потока event loop.
+
+    Результат — свернутые стеки (collapsed stacks) для flamegraph.pl / speedscope.
+    Поток-сэмплер не останавливает обработку запросов, накладные расходы
+    определяются частотой опроса.
+    """
+
+    def __init__(self, thread_id: int, interval: float, should_sample=None):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.should_sample = should_sample
+        self.samples = 0
+        self.started_at = time.time()
+        self._stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if self.should_sample is not None and not self.should_sample():
+                continue
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+
+            stack = []
+            while frame is not None and len(stack) < MAX_DEPTH:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            key = ";".join(reversed(stack))
+
+            with self._lock:
+                if key not in self._stacks and len(self._stacks) >= MAX_STACKS:
+                    key = "[other]"
+                self._stacks[key] += 1
+                self.samples += 1
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(timeout=1.0)
+
+    def stacks(self) -> Counter:
+        """Копия счетчиков стеков"""
+        with self._lock:
+            return Counter(self._stacks)
+
+    def collapsed(self, reset: bool = False) -> str:
+        """Строки "кадр;кадр;кадр <число сэмплов>" """
+        with self._lock:
+            stacks = Counter(self._stacks)
+            if reset:
+                self._stacks.clear()
+                self.samples = 0
+                self.started_at = time.time()
+        return _format_collapsed(stacks)
+
+
+class ProfileCapture:
+    """Профилирование следующих N запросов (при необходимости только к одному маршруту).
+
+    cProfile работает на поток, а не на задачу: пока выбранные запросы
+    выполняются, в профиль попадают и параллельные запросы этого процесса.
+    """
+
+    def __init__(self, mode: str, requests: int, route: Optional[str], thread_id: int, sample_interval: float):
+        self.mode = mode
+        self.requests = requests
+        self.route = route
+        self.route_pattern = _route_regex(route) if route else None
+        self.claimed = 0
+        self.completed = 0
+        self.active = 0
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.profile: Optional[cProfile.Profile] = None
+        self.sampler: Optional[StackSampler] = None
+
+        if mode == "cprofile":
+            self.profile = cProfile.Profile()
+        else:
+            self.sampler = StackSampler(thread_id, sample_interval, should_sample=lambda: self.active > 0)
+
+    @property
+    def finished(self) -> bool:
+        return self.finished_at is not None
+
+    def claim(self, path: str) -> bool:
+        """Берем запрос в профиль, если он подходит и лимит не исчерпан"""
+        if self.finished or self.claimed >= self.requests:
+            return False
+        if self.route_pattern is not None and not self.route_pattern.match(path):
+            return False
+        self.claimed += 1
+        return True
+
+    def enter(self):
+        self.active += 1
+        if self.profile is not None and self.active == 1:
+            self.profile.enable()
+
+    def exit(self):
+        self.active -= 1
+        self.completed += 1
+        if self.profile is not None and self.active == 0:
+            self.profile.disable()
+        if self.completed >= self.requests:
+            self.finish()
+
+    def finish(self):
+        if self.finished:
+            return
+        if self.profile is not None and self.active > 0:
+            self.profile.disable()
+        if self.sampler is not None:
+            self.sampler.stop()
+        self.finished_at = time.time()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "route": self.route,
+            "requests": self.requests,
+            "completed": self.completed,
+            "in_progress": self.active,
+            "finished": self.finished,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "samples": self.sampler.samples if self.sampler else None
+        }
+
+
+class Profiler:
+    """Профилирование работающего процесса по запросу администратора.
+
+    С каталогом (run.py с несколькими рабочими процессами) команды действуют на
+    все процессы: процесс, принявший команду, записывает ее в каталог, остальные
+    подхватывают ее в sync() не позже чем через WORKER_SYNC_INTERVAL. Каждый
+    процесс профилирует свои N запросов и по завершении записывает результат в
+    каталог; результат — объединение профилей всех процессов.
+    """
+
+    FORMATS = {
+        "cprofile": ("pstats", "text"),
+        "sample": ("collapsed",),
+    }
+
+    def __init__(self, sample_interval: float = 0.005, continuous_interval: float = 0.1,
+                 directory: Optional[str] = None):
+        self.sample_interval = sample_interval
+        self.continuous_interval = continuous_interval
+        self.directory = directory
+        self.capture: Optional[ProfileCapture] = None
+        self.continuous: Optional[StackSampler] = None
+        # Профилирование и эпоха постоянного сэмплирования из каталога, которые применены в процессе
+        self.capture_id: Optional[str] = None
+        self.continuous_epoch = 0
+        self._dumped = False
+
+    # Профилирование N запросов
+
+    def start_capture(self, mode: str, requests: int, route: Optional[str] = None) -> Dict[str, Any]:
+        if self.directory is None:
+            if self.capture is not None and not self.capture.finished:
+                raise RuntimeError("Профилирование уже идет")
+            self._start_local(mode, requests, route)
+            return self.capture_status()
+
+        control = self._read("capture.json")
+        if control is not None and not control["stopped"] and not self._all_dumped(control["id"]):
+            raise RuntimeError("Профилирование уже идет")
+        control = {"id": uuid.uuid4().hex[:12], "mode": mode, "requests": requests, "route": route,
+                   "started_at": time.time(), "stopped": False}
+        self._write("capture.json", control)
+        self._start_local(mode, requests, route, control["id"])
+        self._sync_capture(control)
+        return self.capture_status()
+
+    def stop_capture(self):
+        if self.directory is not None:
+            control = self._read("capture.json")
+            if control is not None and not control["stopped"]:
+                control["stopped"] = True
+                self._write("capture.json", control)
+                self._sync_capture(control)
+            return
+        if self.capture is not None:
+            self.capture.finish()
+
+    def capture_status(self) -> Optional[Dict[str, Any]]:
+        if self.directory is None:
+            return self.capture.status() if self.capture else None
+
+        control = self._read("capture.json")
+        if control is None:
+            return None
+        workers = self._worker_statuses(control["id"])
+        return {
+            "id": control["id"],
+            "mode": control["mode"],
+            "route": control["route"],
+            "requests": control["requests"],
+            "completed": sum(status["completed"] for status in workers.values()),
+            "in_progress": sum(status["in_progress"] for status in workers.values()),
+            "finished": self._all_dumped(control["id"], workers),
+            "stopped": control["stopped"],
+            "started_at": control["started_at"],
+            "workers": workers
+        }
+
+    def capture_result(self, fmt: str) -> Tuple[bytes, str, str]:
+        """(содержимое, media type, имя файла) результата завершенного профилирования"""
+        if self.directory is None:
+            capture = self.capture
+            if capture is None or not capture.finished:
+                raise RuntimeError("Нет завершенного профилирования")
+            self._check_format(capture.mode, fmt)
+            if capture.completed == 0:
+                raise RuntimeError("Ни один запрос не попал в профиль")
+            if capture.mode == "sample":
+                return self._render(fmt, stacks=capture.sampler.stacks())
+            return self._render(fmt, stats=pstats.Stats(capture.profile))
+
+        control = self._read("capture.json")
+        if control is None:
+            raise RuntimeError("Нет завершенного профилирования")
+        self._check_format(control["mode"], fmt)
+        workers = self._worker_statuses(control["id"])
+        if not self._all_dumped(control["id"], workers):
+            raise RuntimeError("Профилирование еще идет: результат будет готов, когда все процессы "
+                               "обработают свои запросы (или после /profiler/stop)")
+
+        dumps = [self._path(f"capture.{control['id']}.{pid}.{control['mode']}")
+                 for pid, status in workers.items() if status["completed"]]
+        if not dumps:
+            raise RuntimeError("Ни один запрос не попал в профиль")
+        if control["mode"] == "sample":
+            stacks: Counter = Counter()
+            for path in dumps:
+                stacks.update(_read_collapsed(path))
+            return self._render(fmt, stacks=stacks)
+        stats = pstats.Stats(dumps[0])
+        for path in dumps[1:]:
+            stats.add(path)
+        return self._render(fmt, stats=stats)
+
+    def _start_local(self, mode: str, requests: int, route: Optional[str], capture_id: Optional[str] = None):
+        if self.capture is not None:
+            self.capture.finish()
+        self.capture = ProfileCapture(mode, requests, route, self._thread_id(), self.sample_interval)
+        self.capture_id = capture_id
+        self._dumped = False
+        logger.info(f"Профилирование {mode}: {requests} запросов, маршрут {route or 'любой'}")
+
+    @staticmethod
+    def _check_format(mode: str, fmt: str):
+        if fmt not in Profiler.FORMATS[mode]:
+            raise ValueError(f"Для режима {mode} доступны форматы: {', '.join(Profiler.FORMATS[mode])}")
+
+    @staticmethod
+    def _render(fmt: str, stats: Optional[pstats.Stats] = None, stacks: Optional[Counter] = None) -> Tuple[bytes, str, str]:
+        if fmt == "collapsed":
+            return _format_collapsed(stacks).encode(), "text/plain", "profile.collapsed"
+
+        if fmt == "text":
+            output = io.StringIO()
+            stats.stream = output
+            stats.sort_stats("cumulative").print_stats(60)
+            return output.getvalue().encode(), "text/plain", "profile.txt"
+
+        # pstats: бинарный формат для snakeviz / python -m pstats
+        with tempfile.NamedTemporaryFile(suffix=".pstats", delete=False) as output:
+            path = output.name
+        try:
+            stats.dump_stats(path)
+            with open(path, "rb") as dumped:
+                return dumped.read(), "application/octet-stream", "profile.pstats"
+        finally:
+            os.unlink(path)
+
+    # Постоянное сэмплирование
+
+    def enable_continuous(self, interval: Optional[float] = None):
+        """Постоянное сэмплирование с низкой частотой"""
+        interval = interval or self.continuous_interval
+        if self.directory is not None:
+            control = self._read("continuous.json") or {"epoch": 0}
+            control = {"enabled": True, "interval": interval, "epoch": control["epoch"] + 1, "since": time.time()}
+            self._write("continuous.json", control)
+            self._sync_continuous(control)
+            return
+        self.disable_continuous()
+        self.continuous = StackSampler(self._thread_id(), interval)
+
+    def disable_continuous(self):
+        if self.directory is not None:
+            control = self._read("continuous.json")
+            if control is not None and control["enabled"]:
+                control["enabled"] = False
+                self._write("continuous.json", control)
+                self._sync_continuous(control)
+            return
+        self._stop_continuous()
+
+    def continuous_status(self) -> Optional[Dict[str, Any]]:
+        if self.directory is None:
+            if self.continuous is None:
+                return None
+            return {"interval": self.continuous.interval, "samples": self.continuous.samples,
+                    "since": self.continuous.started_at}
+
+        control = self._read("continuous.json")
+        if control is None or not control["enabled"]:
+            return None
+        self._sync_continuous(control)
+        workers = self._continuous_dumps(control["epoch"])
+        return {"interval": control["interval"], "samples": sum(dump["samples"] for dump in workers.values()),
+                "since": control["since"], "workers": {pid: dump["samples"] for pid, dump in workers.items()}}
+
+    def continuous_result(self, reset: bool = False) -> Optional[str]:
+        """Свернутые стеки постоянного сэмплирования (всех процессов); None — сэмплирование выключено"""
+        if self.directory is None:
+            if self.continuous is None:
+                return None
+            return self.continuous.collapsed(reset=reset)
+
+        control = self._read("continuous.json")
+        if control is None or not control["enabled"]:
+            return None
+        self._sync_continuous(control)
+        stacks: Counter = Counter()
+        for dump in self._continuous_dumps(control["epoch"]).values():
+            stacks.update(dump["stacks"])
+        if reset:
+            # Процессы начинают новую эпоху при следующей синхронизации
+            control = {**control, "epoch": control["epoch"] + 1, "since": time.time()}
+            self._write("continuous.json", control)
+            self._sync_continuous(control)
+        return _format_collapsed(stacks)
+
+    def _stop_continuous(self):
+        if self.continuous is not None:
+            self.continuous.stop()
+            self.continuous = None
+
+    # Синхронизация с каталогом
+
+    def sync(self):
+        """Применение команд из каталога и запись состояния процесса (вызывается периодически)"""
+        if self.directory is None:
+            return
+        control = self._read("capture.json")
+        if control is not None:
+            self._sync_capture(control)
+        control = self._read("continuous.json")
+        if control is not None:
+            self._sync_continuous(control)
+
+    def _sync_capture(self, control: Dict[str, Any]):
+        if control["id"] != self.capture_id:
+            if control["stopped"]:
+                return
+            # Процесс, запущенный после начала профилирования, тоже участвует
+            self._start_local(control["mode"], control["requests"], control["route"], control["id"])
+
+        capture = self.capture
+        if control["stopped"]:
+            capture.finish()
+        prefix = f"capture.{control['id']}.{os.getpid()}"
+        if capture.finished and not self._dumped:
+            if capture.completed:
+                if capture.mode == "sample":
+                    with open(self._path(f"{prefix}.sample"), "w", encoding="utf-8") as output:
+                        output.write(_format_collapsed(capture.sampler.stacks()))
+                else:
+                    pstats.Stats(capture.profile).dump_stats(self._path(f"{prefix}.cprofile"))
+            self._dumped = True
+        self._write(f"{prefix}.json", {**capture.status(), "dumped": self._dumped})
+
+    def _sync_continuous(self, control: Dict[str, Any]):
+        if not control["enabled"]:
+            self._stop_continuous()
+            self._remove(f"continuous.{os.getpid()}.json")
+            return
+        if self.continuous is None or self.continuous_epoch != control["epoch"] \
+                or self.continuous.interval != control["interval"]:
+            self._stop_continuous()
+            self.continuous = StackSampler(self._thread_id(), control["interval"])
+            self.continuous_epoch = control["epoch"]
+        self._write(f"continuous.{os.getpid()}.json", {
+            "epoch": self.continuous_epoch,
+            "samples": self.continuous.samples,
+            "stacks": dict(self.continuous.stacks())
+        })
+
+    def _worker_statuses(self, capture_id: str) -> Dict[str, Dict[str, Any]]:
+        """pid -> состояние профилирования в процессе (завершившиеся процессы без результата не учитываются)"""
+        statuses = {}
+        prefix = f"capture.{capture_id}."
+        for name in os.listdir(self.directory):
+            if not (name.startswith(prefix) and name.endswith(".json")):
+                continue
+            pid = name[len(prefix):-len(".json")]
+            status = self._read(name)
+            if status is not None and pid.isdigit() and (status["dumped"] or pid_alive(int(pid))):
+                statuses[pid] = status
+        return statuses
+
+    def _all_dumped(self, capture_id: str, statuses: Optional[Dict[str, Dict[str, Any]]] = None) -> bool:
+        statuses = self._worker_statuses(capture_id) if statuses is None else statuses
+        return bool(statuses) and all(status["dumped"] for status in statuses.values())
+
+    def _continuous_dumps(self, epoch: int) -> Dict[str, Dict[str, Any]]:
+        dumps = {}
+        for name in os.listdir(self.directory):
+            parts = name.split(".")
+            if len(parts) == 3 and parts[0] == "continuous" and parts[1].isdigit() and parts[2] == "json":
+                dump = self._read(name)
+                if dump is not None and dump["epoch"] == epoch and pid_alive(int(parts[1])):
+                    dumps[parts[1]] = dump
+        return dumps
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _read(self, name: str) -> Optional[Any]:
+        return read_json(self._path(name))
+
+    def _write(self, name: str, data: Any):
+        write_json(self._path(name), data)
+
+    def _remove(self, name: str):
+        try:
+            os.unlink(self._path(name))
+        except FileNotFoundError:
+            pass
+
+    def _thread_id(self) -> int:
+        # Вызывается из async-обработчиков и sync(), то есть в потоке event loop
+        return threading.get_ident()
+
+
+def _format_collapsed(stacks: Counter) -> str:
+    """Строки "кадр;кадр;кадр <число сэмплов>" """
+    return "\n".join(f"{stack} {count}" for stack, count in stacks.most_common()) + "\n"
+
+
+def _read_collapsed(path: str) -> Counter:
+    stacks: Counter = Counter()
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            stack, _, count = line.rstrip("\n").rpartition(" ")
+            if stack:
+                stacks[stack] += int(count)
+    return stacks
+
+
+def _route_regex(route: str):
+    """Шаблон маршрута (/api/game/session/{user_id}) -> регулярное выражение"""
+    parts = re.split(r"\{[^/}]+\}", route)
+    return re.compile("^" + "[^/]+".join(re.escape(part) for part in parts) + "$")
+
+
+profiler = Profiler(
+    sample_interval=settings.PROFILER_SAMPLE_INTERVAL,
+    continuous_interval=settings.PROFILER_CONTINUOUS_INTERVAL,
+    directory=state_dir("profiler")
+)
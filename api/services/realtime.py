@@ -0,0 +1,152 @@
+import asyncio
+import time
+from collections import deque
+from typing import Dict, Any, Optional, List
+from fastapi import WebSocket
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class GameChannel:
+    """Канал сообщений игрока поверх WebSocket.
+
+    Каждое сообщение сервера получает порядковый номер seq; последние сообщения
+    хранятся в буфере, чтобы после переподключения клиент мог дочитать
+    пропущенное (resume). Отправка идет через ограниченную очередь: если клиент
+    не успевает читать, фрагменты повествования склеиваются, а когда очередь
+    заполнена, соединение закрывается — клиент переподключается с last_seq и
+    дочитывает пропущенное из буфера. Ход игрока никогда не ждет клиента.
+    """
+
+    def __init__(self, user_id: int, replay_size: int = 200, queue_size: int = 64):
+        self.user_id = user_id
+        self.seq = 0
+        self.busy = False  # Выполняется ход игрока
+        self.last_seen = time.monotonic()
+        self._replay: deque = deque(maxlen=replay_size)
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._pending_delta: List[str] = []
+        self._websocket: Optional[WebSocket] = None
+        self._sender: Optional[asyncio.Task] = None
+
+    @property
+    def connected(self) -> bool:
+        return self._websocket is not None
+
+    def attach(self, websocket: WebSocket, last_seq: Optional[int]) -> bool:
+        """Подключение сокета; False, если пропущенные сообщения уже вытеснены из буфера"""
+        self.detach()
+        self.last_seen = time.monotonic()
+
+        backlog = []
+        resumed = True
+        if last_seq is not None:
+            oldest = self._replay[0]["seq"] if self._replay else self.seq + 1
+            if last_seq < oldest - 1:
+                resumed = False
+            else:
+                backlog = [message for message in self._replay if message["seq"] > last_seq]
+
+        self._websocket = websocket
+        self._queue = asyncio.Queue(maxsize=self._queue.maxsize)
+        self._sender = asyncio.create_task(self._send_loop(websocket, backlog))
+        return resumed
+
+    def detach(self, websocket: Optional[WebSocket] = None):
+        """Отключение сокета; с websocket — только если подключен именно он"""
+        if websocket is not None and websocket is not self._websocket:
+            return
+        if self._sender:
+            self._sender.cancel()
+        self._sender = None
+        self._websocket = None
+        self.last_seen = time.monotonic()
+
+    async def send(self, message_type: str, data: Dict[str, Any]):
+        """Нумерованное сообщение: сохраняется для resume и ставится в очередь отправки"""
+        await self._flush_delta()
+        await self._enqueue(message_type, data)
+
+    async def send_delta(self, text: str):
+        """Фрагмент повествования; при переполненной очереди склеивается со следующими"""
+        self._pending_delta.append(text)
+        if self._queue.qsize() < self._queue.maxsize // 2:
+            await self._flush_delta()
+
+    async def send_control(self, message_type: str, data: Optional[Dict[str, Any]] = None):
+        """Служебное сообщение без номера (ping/pong/ошибки протокола)"""
+        if self._websocket is not None:
+            await self._websocket.send_json({"type": message_type, "data": data or {}})
+
+    async def _flush_delta(self):
+        if self._pending_delta:
+            text = "".join(self._pending_delta)
+            self._pending_delta = []
+            await self._enqueue("narrative_delta", {"text": text})
+
+    async def _enqueue(self, message_type: str, data: Dict[str, Any]):
+        self.seq += 1
+        message = {"seq": self.seq, "type": message_type, "data": data}
+        self._replay.append(message)
+        if self._websocket is None:
+            return
+        try:
+            self._queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # Клиент не читает (или уже отключился): сообщение есть в буфере resume
+            logger.info(f"Очередь канала пользователя {self.user_id} переполнена, закрываем соединение")
+            websocket = self._websocket
+            self.detach()
+            asyncio.create_task(self._close(websocket))
+
+    async def _close(self, websocket: WebSocket):
+        try:
+            await websocket.close(code=1013)
+        except Exception as e:
+            logger.info(f"Закрытие канала пользователя {self.user_id}: {e}")
+
+    async def _send_loop(self, websocket: WebSocket, backlog: List[Dict[str, Any]]):
+        try:
+            for message in backlog:
+                await websocket.send_json(message)
+            while True:
+                message = await self._queue.get()
+                await websocket.send_json(message)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.info(f"Отправка в канал пользователя {self.user_id} прервана: {e}")
+
+
+class ChannelManager:
+    """Реестр каналов игроков; позволяет серверу отправлять сообщения по своей инициативе"""
+
+    def __init__(self, replay_size: int = 200, queue_size: int = 64, resume_window: float = 300.0):
+        self.replay_size = replay_size
+        self.queue_size = queue_size
+        self.resume_window = resume_window
+        self._channels: Dict[int, GameChannel] = {}
+
+    def get(self, user_id: int) -> GameChannel:
+        self._forget_idle()
+        channel = self._channels.get(user_id)
+        if channel is None:
+            channel = GameChannel(user_id, self.replay_size, self.queue_size)
+            self._channels[user_id] = channel
+        return channel
+
+    async def push(self, user_id: int, message_type: str, data: Dict[str, Any]) -> bool:
+        """Отправка сообщения игроку; сохраняется для resume, даже если он не подключен"""
+        channel = self._channels.get(user_id)
+        if channel is None:
+            return False
+        await channel.send(message_type, data)
+        return channel.connected
+
+    def _forget_idle(self):
+        """Удаление каналов, отключенных дольше окна переподключения"""
+        deadline = time.monotonic() - self.resume_window
+        for user_id in [user_id for user_id, channel in self._channels.items()
+                        if not channel.connected and not channel.busy and channel.last_seen < deadline]:
+            del self._channels[user_id]
@@ -0,0 +1,33 @@
+"""
+Игровые сессии: общие операции для маршрутов API и обработчиков бота.
+"""
+
+from typing import Any, Dict, Optional, Tuple
+from database.database import get_active_game_session, update_game_session
+from api.services.event_store import event_store
+from api.services.locks import user_locks
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def load_active_session(db, user_id: int) -> Tuple[Optional[Any], Optional[Dict[str, Any]]]:
+    """Активная сессия пользователя и ее текущее состояние из журнала событий"""
+    session = get_active_game_session(db, user_id)
+    if session is None:
+        return None, None
+    return session, event_store.load_state(db, session)
+
+
+async def end_session(db, user_id: int, session_id: int) -> bool:
+    """Завершение активной сессии; False — у пользователя нет такой активной сессии"""
+    # Ходы одного пользователя выполняются по очереди
+    async with user_locks.hold(user_id):
+        session = get_active_game_session(db, user_id)
+        if not session or session.id != session_id:
+            return False
+
+        update_game_session(db, session_id, {"is_active": False})
+
+    logger.info(f"Игровая сессия {session_id} завершена")
+    return True
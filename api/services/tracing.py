@@ -0,0 +1,127 @@
+import json
+import os
+import queue
+import random
+import re
+import secrets
+import threading
+import time
+from typing import Any, Dict, Optional
+from api.services.metrics import RequestTimings, registry
+from config.settings import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# W3C traceparent: версия-trace_id-parent_id-флаги
+TRACEPARENT = re.compile(r"^[0-9a-f]{2}-([0-9a-f]{32})-[0-9a-f]{16}-([0-9a-f]{2})$")
+
+traces_exported = registry.counter("traces_exported_total", "Выгруженные трассировки запросов")
+traces_dropped = registry.counter("traces_dropped_total", "Трассировки, не поместившиеся в очередь выгрузки")
+
+
+class TraceExporter:
+    """Запись трассировок в файл JSON lines из фонового потока (не блокирует обработку запросов)"""
+
+    def __init__(self, path: str, max_pending: int = 10000):
+        self.path = path
+        self.max_pending = max_pending
+        self._start()
+        # Потоки не переживают fork: в рабочем процессе запускаем свой поток выгрузки
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._start)
+
+    def _start(self):
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=self.max_pending)
+        self._thread = threading.Thread(target=self._write_loop, name="trace-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, record: Dict[str, Any]):
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            traces_dropped.inc()
+
+    def flush(self, timeout: float = 5.0):
+        """Ожидание записи накопленных трассировок (при остановке процесса)"""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def _write_loop(self):
+        while True:
+            records = [self._queue.get()]
+            # Все, что накопилось, пишем одним вызовом write: строки разных
+            # рабочих процессов в общем файле (O_APPEND) не перемешиваются
+            while not self._queue.empty():
+                records.append(self._queue.get_nowait())
+            try:
+                lines = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+                with open(self.path, "ab", buffering=0) as output:
+                    output.write(lines.encode("utf-8"))
+                traces_exported.inc(amount=len(records))
+            except Exception as e:
+                logger.error(f"Ошибка записи трассировки в {self.path}: {e}")
+            finally:
+                for _ in records:
+                    self._queue.task_done()
+
+
+class Tracer:
+    """Трассировка запросов по этапам.
+
+    Суммы по этапам есть у каждого запроса (их считают метрики) и отдаются
+    в заголовке Server-Timing. Отдельные спаны с временем начала собираются
+    только для выбранной доли запросов (sample_rate) или если клиент прислал
+    traceparent с флагом sampled, и выгружаются в JSON lines.
+    """
+
+    def __init__(self, sample_rate: float = 0.0, export_path: str = "", server_timing: bool = True):
+        self.sample_rate = sample_rate
+        self.server_timing_enabled = server_timing
+        self.exporter = TraceExporter(export_path) if export_path else None
+
+    def begin(self, traceparent: Optional[str]) -> RequestTimings:
+        timings = RequestTimings()
+        match = TRACEPARENT.match(traceparent or "")
+        if match:
+            timings.trace_id = match.group(1)
+            sampled = int(match.group(2), 16) & 1 == 1
+        else:
+            timings.trace_id = secrets.token_hex(16)
+            sampled = self.sample_rate > 0 and random.random() < self.sample_rate
+
+        if sampled and self.exporter is not None:
+            timings.start_trace()
+        return timings
+
+    def server_timing(self, timings: RequestTimings, total: float) -> str:
+        """Значение заголовка Server-Timing (миллисекунды)"""
+        entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.stages.items()]
+        entries.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(entries)
+
+    def finish(self, timings: RequestTimings, method: str, route: str, path: str, status_code: int, total: float):
+        """Выгрузка трассировки, если запрос попал в выборку"""
+        if timings.spans is None or self.exporter is None:
+            return
+        self.exporter.export({
+            "trace_id": timings.trace_id,
+            "timestamp": time.time() - total,
+            "method": method,
+            "route": route,
+            "path": path,
+            "status": status_code,
+            "duration_ms": round(total * 1000, 3),
+            "spans": [
+                {"name": name, "start_ms": round(start * 1000, 3), "duration_ms": round(duration * 1000, 3)}
+                for name, start, duration in timings.spans
+            ]
+        })
+
+
+tracer = Tracer(
+    sample_rate=settings.TRACE_SAMPLE_RATE,
+    export_path=settings.TRACE_EXPORT_PATH,
+    server_timing=settings.SERVER_TIMING_ENABLED
+)
@@ -0,0 +1,53 @@
+import asyncio
+import importlib
+from database.database import SessionLocal, get_recent_active_sessions
+from api.services.dice import DicePool
+from api.services.event_store import event_store
+from api.services.lifecycle import lifecycle
+from config.settings import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Модули, импорт которых отложен до первого использования
+DEFERRED_IMPORTS = ("httpx",)
+
+
+def _check_connection():
+    """Первое соединение с базой (открытие файла SQLite, режим WAL)"""
+    db = SessionLocal()
+    try:
+        db.connection().exec_driver_sql("SELECT 1")
+    finally:
+        db.close()
+
+
+async def _warm_event_store(limit: int) -> int:
+    """Состояния недавно активных сессий — в кэш журнала событий"""
+    db = SessionLocal()
+    try:
+        sessions = get_recent_active_sessions(db, limit)
+        for session in sessions:
+            event_store.load_state(db, session)
+            # Не занимаем event loop надолго: запросы обрабатываются между сессиями
+            await asyncio.sleep(0)
+        return len(sessions)
+    finally:
+        db.close()
+
+
+async def warm_up(deepseek_service):
+    """Прогрев после запуска: не задерживает готовность процесса к запросам"""
+    try:
+        with lifecycle.phase("warmup"):
+            for name in DEFERRED_IMPORTS:
+                await asyncio.to_thread(importlib.import_module, name)
+            deepseek_service._get_client()
+            await asyncio.to_thread(_check_connection)
+            DicePool().roll(12, 2)
+            warmed = await _warm_event_store(settings.WARMUP_SESSIONS)
+        logger.info(f"Прогрев завершен за {lifecycle.phases['warmup']:.3f} с, сессий в кэше: {warmed}")
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.error(f"Ошибка прогрева: {e}")
@@ -0,0 +1,60 @@
+import asyncio
+import json
+import os
+from typing import Any, Optional
+from config.settings import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def state_dir(name: str) -> Optional[str]:
+    """Каталог общего состояния рабочих процессов (WORKER_STATE_DIR задает run.py); None — процесс один"""
+    if not settings.WORKER_STATE_DIR:
+        return None
+    path = os.path.join(settings.WORKER_STATE_DIR, name)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def pid_alive(pid: int) -> bool:
+    """Процесс еще работает (рабочие процессы запущены на одной машине)"""
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def write_json(path: str, data: Any):
+    """Атомарная запись: читатель видит либо старый, либо новый файл целиком"""
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "w", encoding="utf-8") as output:
+        json.dump(data, output, ensure_ascii=False)
+    os.replace(temporary, path)
+
+
+def read_json(path: str) -> Optional[Any]:
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"Не удалось прочитать {path}: {e}")
+        return None
+
+
+async def sync_loop(interval: float, *callbacks):
+    """Периодическая синхронизация процесса с общим каталогом (запись метрик, команды профилировщика)"""
+    while True:
+        await asyncio.sleep(interval)
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"Ошибка синхронизации рабочего процесса: {e}")
@@ -0,0 +1,88 @@
+import mimetypes
+import os
+import re
+from typing import Dict, List, Tuple
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import StaticFiles, NotModifiedResponse
+from starlette.types import Scope
+
+# Файлы с хэшем содержимого в имени (см. build_webapp.py) можно кэшировать навсегда
+FINGERPRINTED = re.compile(r"\.[0-9a-f]{12}\.[a-z0-9]+$")
+
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE = "no-cache"
+
+# Предпочитаемые кодировки и расширения заранее сжатых файлов
+ENCODINGS = [("br", ".br"), ("gzip", ".gz")]
+
+
+def parse_accept_encoding(header: str) -> Dict[str, float]:
+    """Кодировки из Accept-Encoding с весами q (без веса — 1.0)"""
+    weights = {}
+    for item in header.split(","):
+        coding, _, params = item.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        weight = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[coding] = weight
+    return weights
+
+
+def preferred_encodings(header: str) -> List[Tuple[str, str]]:
+    """Доступные кодировки, которые принимает клиент (q > 0): по убыванию q, при равном — в порядке ENCODINGS"""
+    weights = parse_accept_encoding(header)
+    wildcard = weights.get("*", 0.0)
+    acceptable = [(weights.get(encoding, wildcard), encoding, extension) for encoding, extension in ENCODINGS]
+    return [(encoding, extension) for weight, encoding, extension
+            in sorted(acceptable, key=lambda item: -item[0]) if weight > 0]
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """Статика с отдачей заранее сжатых .br/.gz версий и заголовками кэширования"""
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope: Scope,
+                      status_code: int = 200) -> Response:
+        request_headers = Headers(scope=scope)
+        encodings = preferred_encodings(request_headers.get("accept-encoding", ""))
+        media_type = mimetypes.guess_type(str(full_path))[0] or "text/plain"
+        cache_control = IMMUTABLE_CACHE if FINGERPRINTED.search(str(full_path)) else REVALIDATE_CACHE
+
+        for encoding, extension in encodings:
+            variant = f"{full_path}{extension}"
+            try:
+                variant_stat = os.stat(variant)
+            except OSError:
+                continue
+
+            response = FileResponse(
+                variant, status_code=status_code, stat_result=variant_stat,
+                method=scope["method"], media_type=media_type,
+                headers={"Content-Encoding": encoding}
+            )
+            break
+        else:
+            response = FileResponse(
+                full_path, status_code=status_code, stat_result=stat_result,
+                method=scope["method"], media_type=media_type
+            )
+
+        response.headers["Vary"] = "Accept-Encoding"
+        response.headers["Cache-Control"] = cache_control
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+def webapp_directory(base: str = "webapp") -> str:
+    """Собранная статика, если есть, иначе исходники"""
+    dist = os.path.join(base, "dist")
+    return dist if os.path.isfile(os.path.join(dist, "index.html")) else base
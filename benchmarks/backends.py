@@ -0,0 +1,311 @@
+"""
+Проверка и сравнение реализаций GameRepository (database/repository.py).
+
+check — одинаковое поведение всех хранилищ: активный персонаж и сессия,
+монотонные id, доступ только к своим строкам, сохранение после
+перезапуска, отсутствие потерянных обновлений при одновременных ходах.
+Завершается с кодом 1, если какая-то проверка не прошла.
+
+bench — время операций маршрутов api/routes/simple.py на каждом
+хранилище (медиана и 99-й перцентиль по отдельным вызовам), чтобы
+выбрать STORAGE_BACKEND для конкретного хостинга. Хранилища — во
+временном каталоге на диске, как в работе.
+
+Запуск:
+  python -m benchmarks.backends check [--backend memory]
+  python -m benchmarks.backends bench [--ops 2000] [--output benchmarks/baselines/backends.json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from database.errors import ConcurrentUpdateError
+from database.repository import BACKENDS, create_repository
+
+CHECKS = {}
+OPERATIONS = {}
+CONCURRENT_TURNS = 20
+
+
+def check(name):
+    def register(func):
+        CHECKS[name] = func
+        return func
+    return register
+
+
+def operation(name):
+    def register(func):
+        OPERATIONS[name] = func
+        return func
+    return register
+
+
+class Backend:
+    """Хранилище во временном каталоге; reopen() — имитация перезапуска процесса"""
+
+    def __init__(self, name):
+        self.name = name
+        self.directory = tempfile.mkdtemp(prefix=f"bench_backend_{name}_")
+        self.repository = None
+
+    def _create(self):
+        return create_repository(self.name, url=f"sqlite:///{self.directory}/app.db",
+                                 path=os.path.join(self.directory, "store"))
+
+    async def open(self):
+        self.repository = self._create()
+        await self.repository.load()
+        return self.repository
+
+    async def reopen(self):
+        await self.repository.close()
+        return await self.open()
+
+    async def cleanup(self):
+        if self.repository is not None:
+            await self.repository.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def character_data(name="Арин", character_class="ranger"):
+    return {
+        "name": name, "class": character_class, "ancestry": "elf",
+        "hope": 5, "fear": 3, "stress": 0, "hit_points": 22, "current_hit_points": 22,
+        "abilities": ["Nature's Bond"], "equipment": [], "spells": []
+    }
+
+
+def expect(condition, message):
+    if not condition:
+        raise AssertionError(message)
+
+
+# --- Проверки поведения ---
+
+@check("create_character")
+async def check_create_character(backend):
+    repository = await backend.open()
+    character = await repository.create_character(1, character_data())
+    expect(character["user_id"] == 1 and character["is_active"], "новый персонаж активен и принадлежит пользователю")
+    expect(character["name"] == "Арин" and character["class"] == "ranger", "поля сохраняются")
+    expect(character["abilities"] == ["Nature's Bond"], "списки сохраняются")
+    expect(await repository.get_active_character(1) == character, "get_active_character возвращает ту же строку")
+    expect(await repository.get_active_character(2) is None, "у другого пользователя персонажа нет")
+
+
+@check("monotonic_ids")
+async def check_monotonic_ids(backend):
+    repository = await backend.open()
+    ids = [(await repository.create_character(user_id % 3, character_data()))["id"] for user_id in range(10)]
+    expect(ids == sorted(set(ids)), f"id возрастают и не повторяются: {ids}")
+
+
+@check("single_active_character")
+async def check_single_active_character(backend):
+    repository = await backend.open()
+    first = await repository.create_character(1, character_data("Первый"))
+    second = await repository.create_character(1, character_data("Второй"))
+    expect((await repository.get_active_character(1))["id"] == second["id"], "активен последний персонаж")
+    expect(not (await repository.get_character(1, first["id"]))["is_active"], "прежний персонаж деактивирован")
+
+
+@check("ownership")
+async def check_ownership(backend):
+    repository = await backend.open()
+    character = await repository.create_character(1, character_data())
+    expect(await repository.get_character(2, character["id"]) is None, "чужой персонаж не выдается")
+    expect(await repository.get_character(1, 999999) is None, "несуществующий персонаж — None")
+    modified = await repository.modify_character(2, character["id"], lambda current: {"hope": 0})
+    expect(modified is None, "чужой персонаж не изменяется")
+    expect((await repository.get_character(1, character["id"]))["hope"] == 5, "строка не изменилась")
+
+
+@check("modify_character")
+async def check_modify_character(backend):
+    repository = await backend.open()
+    character = await repository.create_character(1, character_data())
+    modified = await repository.modify_character(
+        1, character["id"], lambda current: {"hope": current["hope"] + 2, "fear": 0})
+    expect(modified["hope"] == 7 and modified["fear"] == 0, "изменения применены")
+    expect(await repository.get_character(1, character["id"]) == modified, "изменения видны при чтении")
+
+
+@check("single_active_session")
+async def check_single_active_session(backend):
+    repository = await backend.open()
+    character = await repository.create_character(1, character_data())
+    first = await repository.create_session(1, {"character_id": character["id"], "current_scene": "Таверна"})
+    second = await repository.create_session(1, {"character_id": character["id"], "current_scene": "Лес"})
+    active = await repository.get_active_session(1)
+    expect(active["id"] == second["id"] and active["current_scene"] == "Лес", "активна последняя сессия")
+    expect(first["id"] < second["id"], "id сессий возрастают")
+    expect(await repository.get_active_session(2) is None, "у другого пользователя сессии нет")
+
+
+@check("persistence")
+async def check_persistence(backend):
+    repository = await backend.open()
+    character = await repository.create_character(1, character_data())
+    await repository.modify_character(1, character["id"], lambda current: {"hope": 9})
+    session = await repository.create_session(1, {"character_id": character["id"], "current_scene": "Лес"})
+
+    repository = await backend.reopen()
+    restored = await repository.get_active_character(1)
+    expect(restored is not None and restored["hope"] == 9, "персонаж сохранился после перезапуска")
+    expect((await repository.get_active_session(1))["id"] == session["id"], "сессия сохранилась")
+    newer = await repository.create_character(2, character_data())
+    expect(newer["id"] > character["id"], "id после перезапуска не переиспользуются")
+
+
+@check("no_lost_updates")
+async def check_no_lost_updates(backend):
+    repository = await backend.open()
+    character = await repository.create_character(1, character_data())
+
+    async def turn():
+        # Как /roll-dice: чтение-изменение-запись одного персонажа
+        try:
+            await repository.modify_character(1, character["id"], lambda current: {"stress": current["stress"] + 1})
+            return 1
+        except ConcurrentUpdateError:
+            return 0
+
+    applied = sum(await asyncio.gather(*(turn() for _ in range(CONCURRENT_TURNS))))
+    stress = (await repository.get_character(1, character["id"]))["stress"]
+    expect(stress == applied, f"применено {applied} ходов, в строке {stress}")
+
+
+# --- Операции для замера ---
+
+@operation("create_character")
+async def op_create_character(repository, users, index):
+    await repository.create_character(users + index, character_data())
+
+
+@operation("get_active_character")
+async def op_get_active_character(repository, users, index):
+    await repository.get_active_character(index % users)
+
+
+@operation("get_character")
+async def op_get_character(repository, users, index):
+    await repository.get_character(index % users, index % users + 1)
+
+
+@operation("modify_character")
+async def op_modify_character(repository, users, index):
+    await repository.modify_character(index % users, index % users + 1,
+                                      lambda current: {"hope": (current["hope"] + 1) % 10})
+
+
+@operation("create_session")
+async def op_create_session(repository, users, index):
+    await repository.create_session(index % users, {"character_id": index % users + 1, "current_scene": "Лес"})
+
+
+@operation("get_active_session")
+async def op_get_active_session(repository, users, index):
+    await repository.get_active_session(index % users)
+
+
+# --- Запуск ---
+
+async def run_checks(backends):
+    failures = 0
+    for name in backends:
+        for check_name, func in CHECKS.items():
+            backend = Backend(name)
+            try:
+                await func(backend)
+                status = "ok"
+            except Exception as e:
+                failures += 1
+                status = f"ОШИБКА: {e}"
+            finally:
+                await backend.cleanup()
+            print(f"{name:<14} {check_name:<28} {status}", flush=True)
+    return failures
+
+
+async def run_bench(backends, users, ops):
+    results = {}
+    for name in backends:
+        backend = Backend(name)
+        try:
+            repository = await backend.open()
+            # Пользователи 0..users-1, персонаж пользователя u имеет id u + 1
+            for user_id in range(users):
+                await repository.create_character(user_id, character_data())
+
+            for op_name, func in OPERATIONS.items():
+                samples = []
+                for index in range(ops):
+                    started = time.perf_counter_ns()
+                    await func(repository, users, index)
+                    samples.append(time.perf_counter_ns() - started)
+                samples.sort()
+                result = {
+                    "median_ns": statistics.median(samples),
+                    "p99_ns": samples[int(len(samples) * 0.99) - 1],
+                    "ops": ops
+                }
+                results[f"{name}.{op_name}"] = result
+                print(f"{name:<14} {op_name:<24} {result['median_ns'] / 1e3:9.1f} мкс  "
+                      f"p99 {result['p99_ns'] / 1e3:9.1f} мкс", flush=True)
+        finally:
+            await backend.cleanup()
+
+    return {
+        "metadata": {
+            "timestamp": datetime.utcnow().isoformat(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "users": users,
+            "ops": ops
+        },
+        "results": results
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Проверка и сравнение хранилищ GameRepository")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    check_parser = commands.add_parser("check", help="Одинаковое поведение всех хранилищ")
+    check_parser.add_argument("--backend", choices=BACKENDS, action="append", help="Только указанные хранилища")
+
+    bench_parser = commands.add_parser("bench", help="Время операций на каждом хранилище")
+    bench_parser.add_argument("--backend", choices=BACKENDS, action="append", help="Только указанные хранилища")
+    bench_parser.add_argument("--users", type=int, default=1000, help="Пользователей в хранилище перед замером")
+    bench_parser.add_argument("--ops", type=int, default=2000, help="Вызовов каждой операции")
+    bench_parser.add_argument("--output", help="Файл результатов (JSON)")
+
+    args = parser.parse_args(argv)
+    backends = args.backend or BACKENDS
+
+    if args.command == "check":
+        failures = asyncio.run(run_checks(backends))
+        print(f"Не пройдено проверок: {failures}")
+        return 1 if failures else 0
+
+    results = asyncio.run(run_bench(backends, args.users, args.ops))
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as output:
+            json.dump(results, output, ensure_ascii=False, indent=2)
+        print(f"Результаты сохранены в {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
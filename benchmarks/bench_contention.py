@@ -0,0 +1,155 @@
+"""
+Бенчмарк конкурентных ходов: корректность и пропускная способность блокировок.
+
+Сценарии:
+  - один пользователь, много одновременных /roll-dice: без блокировок часть
+    ходов теряется (конфликт версий) или журнал расходится с персонажем,
+    с блокировками все ходы выполняются по очереди;
+  - много пользователей: шардированная таблица блокировок против одной
+    глобальной блокировки.
+
+Запрос к DeepSeek заменен задержкой, база — временный SQLite.
+
+Запуск: python -m benchmarks.bench_contention
+"""
+
+import asyncio
+import os
+import tempfile
+import time
+from contextlib import asynccontextmanager
+
+_db_dir = tempfile.mkdtemp(prefix="bench_contention_")
+os.environ["DATABASE_URL"] = f"sqlite:///{_db_dir}/bench.db"
+os.environ.setdefault("BOT_TOKEN", "0:bench")
+os.environ.setdefault("DEEPSEEK_API_KEY", "bench")
+
+from fastapi import HTTPException  # noqa: E402
+
+from api.routes import character as character_routes, game  # noqa: E402
+from api.services import event_store as events  # noqa: E402
+from api.services.locks import UserLocks  # noqa: E402
+from database.database import SessionLocal, init_db, get_character_by_id, get_session_events  # noqa: E402
+
+NARRATIVE_DELAY = 0.005
+
+
+class NoLocks:
+    """Без блокировок (поведение до их появления)"""
+
+    @asynccontextmanager
+    async def hold(self, user_id):
+        yield
+
+
+async def fake_narrative(prompt, character_context):
+    await asyncio.sleep(NARRATIVE_DELAY)
+    return "Повествование"
+
+
+async def call(handler, request):
+    db = SessionLocal()
+    try:
+        return await handler(request, db)
+    finally:
+        db.close()
+
+
+async def create_player(user_id):
+    created = await call(character_routes.create_new_character, character_routes.CharacterCreate(
+        name=f"Игрок {user_id}", **{"class": "warrior"}, ancestry="human", userId=user_id
+    ))
+    character_id = created.character.id
+    await call(game.start_game_session, game.GameStartRequest(characterId=character_id, userId=user_id))
+    return character_id
+
+
+async def roll(user_id, character_id):
+    """Ход: 'ok', 'conflict' или 'error'"""
+    try:
+        await call(game.roll_dice, game.DiceRollRequest(characterId=character_id, userId=user_id, difficulty=12))
+        return "ok"
+    except HTTPException as e:
+        return "conflict" if e.status_code == 409 else "error"
+
+
+def check_consistency(user_id, character_id):
+    """Значения Hope/Fear персонажа совпадают с последним событием журнала"""
+    db = SessionLocal()
+    try:
+        character = get_character_by_id(db, character_id)
+        session = game.get_active_game_session(db, user_id)
+        changes = [e.payload for e in get_session_events(db, session.id) if e.event_type == events.HOPE_CHANGED]
+        if not changes:
+            return True
+        return (changes[-1]["hope"], changes[-1]["fear"]) == (character.hope, character.fear)
+    finally:
+        db.close()
+
+
+async def same_user(locks, user_id, turns):
+    game.user_locks = locks
+    character_id = await create_player(user_id)
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(roll(user_id, character_id) for _ in range(turns)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "ok": results.count("ok"),
+        "conflict": results.count("conflict"),
+        "error": results.count("error"),
+        "consistent": check_consistency(user_id, character_id),
+        "seconds": elapsed
+    }
+
+
+async def many_users(locks, first_user_id, users, turns):
+    game.user_locks = locks
+    players = [(user_id, await create_player(user_id)) for user_id in range(first_user_id, first_user_id + users)]
+
+    async def play(user_id, character_id):
+        return [await roll(user_id, character_id) for _ in range(turns)]
+
+    started = time.perf_counter()
+    results = [r for rs in await asyncio.gather(*(play(*p) for p in players)) for r in rs]
+    elapsed = time.perf_counter() - started
+
+    return {
+        "ok": results.count("ok"),
+        "turns_per_second": len(results) / elapsed,
+        "seconds": elapsed
+    }
+
+
+async def run(turns=20, users=50, turns_per_user=5):
+    await init_db()
+    game.deepseek_service.generate_narrative = fake_narrative
+
+    return {
+        "same_user": {
+            "без блокировок": await same_user(NoLocks(), 1, turns),
+            "шардированные": await same_user(UserLocks(256), 2, turns),
+        },
+        "many_users": {
+            "глобальная": await many_users(UserLocks(1), 1000, users, turns_per_user),
+            "шардированные": await many_users(UserLocks(256), 2000, users, turns_per_user),
+        }
+    }
+
+
+def main():
+    results = asyncio.run(run())
+
+    print("Один пользователь, одновременные броски:")
+    for name, r in results["same_user"].items():
+        print(f"  {name:<16} выполнено {r['ok']:3d}  конфликтов {r['conflict']:3d}  ошибок {r['error']:3d}  "
+              f"журнал согласован: {'да' if r['consistent'] else 'НЕТ'}  {r['seconds']:.2f} с")
+
+    print("Много пользователей:")
+    for name, r in results["many_users"].items():
+        print(f"  {name:<16} выполнено {r['ok']:4d}  {r['turns_per_second']:7.1f} ходов/с  {r['seconds']:.2f} с")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Нагрузочная проверка очереди исходящих сообщений (bot/outbox.py).
+
+Заглушка Bot API (bot/replay.py) ведет себя как Telegram: не чаще
+--chat-rate сообщений в секунду в чат и --global-rate во все чаты, сверх
+лимита — 429 с retry_after. Сценарии:
+  direct — все сообщения отправляются сразу, без очереди: сколько запросов
+           Telegram отклонил бы;
+  outbox — те же сообщения через очередь: отклонений нет (или единицы —
+           их повторяет очередь), порядок в каждом чате сохранен, время
+           близко к пределу, который дают лимиты;
+  edits  — поток правок одного сообщения (как потоковое повествование):
+           сколько правок склеено и дошел ли последний текст.
+
+Запуск: python -m benchmarks.bench_outbox [--chats 60] [--messages 3] [--edits 50]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+os.environ.setdefault("BOT_TOKEN", "0:bench")
+os.environ.setdefault("DEEPSEEK_API_KEY", "bench")
+
+from aiogram import Bot  # noqa: E402
+from aiogram.client.telegram import TelegramAPIServer  # noqa: E402
+from aiogram.exceptions import TelegramRetryAfter  # noqa: E402
+
+from bot.outbox import Outbox  # noqa: E402
+from bot.replay import start_stub  # noqa: E402
+from bot.session import HttpxSession  # noqa: E402
+
+PORT = 8097
+
+
+def make_bot(outbox=None) -> Bot:
+    session = HttpxSession(api=TelegramAPIServer.from_base(f"http://127.0.0.1:{PORT}"))
+    if outbox is not None:
+        session.middleware(outbox)
+    return Bot(token="0:bench", session=session)
+
+
+async def send_all(bot: Bot, chats: int, messages: int):
+    """Все сообщения всем чатам одновременно; возвращает число ошибок 429"""
+    async def send(chat_id, index):
+        try:
+            await bot.send_message(chat_id, f"{chat_id}:{index}")
+            return 0
+        except TelegramRetryAfter:
+            return 1
+
+    # Порядок внутри чата задается очередностью вызовов: сообщение index ставится раньше index + 1
+    tasks = [asyncio.create_task(send(chat_id, index))
+             for index in range(messages) for chat_id in range(1, chats + 1)]
+    return sum(await asyncio.gather(*tasks))
+
+
+def check_order(state, chats: int, messages: int) -> int:
+    """Число чатов, где сообщения пришли не по порядку или не все"""
+    broken = 0
+    for chat_id in range(1, chats + 1):
+        expected = [f"{chat_id}:{index}" for index in range(messages)]
+        if state.texts.get(str(chat_id)) != expected:
+            broken += 1
+    return broken
+
+
+async def scenario_direct(state, args):
+    bot = make_bot()
+    started = time.perf_counter()
+    failed = await send_all(bot, args.chats, args.messages)
+    elapsed = time.perf_counter() - started
+    await bot.session.close()
+    print(f"direct  отправлено {args.chats * args.messages - failed}, отклонено 429: {failed}, "
+          f"время {elapsed:.2f} с", flush=True)
+
+
+async def scenario_outbox(state, args):
+    outbox = Outbox(global_rate=args.global_rate, chat_rate=args.chat_rate)
+    bot = make_bot(outbox)
+    rejected_before = state.rejected
+    state.texts.clear()
+
+    started = time.perf_counter()
+    failed = await send_all(bot, args.chats, args.messages)
+    elapsed = time.perf_counter() - started
+    await outbox.close()
+    await bot.session.close()
+
+    total = args.chats * args.messages
+    # Нижняя граница по лимитам: общий поток и последовательность сообщений в одном чате
+    bound = max((total - 1) / args.global_rate, (args.messages - 1) / args.chat_rate)
+    print(f"outbox  отправлено {total - failed}, ошибок: {failed}, повторов после 429: "
+          f"{state.rejected - rejected_before}, чатов с нарушенным порядком: "
+          f"{check_order(state, args.chats, args.messages)}, время {elapsed:.2f} с "
+          f"(предел по лимитам {bound:.2f} с)", flush=True)
+
+
+async def scenario_edits(state, args):
+    outbox = Outbox(global_rate=args.global_rate, chat_rate=args.chat_rate)
+    bot = make_bot(outbox)
+    state.texts.clear()
+    chat_id = 10 ** 6
+
+    message = await bot.send_message(chat_id, "…")
+    text = ""
+    edits = []
+    for index in range(args.edits):
+        text += f" слово{index}"
+        edits.append(asyncio.create_task(bot.edit_message_text(text, chat_id=chat_id, message_id=message.message_id)))
+        await asyncio.sleep(0.02)
+    await asyncio.gather(*edits)
+    await outbox.close()
+    await bot.session.close()
+
+    received = state.texts[str(chat_id)]
+    print(f"edits   правок {args.edits}, отправлено {len(received) - 1}, "
+          f"последний текст дошел: {received[-1] == text}", flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочная проверка очереди исходящих сообщений")
+    parser.add_argument("--chats", type=int, default=60)
+    parser.add_argument("--messages", type=int, default=3, help="Сообщений в каждый чат")
+    parser.add_argument("--edits", type=int, default=50, help="Правок одного сообщения")
+    parser.add_argument("--chat-rate", type=float, default=1.0)
+    parser.add_argument("--global-rate", type=float, default=30.0)
+    parser.add_argument("--latency", type=float, default=0.02, help="Задержка ответа заглушки, сек")
+    args = parser.parse_args(argv)
+
+    server, state = start_stub(port=PORT, chat_rate=args.chat_rate, global_rate=args.global_rate,
+                               latency=args.latency)
+    try:
+        for scenario in (scenario_direct, scenario_outbox, scenario_edits):
+            asyncio.run(scenario(state, args))
+            # Окно лимитов заглушки освобождается между сценариями
+            time.sleep(1.5)
+    finally:
+        server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+"""
+Бенчмарк сериализации ответа /roll-dice: время кодирования и аллокации.
+
+Сравнивает старый путь (многократный to_dict, нетипизированные dict-поля,
+стандартный JSONResponse) с новым (одна материализация, типизированные схемы,
+ORJSONResponse).
+
+Запуск: python -m benchmarks.bench_serialization
+"""
+
+import asyncio
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Optional
+
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from pydantic import BaseModel
+
+from api.models.schemas import CharacterSchema, SessionSchema
+from database.models import Character, GameSession
+
+
+class LegacyGameResponse(BaseModel):
+    success: bool
+    message: str
+    narrative: Optional[str] = None
+    character: Optional[dict] = None
+    game_state: Optional[dict] = None
+
+
+class TypedGameResponse(BaseModel):
+    success: bool
+    message: str
+    narrative: Optional[str] = None
+    character: Optional[CharacterSchema] = None
+    game_state: Optional[SessionSchema] = None
+
+
+NARRATIVE = "Клинок сверкнул в свете факелов, и древний страж отступил на шаг. " * 3
+
+
+def make_models():
+    """Персонаж и сессия без базы данных"""
+    now = datetime.utcnow()
+    character = Character(
+        id=1, user_id=1000, name="Арвен", character_class="ranger", ancestry="elf",
+        hope=6, fear=2, agility=3, strength=1, finesse=2, instinct=2, presence=0, knowledge=0,
+        armor_score=1, hit_points=22, current_hit_points=18, stress=1,
+        abilities=["Nature's Bond", "Tracking", "Elven Grace"], equipment=[], spells=[],
+        created_at=now, is_active=True
+    )
+    session = GameSession(
+        id=1, user_id=1000, character_id=1, is_active=True, current_scene="Темный лес",
+        game_state={"scene": "Темный лес", "rolls": 12, "recent_narrative": [NARRATIVE] * 5},
+        event_seq=42, created_at=now, updated_at=now, last_action_at=now
+    )
+    return character, session
+
+
+async def legacy_path(field, character, session):
+    # Как было: to_dict() трижды для персонажа и дважды для сессии
+    context = {"character": character.to_dict(), "session": session.to_dict()}
+    character.to_dict()
+    response = LegacyGameResponse(
+        success=True, message="Кости брошены", narrative=NARRATIVE,
+        character=character.to_dict(), game_state=session.to_dict()
+    )
+    content = await serialize_response(field=field, response_content=response)
+    return JSONResponse(content).body, context
+
+
+async def typed_path(field, character, session):
+    character_data = character.to_dict()
+    context = {"character": character_data}
+    response = TypedGameResponse(
+        success=True, message="Кости брошены", narrative=NARRATIVE,
+        character=character_data, game_state=session.to_dict()
+    )
+    content = await serialize_response(field=field, response_content=response)
+    return ORJSONResponse(content).body, context
+
+
+async def measure(name, path, field, iterations):
+    character, session = make_models()
+
+    for _ in range(100):
+        await path(field, character, session)
+
+    started = time.perf_counter()
+    for _ in range(iterations):
+        body, _ = await path(field, character, session)
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    snapshot_before = tracemalloc.take_snapshot()
+    for _ in range(100):
+        await path(field, character, session)
+    snapshot_after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    allocations = sum(stat.count_diff for stat in snapshot_after.compare_to(snapshot_before, "filename"))
+
+    return {
+        "name": name,
+        "us_per_response": elapsed / iterations * 1e6,
+        "body_bytes": len(body),
+        "peak_kib": peak / 1024,
+        "net_allocations_per_100": allocations
+    }
+
+
+async def run(iterations=5000):
+    legacy_field = create_response_field(name="legacy", type_=LegacyGameResponse)
+    typed_field = create_response_field(name="typed", type_=TypedGameResponse)
+    return [
+        await measure("legacy (dict + JSONResponse)", legacy_path, legacy_field, iterations),
+        await measure("typed (schemas + ORJSONResponse)", typed_path, typed_field, iterations)
+    ]
+
+
+def main():
+    for result in asyncio.run(run()):
+        print(f"{result['name']:<36} {result['us_per_response']:8.1f} мкс/ответ  "
+              f"{result['body_bytes']:6d} байт  пик {result['peak_kib']:7.1f} КиБ  "
+              f"аллокаций {result['net_allocations_per_100']}")
+
+
+if __name__ == "__main__":
+    main()
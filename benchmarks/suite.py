@@ -0,0 +1,649 @@
+"""
+Набор микробенчмарков: игровая логика, построение промптов, to_dict моделей
+и функции database/database.py на SQLite в памяти и на диске.
+
+Число повторов подбирается автоматически (не меньше MIN_TIME на замер),
+каждый бенчмарк замеряется REPEATS раз; в результат попадают медиана,
+минимум и разброс времени одной операции. Результаты сохраняются в JSON
+(базовая линия), команда compare сравнивает два прогона и завершается
+с кодом 1, если минимальное время какого-то бенчмарка выросло больше порога.
+
+Сеть не нужна: DeepSeek не вызывается, база — временные файлы SQLite.
+
+Запуск:
+  python -m benchmarks.suite run [--filter db.memory] [--output benchmarks/baselines/latest.json]
+  python -m benchmarks.suite run --compare benchmarks/baselines/main.json
+  python -m benchmarks.suite compare benchmarks/baselines/main.json benchmarks/baselines/latest.json --threshold 0.15
+"""
+
+import argparse
+import json
+import os
+import platform
+import re
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from itertools import count
+
+_db_dir = tempfile.mkdtemp(prefix="bench_suite_")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_db_dir}/app.db")
+os.environ.setdefault("BOT_TOKEN", "0:bench")
+os.environ.setdefault("DEEPSEEK_API_KEY", "bench")
+
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+from sqlalchemy.pool import StaticPool  # noqa: E402
+
+from api.services.combat import CombatEngine  # noqa: E402
+from api.services.deepseek import DeepSeekService  # noqa: E402
+from api.services.dice import DicePool  # noqa: E402
+from api.services.game_logic import DaggerheartGameLogic  # noqa: E402
+from database import database as db_helpers  # noqa: E402
+from database.models import Base, Character, GameSession, DiceRoll, GameEvent  # noqa: E402
+
+MIN_TIME = 0.1
+REPEATS = 5
+DEFAULT_OUTPUT = "benchmarks/baselines/latest.json"
+
+SEED = 20240601
+ACTIONS = [
+    "Атакую стража мечом",
+    "Осматриваю комнату в поисках тайника",
+    "Читаю заклинание огненной стрелы",
+    "Иду к таверне на окраине города",
+    "Пытаюсь убедить торговца снизить цену",
+    "Просто жду и слушаю"
+]
+
+# Имя -> функция подготовки, возвращающая замеряемую операцию без аргументов
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+def make_character(character_id=1, user_id=1000):
+    now = datetime.utcnow()
+    return Character(
+        id=character_id, user_id=user_id, name="Арвен", character_class="ranger", ancestry="elf",
+        hope=6, fear=2, agility=3, strength=1, finesse=2, instinct=2, presence=0, knowledge=0,
+        armor_score=1, hit_points=22, current_hit_points=18, stress=1,
+        abilities=["Nature's Bond", "Tracking", "Elven Grace"], equipment=[], spells=[],
+        created_at=now, is_active=True, version=1
+    )
+
+
+def make_session(session_id=1, user_id=1000):
+    now = datetime.utcnow()
+    narrative = "Клинок сверкнул в свете факелов, и древний страж отступил на шаг. " * 3
+    return GameSession(
+        id=session_id, user_id=user_id, character_id=1, is_active=True, current_scene="Темный лес",
+        game_state={"scene": "Темный лес", "rolls": 12, "recent_narrative": [narrative] * 5},
+        narrative_log=narrative * 10, action_log=[], event_seq=42, rng_seed=SEED, rng_cursor=0,
+        created_at=now, updated_at=now, last_action_at=now, version=1
+    )
+
+
+def dice_pairs(n=1024):
+    """Воспроизводимые пары костей Hope/Fear"""
+    rolls = DicePool(SEED).roll(12, n * 2)
+    return [(int(rolls[i]), int(rolls[i + 1])) for i in range(0, n * 2, 2)]
+
+
+def party_and_adversaries(size):
+    party = [{**make_character(i + 1).to_dict(), "name": f"Герой {i + 1}"} for i in range(size)]
+    adversaries = [{"name": f"Гоблин {i + 1}", "hit_points": 8} for i in range(size)]
+    return party, adversaries
+
+
+# --- Игровая логика ---
+
+@benchmark("game_logic.calculate_dice_result")
+def bench_calculate_dice_result():
+    logic = DaggerheartGameLogic()
+    pairs = dice_pairs()
+    index = count()
+
+    def op():
+        hope, fear = pairs[next(index) & 1023]
+        logic.calculate_dice_result(hope, fear, 12, 1)
+    return op
+
+
+@benchmark("game_logic.update_hope_fear")
+def bench_update_hope_fear():
+    logic = DaggerheartGameLogic()
+    character = make_character()
+    results = [logic.calculate_dice_result(hope, fear) for hope, fear in dice_pairs()]
+    index = count()
+
+    def op():
+        logic.update_hope_fear(character, results[next(index) & 1023])
+    return op
+
+
+@benchmark("game_logic.process_action")
+def bench_process_action():
+    logic = DaggerheartGameLogic()
+    character, session = make_character(), make_session()
+    index = count()
+
+    def op():
+        logic.process_action(ACTIONS[next(index) % len(ACTIONS)], character, session)
+    return op
+
+
+@benchmark("game_logic.check_death_saves")
+def bench_check_death_saves():
+    logic = DaggerheartGameLogic()
+    character = make_character()
+    character.current_hit_points = 0
+    dice = DicePool(SEED)
+
+    def op():
+        logic.check_death_saves(character, dice)
+    return op
+
+
+@benchmark("game_logic.get_game_tables")
+def bench_get_game_tables():
+    logic = DaggerheartGameLogic()
+    return logic.get_game_tables
+
+
+@benchmark("dice.roll_2d12")
+def bench_dice_roll():
+    dice = DicePool(SEED)
+
+    def op():
+        dice.roll(12, 2)
+    return op
+
+
+@benchmark("combat.resolve_round_4v4")
+def bench_resolve_round():
+    engine = CombatEngine()
+    party, adversaries = party_and_adversaries(4)
+    dice = DicePool(SEED)
+
+    def op():
+        engine.resolve_round(party, adversaries, dice)
+    return op
+
+
+# --- Промпты ---
+
+@benchmark("prompt.initial")
+def bench_initial_prompt():
+    logic = DaggerheartGameLogic()
+    character = make_character()
+
+    def op():
+        logic.create_initial_prompt(character)
+    return op
+
+
+@benchmark("prompt.dice_result")
+def bench_dice_result_prompt():
+    logic = DaggerheartGameLogic()
+    context = {
+        "dice_result": {**logic.calculate_dice_result(9, 4), "hope_change": 2, "fear_change": 0},
+        "character": make_character().to_dict()
+    }
+
+    def op():
+        logic.create_dice_result_prompt(context)
+    return op
+
+
+@benchmark("prompt.action")
+def bench_action_prompt():
+    logic = DaggerheartGameLogic()
+    context = {"action": ACTIONS[0], "description": "Быстрый выпад", "character": make_character().to_dict()}
+
+    def op():
+        logic.create_action_prompt(context)
+    return op
+
+
+@benchmark("prompt.combat_round")
+def bench_combat_round_prompt():
+    logic = DaggerheartGameLogic()
+    party, adversaries = party_and_adversaries(4)
+    context = {**CombatEngine().resolve_round(party, adversaries, DicePool(SEED)), "round": 3}
+
+    def op():
+        logic.create_combat_round_prompt(context)
+    return op
+
+
+@benchmark("prompt.deepseek_payload")
+def bench_deepseek_payload():
+    service = DeepSeekService()
+    character = make_character().to_dict()
+    prompt = DaggerheartGameLogic().create_action_prompt({"action": ACTIONS[0], "character": character})
+
+    def op():
+        service._build_payload(prompt, character, stream=True)
+    return op
+
+
+# --- Сериализация моделей ---
+
+@benchmark("to_dict.character")
+def bench_character_to_dict():
+    return make_character().to_dict
+
+
+@benchmark("to_dict.game_session")
+def bench_session_to_dict():
+    return make_session().to_dict
+
+
+@benchmark("to_dict.dice_roll")
+def bench_dice_roll_to_dict():
+    roll = DiceRoll(id=1, session_id=1, user_id=1000, hope_die=9, fear_die=4, modifier=1, action_type="combat",
+                    difficulty=12, success=False, description=ACTIONS[0], result_description="Неудача",
+                    rng_offset=10, created_at=datetime.utcnow())
+    return roll.to_dict
+
+
+@benchmark("to_dict.game_event")
+def bench_event_to_dict():
+    event = GameEvent(id=1, session_id=1, seq=1, event_type="dice_rolled",
+                      payload={"hope_die": 9, "fear_die": 4, "hope": 7, "fear": 2}, created_at=datetime.utcnow())
+    return event.to_dict
+
+
+# --- Функции базы данных ---
+
+SEED_USERS = 200
+SEED_EVENTS = 500
+
+
+class BenchDatabase:
+    """Отдельный движок и схема для одного бенчмарка, заполненные типичными данными"""
+
+    def __init__(self, backend):
+        if backend == "memory":
+            self.engine = create_engine("sqlite://", connect_args={"check_same_thread": False},
+                                        poolclass=StaticPool)
+        else:
+            path = tempfile.mktemp(suffix=".db", dir=_db_dir)
+            self.engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+        Base.metadata.create_all(self.engine)
+        self.db = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=self.engine)()
+        self.user_ids = count(SEED_USERS + 1)
+
+        characters = [
+            Character(user_id=user_id, name=f"Игрок {user_id}", character_class="warrior", ancestry="human")
+            for user_id in range(1, SEED_USERS + 1)
+        ]
+        self.db.add_all(characters)
+        self.db.flush()
+        sessions = [
+            GameSession(user_id=character.user_id, character_id=character.id, rng_seed=SEED)
+            for character in characters
+        ]
+        self.db.add_all(sessions)
+        self.db.commit()
+
+        self.character, self.session = characters[0], sessions[0]
+        events = [("dice_rolled", {"hope_die": hope, "fear_die": fear}) for hope, fear in dice_pairs(SEED_EVENTS)]
+        db_helpers.append_game_events(self.db, self.session.id, events, snapshot={"hope": 5, "fear": 3})
+        for hope, fear in dice_pairs(20):
+            db_helpers.create_dice_roll(self.db, self.roll_data(hope, fear))
+
+    def roll_data(self, hope, fear):
+        return {"session_id": self.session.id, "user_id": self.session.user_id, "hope_die": hope,
+                "fear_die": fear, "action_type": "combat", "success": hope > fear, "description": ACTIONS[0]}
+
+    def close(self):
+        self.db.close()
+        self.engine.dispose()
+
+
+DB_BENCHMARKS = {}
+
+
+def db_benchmark(name):
+    def register(setup):
+        DB_BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+@db_benchmark("create_character")
+def bench_create_character(data):
+    def op():
+        user_id = next(data.user_ids)
+        db_helpers.create_character(data.db, {"user_id": user_id, "name": f"Игрок {user_id}",
+                                              "class": "warrior", "ancestry": "human"})
+    return op
+
+
+@db_benchmark("get_character_by_user_id")
+def bench_get_character_by_user_id(data):
+    user_ids = count()
+
+    def op():
+        db_helpers.get_character_by_user_id(data.db, next(user_ids) % SEED_USERS + 1)
+    return op
+
+
+@db_benchmark("get_character_by_id")
+def bench_get_character_by_id(data):
+    return lambda: db_helpers.get_character_by_id(data.db, data.character.id)
+
+
+@db_benchmark("get_characters_by_ids")
+def bench_get_characters_by_ids(data):
+    ids = list(range(1, 5))
+    return lambda: db_helpers.get_characters_by_ids(data.db, ids)
+
+
+@db_benchmark("update_character")
+def bench_update_character(data):
+    hopes = count()
+
+    def op():
+        db_helpers.update_character(data.db, data.character.id, {"hope": next(hopes) % 10})
+    return op
+
+
+@db_benchmark("modify_character")
+def bench_modify_character(data):
+    def op():
+        db_helpers.modify_character(data.db, data.character.id, lambda c: {"fear": (c.fear + 1) % 10})
+    return op
+
+
+@db_benchmark("create_game_session")
+def bench_create_game_session(data):
+    def op():
+        db_helpers.create_game_session(data.db, {"user_id": next(data.user_ids), "character_id": data.character.id,
+                                                 "rng_seed": SEED})
+    return op
+
+
+@db_benchmark("get_game_session_by_id")
+def bench_get_game_session_by_id(data):
+    return lambda: db_helpers.get_game_session_by_id(data.db, data.session.id)
+
+
+@db_benchmark("get_active_game_session")
+def bench_get_active_game_session(data):
+    user_ids = count()
+
+    def op():
+        db_helpers.get_active_game_session(data.db, next(user_ids) % SEED_USERS + 1)
+    return op
+
+
+@db_benchmark("update_game_session")
+def bench_update_game_session(data):
+    scenes = ["Таверна", "Темный лес", "Подземелье"]
+    index = count()
+
+    def op():
+        db_helpers.update_game_session(data.db, data.session.id, {"current_scene": scenes[next(index) % 3]})
+    return op
+
+
+@db_benchmark("add_narrative_to_session")
+def bench_add_narrative_to_session(data):
+    index = count(1)
+    narrative = "Клинок сверкнул в свете факелов. " * 5
+
+    def op():
+        # Журнал обрезается, чтобы время не росло вместе с его длиной
+        if next(index) % 50 == 0:
+            data.session.narrative_log = ""
+        db_helpers.add_narrative_to_session(data.db, data.session.id, narrative)
+    return op
+
+
+@db_benchmark("add_action_to_session")
+def bench_add_action_to_session(data):
+    index = count(1)
+
+    def op():
+        if next(index) % 50 == 0:
+            data.session.action_log = []
+        db_helpers.add_action_to_session(data.db, data.session.id, ACTIONS[0])
+    return op
+
+
+@db_benchmark("append_game_events")
+def bench_append_game_events(data):
+    events = [("dice_rolled", {"hope_die": 9, "fear_die": 4}), ("character_updated", {"hope": 7})]
+    return lambda: db_helpers.append_game_events(data.db, data.session.id, events,
+                                                 character_updates={data.character.id: {"hope": 7}})
+
+
+@db_benchmark("get_latest_snapshot")
+def bench_get_latest_snapshot(data):
+    return lambda: db_helpers.get_latest_snapshot(data.db, data.session.id)
+
+
+@db_benchmark("get_session_events_tail")
+def bench_get_session_events(data):
+    return lambda: db_helpers.get_session_events(data.db, data.session.id, after_seq=SEED_EVENTS - 50)
+
+
+@db_benchmark("create_dice_roll")
+def bench_create_dice_roll(data):
+    roll = data.roll_data(9, 4)
+    return lambda: db_helpers.create_dice_roll(data.db, roll)
+
+
+@db_benchmark("get_session_dice_rolls")
+def bench_get_session_dice_rolls(data):
+    return lambda: db_helpers.get_session_dice_rolls(data.db, data.session.id)
+
+
+@db_benchmark("save_idempotency_record")
+def bench_save_idempotency_record(data):
+    keys = count()
+
+    def op():
+        db_helpers.save_idempotency_record(data.db, {"key": f"/api/game/roll-dice {next(keys)}",
+                                                     "request_hash": "0" * 64, "status_code": 200,
+                                                     "body": b'{"success":true}'})
+    return op
+
+
+@db_benchmark("get_idempotency_record")
+def bench_get_idempotency_record(data):
+    db_helpers.save_idempotency_record(data.db, {"key": "/api/game/roll-dice 1", "request_hash": "0" * 64,
+                                                 "status_code": 200, "body": b'{"success":true}'})
+    return lambda: db_helpers.get_idempotency_record(data.db, "/api/game/roll-dice 1")
+
+
+@db_benchmark("delete_expired_idempotency_records")
+def bench_delete_expired_idempotency_records(data):
+    older_than = datetime.utcnow() - timedelta(days=1)
+    return lambda: db_helpers.delete_expired_idempotency_records(data.db, older_than)
+
+
+@db_benchmark("close_all_user_sessions")
+def bench_close_all_user_sessions(data):
+    user_ids = count()
+
+    def op():
+        db_helpers.close_all_user_sessions(data.db, next(user_ids) % SEED_USERS + 1)
+    return op
+
+
+@db_benchmark("deactivate_user_characters")
+def bench_deactivate_user_characters(data):
+    user_ids = count()
+
+    def op():
+        db_helpers.deactivate_user_characters(data.db, next(user_ids) % SEED_USERS + 1)
+    return op
+
+
+@db_benchmark("release_connection")
+def bench_release_connection(data):
+    def op():
+        db_helpers.get_character_by_id(data.db, data.character.id)
+        db_helpers.release_connection(data.db)
+    return op
+
+
+# --- Запуск и сравнение ---
+
+def measure(op, min_time=MIN_TIME, repeats=REPEATS):
+    """Время одной операции в нс: подбор числа повторов, затем repeats замеров"""
+    op()
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            op()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time / 10:
+            break
+        number *= 10
+    number = max(1, int(number * min_time / elapsed))
+
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        for _ in range(number):
+            op()
+        samples.append((time.perf_counter() - started) / number * 1e9)
+
+    return {
+        "median_ns": statistics.median(samples),
+        "min_ns": min(samples),
+        "stdev_ns": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        "loops": number,
+        "repeats": repeats
+    }
+
+
+def selected(pattern):
+    """Пары (имя, функция запуска) с учетом фильтра"""
+    names = []
+    for name, setup in BENCHMARKS.items():
+        names.append((name, lambda setup=setup: (setup(), None)))
+    for backend in ("memory", "disk"):
+        for name, setup in DB_BENCHMARKS.items():
+            def prepare(setup=setup, backend=backend):
+                data = BenchDatabase(backend)
+                return setup(data), data.close
+            names.append((f"db.{backend}.{name}", prepare))
+    regex = re.compile(pattern) if pattern else None
+    return [(name, prepare) for name, prepare in names if regex is None or regex.search(name)]
+
+
+def run(pattern=None, min_time=MIN_TIME, repeats=REPEATS):
+    results = {}
+    for name, prepare in selected(pattern):
+        op, cleanup = prepare()
+        try:
+            results[name] = measure(op, min_time, repeats)
+        finally:
+            if cleanup is not None:
+                cleanup()
+        print(f"{name:<52} {format_ns(results[name]['median_ns']):>10}  "
+              f"±{results[name]['stdev_ns'] / results[name]['median_ns'] * 100:4.1f}%", flush=True)
+
+    return {
+        "metadata": {
+            "timestamp": datetime.utcnow().isoformat(),
+            "python": sys.version.split()[0],
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "min_time": min_time,
+            "repeats": repeats
+        },
+        "results": results
+    }
+
+
+def compare(baseline, current, threshold):
+    """Сравнение минимумов (меньше всего зависят от фоновой нагрузки); возвращает замедлившиеся бенчмарки"""
+    regressions = []
+    for name, result in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            print(f"{name:<52} {format_ns(result['min_ns']):>10}  новый")
+            continue
+        ratio = result["min_ns"] / base["min_ns"]
+        if ratio > 1 + threshold:
+            mark = "ЗАМЕДЛЕНИЕ"
+            regressions.append(name)
+        elif ratio < 1 - threshold:
+            mark = "ускорение"
+        else:
+            mark = ""
+        print(f"{name:<52} {format_ns(base['min_ns']):>10} -> {format_ns(result['min_ns']):>10}  "
+              f"{(ratio - 1) * 100:+6.1f}%  {mark}")
+
+    if baseline["metadata"].get("platform") != current["metadata"].get("platform"):
+        print("Внимание: прогоны сделаны на разных платформах, сравнение приблизительное")
+    print(f"Замедлений больше {threshold * 100:.0f}%: {len(regressions)}")
+    return regressions
+
+
+def format_ns(value):
+    if value >= 1e6:
+        return f"{value / 1e6:.2f} мс"
+    if value >= 1e3:
+        return f"{value / 1e3:.2f} мкс"
+    return f"{value:.0f} нс"
+
+
+def load(path):
+    with open(path, encoding="utf-8") as source:
+        return json.load(source)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Микробенчмарки игровой логики и базы данных")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Запуск бенчмарков и сохранение результатов")
+    run_parser.add_argument("--filter", help="Регулярное выражение для имен бенчмарков")
+    run_parser.add_argument("--output", default=DEFAULT_OUTPUT, help="Файл результатов (JSON)")
+    run_parser.add_argument("--min-time", type=float, default=MIN_TIME, help="Минимальное время одного замера, с")
+    run_parser.add_argument("--repeats", type=int, default=REPEATS, help="Число замеров")
+    run_parser.add_argument("--compare", help="Базовая линия для сравнения после прогона")
+    run_parser.add_argument("--threshold", type=float, default=0.15, help="Допустимое замедление (0.15 = 15%%)")
+
+    compare_parser = commands.add_parser("compare", help="Сравнение двух прогонов")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.15, help="Допустимое замедление (0.15 = 15%%)")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "compare":
+        regressions = compare(load(args.baseline), load(args.current), args.threshold)
+        return 1 if regressions else 0
+
+    current = run(args.filter, args.min_time, args.repeats)
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as output:
+        json.dump(current, output, ensure_ascii=False, indent=2)
+    print(f"Результаты сохранены в {args.output}")
+
+    if args.compare:
+        regressions = compare(load(args.compare), current, args.threshold)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
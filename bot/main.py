@@ -1,9 +1,14 @@
 import asyncio
 import logging
-from aiogram import Bot, Dispatcher, types
+from aiogram import Bot, Dispatcher, F, types
 from aiogram.filters import Command
 from aiogram.types import WebAppInfo, InlineKeyboardMarkup, InlineKeyboardButton
-from aiogram.client.session.aiohttp import AiohttpSession
+from bot.session import create_session
+from bot.outbox import Outbox
+from bot.ordering import ChatOrderingMiddleware
+from database.database import SessionLocal
+from api.services.characters import get_profile_card
+from bot.play import play_turn
 from config.settings import settings
 
 # Настройка логирования
@@ -11,9 +16,25 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Создание бота и диспетчера
-bot = Bot(token=settings.BOT_TOKEN)
+bot = Bot(token=settings.BOT_TOKEN, session=create_session())
 dp = Dispatcher()
 
+# Все отправки бота проходят через очередь с лимитами Telegram
+outbox = Outbox(
+    global_rate=settings.TELEGRAM_GLOBAL_RATE,
+    chat_rate=settings.TELEGRAM_CHAT_RATE,
+    chat_burst=settings.TELEGRAM_CHAT_BURST,
+    group_rate=settings.TELEGRAM_GROUP_RATE,
+    max_pending=settings.TELEGRAM_OUTBOX_MAX_PENDING
+)
+bot.session.middleware(outbox)
+
+# Чаты обрабатываются параллельно, обновления одного чата — по порядку
+dp.update.outer_middleware(ChatOrderingMiddleware(
+    max_in_flight=settings.BOT_MAX_IN_FLIGHT,
+    max_pending=settings.BOT_MAX_PENDING_UPDATES
+))
+
 
 @dp.message(Command("start"))
 async def start_handler(message: types.Message):
@@ -62,6 +83,7 @@ async def help_handler(message: types.Message):
 /help - Показать это сообщение
 /profile - Посмотреть профиль персонажа
 /new_game - Начать новую игру
+/roll - Бросить кости в игре в чате
 
 🎲 **Как играть:**
 1. Нажми кнопку "Начать игру в Daggerheart"
@@ -69,6 +91,8 @@ async def help_handler(message: types.Message):
 3. Следуй указаниям ИИ Мастера
 4. Принимай решения и кидай кости!
 
+Играть можно и прямо в чате: напиши, что делает твой персонаж.
+
 Удачи в приключениях! ⚔️
     """
     await message.answer(help_text)
@@ -77,8 +101,21 @@ async def help_handler(message: types.Message):
 @dp.message(Command("profile"))
 async def profile_handler(message: types.Message):
     """Показать профиль персонажа"""
-    # TODO: Получить данные персонажа из API
-    await message.answer("🔮 Профиль персонажа пока в разработке...")
+    # Данные берутся из базы в этом же процессе, без запроса к собственному API
+    db = SessionLocal()
+    try:
+        card = get_profile_card(db, message.from_user.id)
+    except Exception as e:
+        logger.error(f"Ошибка получения профиля: {e}")
+        await message.answer("⚠️ Не удалось загрузить профиль, попробуй позже")
+        return
+    finally:
+        db.close()
+
+    if card is None:
+        await message.answer("🧙 У тебя пока нет персонажа. Создай его командой /new_game!")
+        return
+    await message.answer(card)
 
 
 @dp.message(Command("new_game"))
@@ -101,17 +138,34 @@ async def new_game_handler(message: types.Message):
     )
 
 
+@dp.message(Command("roll"))
+async def roll_handler(message: types.Message):
+    """Бросок костей в игре в чате"""
+    await play_turn(message, roll=True)
+
+
+@dp.message(F.text & ~F.text.startswith("/"))
+async def play_handler(message: types.Message):
+    """Игра в чате: текст сообщения — действие персонажа"""
+    await play_turn(message)
+
+
 @dp.message()
 async def echo_handler(message: types.Message):
     """Обработчик всех остальных сообщений"""
     await message.answer(
-        "🎲 Используй команды бота или нажми на кнопку Mini App для игры!\n\n"
-        "Доступные команды: /start, /help, /profile, /new_game"
+        "🎲 Напиши, что делает твой персонаж, или нажми на кнопку Mini App для игры!\n\n"
+        "Доступные команды: /start, /help, /profile, /new_game, /roll"
     )
 
 
 async def main():
     """Основная функция запуска бота"""
+    if settings.BOT_MODE == "webhook":
+        # Обновления принимает маршрут API (bot/webhook.py), polling помешал бы webhook
+        logger.error("BOT_MODE=webhook: бот работает внутри API, отдельный процесс не нужен")
+        return
+
     logger.info("Запуск Daggerheart бота...")
 
     # Удаляем все обновления, которые поступили, пока бот был оффлайн
@@ -121,6 +175,7 @@ async def main():
     try:
         await dp.start_polling(bot)
     finally:
+        await outbox.close(settings.SHUTDOWN_TIMEOUT)
         await bot.session.close()
 
 
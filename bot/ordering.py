@@ -0,0 +1,132 @@
+"""
+Параллельная обработка обновлений бота с порядком внутри чата.
+
+aiogram обрабатывает каждое обновление отдельной задачей (polling) или
+задачей маршрута webhook: медленный обработчик (DeepSeek, база) не держит
+остальные чаты, но два сообщения одного чата могут обработаться в обратном
+порядке, а число одновременных обработчиков ничем не ограничено.
+
+ChatOrderingMiddleware — внешний middleware обновлений:
+  - у каждого чата своя очередь: следующее обновление чата начинает
+    обработку только после завершения предыдущего;
+  - одновременно выполняется не больше max_in_flight обработчиков во всех
+    чатах, ожидающих обновлений — не больше max_pending (сверх — обновление
+    отбрасывается с записью в лог);
+  - время ожидания в очереди (bot_update_queue_seconds) и число ожидающих и
+    выполняющихся обновлений выгружаются в метрики.
+
+Порядок определяется моментом входа в middleware: задачи обновлений
+создаются в порядке получения, а до этого middleware они не ожидают ввода-вывода.
+
+Очереди живут в памяти процесса, поэтому обновления бота должен принимать один
+процесс: в режиме polling это процесс бота, в режиме webhook run.py запускает
+один рабочий процесс API. Маршрут webhook отвечает Telegram сразу, и при
+нескольких процессах следующее обновление чата могло бы обрабатываться в другом
+процессе параллельно с предыдущим.
+"""
+
+import asyncio
+import time
+import weakref
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from api.services.metrics import registry
+import logging
+
+logger = logging.getLogger(__name__)
+
+update_queue_time = registry.histogram(
+    "bot_update_queue_seconds", "Ожидание обновления бота в очереди чата и общей очереди"
+)
+update_handle_time = registry.histogram(
+    "bot_update_handle_seconds", "Время обработки обновления бота"
+)
+updates_dropped = registry.counter(
+    "bot_updates_dropped_total", "Обновления, отброшенные из-за переполнения очереди"
+)
+
+# Все экземпляры процесса (для метрик очереди)
+_middlewares: "weakref.WeakSet[ChatOrderingMiddleware]" = weakref.WeakSet()
+
+
+class ChatOrderingMiddleware(BaseMiddleware):
+    """Очереди обновлений по чатам и общий предел одновременных обработчиков"""
+
+    def __init__(self, max_in_flight: int = 64, max_pending: int = 10000):
+        self.max_in_flight = max_in_flight
+        self.max_pending = max_pending
+        self.pending = 0
+        self.in_flight = 0
+        # chat_id -> очередь ожидающих (первый элемент — обновление, которое сейчас обрабатывается)
+        self._chats: Dict[Any, Deque[asyncio.Future]] = {}
+        self._slots = asyncio.Semaphore(max_in_flight)
+        _middlewares.add(self)
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        if self.pending >= self.max_pending:
+            updates_dropped.inc()
+            logger.warning(f"Очередь обновлений переполнена ({self.pending}), обновление отброшено")
+            return None
+
+        queued = time.monotonic()
+        self.pending += 1
+        waiting = True
+
+        # Обновления вне чата (inline-запросы и т.п.) не упорядочиваются
+        chat = data.get("event_chat")
+        key = chat.id if chat is not None else None
+        queue = turn = None
+        if key is not None:
+            queue = self._chats.get(key)
+            if queue is None:
+                queue = self._chats[key] = deque()
+            turn = asyncio.get_running_loop().create_future()
+            queue.append(turn)
+            if len(queue) == 1:
+                turn.set_result(None)
+
+        try:
+            if turn is not None:
+                await turn
+            async with self._slots:
+                started = time.monotonic()
+                update_queue_time.observe(started - queued)
+                self.pending -= 1
+                waiting = False
+                self.in_flight += 1
+                try:
+                    return await handler(event, data)
+                finally:
+                    self.in_flight -= 1
+                    update_handle_time.observe(time.monotonic() - started)
+        finally:
+            if waiting:
+                # Задача отменена, пока ждала очереди
+                self.pending -= 1
+            if queue is not None:
+                self._release(key, queue, turn)
+
+    def _release(self, key, queue: Deque[asyncio.Future], turn: asyncio.Future):
+        """Передача очереди чата следующему обновлению"""
+        if queue[0] is turn:
+            queue.popleft()
+            if queue:
+                queue[0].set_result(None)
+            else:
+                del self._chats[key]
+        else:
+            queue.remove(turn)
+
+
+registry.callback(
+    "bot_updates_pending", "Обновления бота, ожидающие обработки", "gauge", (),
+    lambda: [((), sum(middleware.pending for middleware in list(_middlewares)))]
+)
+registry.callback(
+    "bot_updates_in_flight", "Обновления бота в обработке", "gauge", (),
+    lambda: [((), sum(middleware.in_flight for middleware in list(_middlewares)))]
+)
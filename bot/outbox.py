@@ -0,0 +1,360 @@
+"""
+Очередь исходящих сообщений бота с ограничением скорости.
+
+Telegram ограничивает бота примерно 30 сообщениями в секунду в сумме,
+одним сообщением в секунду в личный чат и 20 сообщениями в минуту в группу;
+при превышении Bot API отвечает 429 (TelegramRetryAfter). Outbox
+подключается к сессии бота как middleware запросов, поэтому через него
+проходят все отправки — и message.answer в обработчиках, и рассылки.
+
+Методы отправки и редактирования встают в очередь своего чата:
+  - порядок внутри чата сохраняется, одновременно в чат идет один запрос;
+  - запрос уходит, когда есть токен и в корзине чата, и в общей корзине;
+  - правка сообщения, которая еще ждет отправки, заменяется новой правкой
+    того же сообщения: уходит только последний текст, а все ожидающие
+    получают ее результат;
+  - на 429 чат приостанавливается на retry_after и запрос повторяется.
+Остальные методы (getUpdates, setWebhook, sendChatAction, ...) выполняются
+сразу.
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+import weakref
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.methods import TelegramMethod
+from api.services.metrics import registry
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Правки, которые можно склеить: новая полностью заменяет ожидающую
+COALESCED_METHODS = {"editMessageText", "editMessageCaption", "editMessageReplyMarkup", "editMessageMedia"}
+# Методы без исходящего сообщения в чат: лимиты Telegram их не учитывают
+UNTHROTTLED_METHODS = {"sendChatAction"}
+# Как часто удаляется состояние чатов без ожидающих запросов, сек
+SWEEP_INTERVAL = 10.0
+
+outbox_messages = registry.counter(
+    "telegram_outbox_requests_total",
+    "Запросы очереди исходящих сообщений по исходу (sent / coalesced / retried / failed)",
+    ("method", "outcome")
+)
+outbox_wait = registry.histogram(
+    "telegram_outbox_wait_seconds", "Время ожидания запроса в очереди исходящих сообщений", ("method",)
+)
+
+# Все очереди процесса (для метрик глубины)
+_outboxes: "weakref.WeakSet[Outbox]" = weakref.WeakSet()
+
+
+class OutboxFull(Exception):
+    """Очередь исходящих сообщений переполнена"""
+
+
+class TokenBucket:
+    """Корзина токенов: rate токенов в секунду, не больше capacity сразу"""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Через сколько секунд будет токен (0 — уже есть)"""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def consume(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class _Job:
+    """Запрос в очереди и ожидающие его результата (несколько — после склейки правок)"""
+
+    __slots__ = ("method", "make_request", "waiters", "enqueued", "attempts")
+
+    def __init__(self, method: TelegramMethod, make_request, future: asyncio.Future, now: float):
+        self.method = method
+        self.make_request = make_request
+        self.waiters: List[asyncio.Future] = [future]
+        self.enqueued = now
+        self.attempts = 0
+
+    @property
+    def name(self) -> str:
+        return self.method.__api_method__
+
+    @property
+    def edit_key(self) -> Optional[Tuple[str, Any]]:
+        if self.name in COALESCED_METHODS and getattr(self.method, "message_id", None) is not None:
+            return self.name, self.method.message_id
+        return None
+
+
+class _Chat:
+    __slots__ = ("bucket", "queue", "edits", "busy", "scheduled", "paused_until")
+
+    def __init__(self, bucket: TokenBucket):
+        self.bucket = bucket
+        self.queue: Deque[_Job] = deque()
+        # (метод, message_id) -> правка, ожидающая отправки
+        self.edits: Dict[Tuple[str, Any], _Job] = {}
+        self.busy = False
+        self.scheduled = False
+        self.paused_until = 0.0
+
+
+class Outbox(BaseRequestMiddleware):
+    """Планировщик исходящих запросов: подключение — bot.session.middleware(outbox)"""
+
+    def __init__(self, global_rate: float = 30.0, chat_rate: float = 1.0, chat_burst: float = 1.0,
+                 group_rate: float = 20 / 60, max_pending: int = 10000, max_retries: int = 5):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+
+        self.pending = 0
+        self._chats: Dict[Any, _Chat] = {}
+        self._global: Optional[TokenBucket] = None
+        # (время готовности, порядковый номер, chat_id)
+        self._ready: List[Tuple[float, int, Any]] = []
+        self._sequence = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._scheduler: Optional[asyncio.Task] = None
+        self._deliveries: set = set()
+        self._swept = 0.0
+        _outboxes.add(self)
+
+    async def __call__(self, make_request, bot, method: TelegramMethod):
+        name = method.__api_method__
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None or name in UNTHROTTLED_METHODS or not name.startswith(("send", "edit", "copy", "forward")):
+            return await make_request(bot, method)
+        return await self.submit(chat_id, method, lambda: make_request(bot, method))
+
+    def submit(self, chat_id, method: TelegramMethod, make_request) -> asyncio.Future:
+        """Постановка запроса в очередь чата; future — ответ Bot API (Response)"""
+        loop = asyncio.get_running_loop()
+        self._ensure_started()
+        now = time.monotonic()
+        future = loop.create_future()
+
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            rate = self.group_rate if isinstance(chat_id, int) and chat_id < 0 else self.chat_rate
+            chat = self._chats[chat_id] = _Chat(TokenBucket(rate, self.chat_burst, now))
+
+        job = _Job(method, make_request, future, now)
+        key = job.edit_key
+        if key is not None and key in chat.edits:
+            # Правка того же сообщения еще не ушла — отправится только последняя
+            waiting = chat.edits[key]
+            waiting.method = method
+            waiting.make_request = make_request
+            waiting.waiters.append(future)
+            outbox_messages.inc(job.name, "coalesced")
+            return future
+
+        if self.pending >= self.max_pending:
+            raise OutboxFull(f"В очереди исходящих сообщений {self.pending} запросов")
+
+        chat.queue.append(job)
+        if key is not None:
+            chat.edits[key] = job
+        self.pending += 1
+        self._schedule(chat_id, chat, now)
+        return future
+
+    def depth(self) -> Dict[str, int]:
+        """Число ожидающих запросов по методам"""
+        counts: Dict[str, int] = {}
+        for chat in self._chats.values():
+            for job in chat.queue:
+                counts[job.name] = counts.get(job.name, 0) + 1
+        return counts
+
+    async def close(self, timeout: float = 5.0):
+        """Ожидание отправки очереди не дольше timeout, затем отмена оставшегося"""
+        started = time.monotonic()
+        while (self.pending or self._deliveries) and time.monotonic() - started < timeout:
+            await asyncio.sleep(0.05)
+        if self.pending:
+            logger.warning(f"Не отправлено запросов из очереди: {self.pending}")
+        for chat in self._chats.values():
+            while chat.queue:
+                self._finish(chat.queue.popleft(), exception=asyncio.CancelledError())
+        self._chats.clear()
+        self.pending = 0
+        if self._scheduler is not None:
+            self._scheduler.cancel()
+            self._scheduler = None
+
+    # Планирование
+
+    def _ensure_started(self):
+        if self._scheduler is None or self._scheduler.done() \
+                or self._scheduler.get_loop() is not asyncio.get_running_loop():
+            self._wakeup = asyncio.Event()
+            # Общая корзина без запаса: сообщения во все чаты идут равномерно, и за любую
+            # секунду их уходит не больше global_rate (с запасом было бы до 2 * global_rate)
+            self._global = TokenBucket(self.global_rate, 1, time.monotonic())
+            self._scheduler = asyncio.create_task(self._run())
+
+    def _schedule(self, chat_id, chat: _Chat, now: float):
+        if chat.busy or chat.scheduled or not chat.queue:
+            return
+        chat.scheduled = True
+        heapq.heappush(self._ready, (max(now, chat.paused_until), next(self._sequence), chat_id))
+        self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            if not self._ready:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            now = time.monotonic()
+            ready_at, _, chat_id = self._ready[0]
+            if ready_at > now:
+                await self._sleep(ready_at - now)
+                continue
+
+            chat = self._chats[chat_id]
+            delay = max(chat.bucket.delay(now), chat.paused_until - now)
+            if delay > 0:
+                heapq.heapreplace(self._ready, (now + delay, next(self._sequence), chat_id))
+                continue
+
+            delay = self._global.delay(now)
+            if delay > 0:
+                await self._sleep(delay)
+                continue
+
+            heapq.heappop(self._ready)
+            chat.scheduled = False
+            chat.busy = True
+            chat.bucket.consume(now)
+            self._global.consume(now)
+
+            job = chat.queue.popleft()
+            self.pending -= 1
+            if chat.edits.get(job.edit_key) is job:
+                del chat.edits[job.edit_key]
+            outbox_wait.observe(now - job.enqueued, job.name)
+
+            task = asyncio.create_task(self._deliver(chat_id, chat, job))
+            self._deliveries.add(task)
+            task.add_done_callback(self._deliveries.discard)
+
+    async def _sleep(self, seconds: float):
+        """Пауза до срока, прерываемая новым запросом (он может быть готов раньше)"""
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _deliver(self, chat_id, chat: _Chat, job: _Job):
+        try:
+            response = await job.make_request()
+            outbox_messages.inc(job.name, "sent")
+            self._finish(job, result=response)
+        except TelegramRetryAfter as e:
+            job.attempts += 1
+            outbox_messages.inc(job.name, "retried")
+            if job.attempts > self.max_retries:
+                outbox_messages.inc(job.name, "failed")
+                self._finish(job, exception=e)
+            else:
+                logger.info(f"Лимит Telegram в чате {chat_id}: пауза {e.retry_after} с")
+                chat.paused_until = time.monotonic() + e.retry_after
+                self._requeue(chat, job)
+        except TelegramBadRequest as e:
+            if "message is not modified" in e.message:
+                # Склеенная правка совпала с текстом сообщения — это не ошибка
+                outbox_messages.inc(job.name, "sent")
+                self._finish(job, result=None)
+            else:
+                outbox_messages.inc(job.name, "failed")
+                self._finish(job, exception=e)
+        except Exception as e:
+            outbox_messages.inc(job.name, "failed")
+            self._finish(job, exception=e)
+        finally:
+            chat.busy = False
+            now = time.monotonic()
+            if chat.queue:
+                self._schedule(chat_id, chat, now)
+            if now - self._swept >= SWEEP_INTERVAL:
+                self._sweep(now)
+
+    def _sweep(self, now: float):
+        """Удаление чатов без запросов, чья корзина уже полна: новая корзина будет такой же"""
+        self._swept = now
+        idle = [chat_id for chat_id, chat in self._chats.items()
+                if not chat.queue and not chat.busy and not chat.scheduled
+                and chat.paused_until <= now and chat.bucket.full(now)]
+        for chat_id in idle:
+            del self._chats[chat_id]
+
+    def _requeue(self, chat: _Chat, job: _Job):
+        """Повтор в начале очереди чата; более новая ожидающая правка того же сообщения заменяет повтор"""
+        key = job.edit_key
+        newer = chat.edits.get(key) if key is not None else None
+        if newer is not None:
+            newer.waiters.extend(job.waiters)
+            return
+        chat.queue.appendleft(job)
+        if key is not None:
+            chat.edits[key] = job
+        self.pending += 1
+
+    @staticmethod
+    def _finish(job: _Job, result: Any = None, exception: Optional[BaseException] = None):
+        for future in job.waiters:
+            if future.done():
+                continue
+            if exception is not None:
+                future.set_exception(exception)
+            else:
+                future.set_result(result)
+
+
+def _collect_depth():
+    counts: Dict[str, int] = {}
+    for outbox in list(_outboxes):
+        for name, count in outbox.depth().items():
+            counts[name] = counts.get(name, 0) + count
+    return (((name,), count) for name, count in counts.items())
+
+
+registry.callback(
+    "telegram_outbox_queue_depth", "Запросы в очереди исходящих сообщений", "gauge", ("method",), _collect_depth
+)
+registry.callback(
+    "telegram_outbox_chats", "Чаты с ожидающими запросами", "gauge", (),
+    lambda: [((), sum(1 for outbox in list(_outboxes) for chat in outbox._chats.values() if chat.queue))]
+)
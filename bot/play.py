@@ -0,0 +1,161 @@
+"""
+Игра в чате: текст игрока — действие персонажа, ответ Мастера приходит
+потоком в одно сообщение, которое правится по мере генерации.
+
+Ходы выполняются теми же обработчиками, что и REST-роуты (как в
+WebSocket-канале api/routes/ws.py): фрагменты повествования DeepSeek
+передаются через narrative_listener в StreamingMessage. Правки идут не
+чаще BOT_STREAM_EDIT_INTERVAL: фрагменты, пришедшие между правками,
+попадают в следующую; лимиты Telegram соблюдает очередь bot/outbox.py.
+"""
+
+import asyncio
+import time
+from typing import Optional
+from aiogram import Bot, types
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, WebAppInfo
+from fastapi import HTTPException
+from database.database import SessionLocal, get_character_by_user_id, get_active_game_session
+from api.routes import game
+from api.services.deepseek import narrative_listener
+from config.settings import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Предел длины сообщения Telegram
+MESSAGE_LIMIT = 4096
+PLACEHOLDER = "🎲 Мастер обдумывает ход…"
+
+# Пользователи, чей ход сейчас выполняется (в процессе бота, см. bot/ordering.py). Сообщения
+# одного чата и так идут по очереди; это защита от одновременных ходов из разных чатов
+active_turns = set()
+
+
+def split_text(text: str, limit: int = MESSAGE_LIMIT):
+    """Части текста не длиннее limit, по возможности по границе абзаца"""
+    parts = []
+    while len(text) > limit:
+        cut = text.rfind("\n", 0, limit)
+        if cut <= 0:
+            cut = limit
+        parts.append(text[:cut])
+        text = text[cut:].lstrip("\n")
+    parts.append(text)
+    return parts
+
+
+class StreamingMessage:
+    """Сообщение, текст которого дописывается по мере поступления фрагментов"""
+
+    def __init__(self, bot: Bot, chat_id: int, interval: float = 1.0):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.interval = interval
+        self.message_id: Optional[int] = None
+        self.text = ""
+        self._shown = ""
+        self._last_edit = 0.0
+        self._flusher: Optional[asyncio.Task] = None
+
+    async def start(self):
+        message = await self.bot.send_message(self.chat_id, PLACEHOLDER)
+        self.message_id = message.message_id
+        self._last_edit = time.monotonic()
+
+    async def write(self, delta: str):
+        """Слушатель narrative_listener: фрагмент копится до следующей правки"""
+        self.text += delta
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush())
+
+    async def _flush(self):
+        await asyncio.sleep(max(0.0, self._last_edit + self.interval - time.monotonic()))
+        # Пока текст помещается в одно сообщение; продолжение отправит finish
+        text = self.text[:MESSAGE_LIMIT - 1] + "…" if len(self.text) >= MESSAGE_LIMIT else self.text + " ▌"
+        await self._edit(text)
+
+    async def _edit(self, text: str):
+        if text == self._shown or self.message_id is None:
+            return
+        self._last_edit = time.monotonic()
+        try:
+            await self.bot.edit_message_text(text, chat_id=self.chat_id, message_id=self.message_id)
+            self._shown = text
+        except Exception as e:
+            # Промежуточная правка не обязательна: окончательный текст придет в finish
+            logger.info(f"Правка сообщения {self.message_id} не удалась: {e}")
+
+    async def finish(self, text: str, reply_markup: Optional[InlineKeyboardMarkup] = None):
+        """Окончательный текст: правка сообщения и, если он длиннее лимита, продолжение"""
+        if self._flusher is not None:
+            self._flusher.cancel()
+        parts = split_text(text)
+        if self.message_id is None:
+            await self.start()
+        last = len(parts) - 1
+        await self.bot.edit_message_text(parts[0], chat_id=self.chat_id, message_id=self.message_id,
+                                         reply_markup=reply_markup if last == 0 else None)
+        for index, part in enumerate(parts[1:], start=1):
+            await self.bot.send_message(self.chat_id, part, reply_markup=reply_markup if index == last else None)
+
+
+def status_line(character) -> str:
+    return (f"❤️ {character.current_hit_points}/{character.hit_points}   "
+            f"✨ Hope {character.hope}   🌑 Fear {character.fear}")
+
+
+def new_character_keyboard() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[[
+        InlineKeyboardButton(text="🎲 Создать персонажа", web_app=WebAppInfo(url=f"{settings.webapp_url}/new_character"))
+    ]])
+
+
+async def play_turn(message: types.Message, roll: bool = False):
+    """Ход из чата: текст — действие (первое сообщение начинает сессию), roll — бросок костей"""
+    user_id = message.from_user.id
+    if user_id in active_turns:
+        await message.answer("⏳ Мастер еще отвечает на прошлый ход")
+        return
+
+    active_turns.add(user_id)
+    db = SessionLocal()
+    stream = StreamingMessage(message.bot, message.chat.id, settings.BOT_STREAM_EDIT_INTERVAL)
+    token = narrative_listener.set(stream.write)
+    try:
+        character = get_character_by_user_id(db, user_id)
+        if not character:
+            await message.answer("🧙 Чтобы играть в чате, сначала создай персонажа",
+                                 reply_markup=new_character_keyboard())
+            return
+
+        session = get_active_game_session(db, user_id)
+        await stream.start()
+
+        if session is None:
+            response = await game.start_game_session(
+                game.GameStartRequest(characterId=character.id, userId=user_id), db)
+        elif roll:
+            response = await game.roll_dice(
+                game.DiceRollRequest(characterId=character.id, userId=user_id), db)
+        else:
+            response = await game.perform_action(
+                game.GameActionRequest(characterId=character.id, userId=user_id, action=message.text), db)
+
+        text = response.narrative or ""
+        last_roll = (response.game_state.game_state or {}).get("last_roll") if response.game_state else None
+        if roll and last_roll:
+            text = f"🎲 Hope {last_roll['hope_die']} · Fear {last_roll['fear_die']} — {last_roll['description']}\n\n{text}"
+        if response.character:
+            text += "\n\n" + status_line(response.character)
+        await stream.finish(text + "\n\nНапиши, что делает персонаж, или /roll — бросок костей")
+
+    except HTTPException as e:
+        await stream.finish(f"⚠️ {e.detail}")
+    except Exception as e:
+        logger.error(f"Ошибка хода в чате: {e}")
+        await stream.finish("⚠️ Мастер задумался и потерял нить. Попробуй еще раз")
+    finally:
+        narrative_listener.reset(token)
+        db.close()
+        active_turns.discard(user_id)
@@ -0,0 +1,274 @@
+"""
+Проверка режима webhook без Telegram.
+
+sample — файл обновлений (JSONL) от нескольких пользователей: команды
+/start, /help, /profile и произвольный текст.
+
+send — отправка обновлений из файла на маршрут webhook с заголовком
+X-Telegram-Bot-Api-Secret-Token, как это делает Telegram; по итогам —
+статусы ответов и задержка (медиана и 99-й перцентиль).
+
+stub — заглушка Bot API: отвечает на любой метод, на sendMessage и
+editMessageText возвращает сообщение. API запускается с
+TELEGRAM_API_URL=http://127.0.0.1:8081, и ответы бота уходят в заглушку,
+а не в Telegram. С --chat-rate / --global-rate заглушка, как Telegram,
+отвечает 429 на отправку сверх лимита (нагрузочная проверка bot/outbox.py).
+
+Запуск:
+  python -m bot.replay stub [--port 8081] [--chat-rate 1 --global-rate 30 --latency 0.05]
+  python -m bot.replay sample -o updates.jsonl [--count 1000] [--users 50]
+  python -m bot.replay send updates.jsonl [--url http://127.0.0.1:8000/telegram/webhook] [--concurrency 20]
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import statistics
+import sys
+import threading
+import time
+from collections import Counter, deque
+from typing import Deque, Dict, List
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+SAMPLE_TEXTS = ("/start", "/help", "/profile", "Осматриваю таверну", "Иду к воротам города")
+
+
+def make_update(update_id: int, user_id: int, text: str) -> dict:
+    """Обновление с текстовым сообщением в личном чате"""
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private", "first_name": f"Игрок {user_id}"},
+        "from": {"id": user_id, "is_bot": False, "first_name": f"Игрок {user_id}"},
+        "text": text
+    }
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return {"update_id": update_id, "message": message}
+
+
+def read_updates(path: str) -> list:
+    """Обновления из JSONL или JSON-массива (например, ответа getUpdates)"""
+    with open(path, "r", encoding="utf-8") as file:
+        content = file.read()
+    stripped = content.lstrip()
+    if stripped.startswith("["):
+        return json.loads(content)
+    if stripped.startswith("{\"ok\""):
+        return json.loads(content)["result"]
+    return [json.loads(line) for line in content.splitlines() if line.strip()]
+
+
+# --- Заглушка Bot API ---
+
+class StubState:
+    """Счетчики заглушки и, если заданы, лимиты Telegram на отправку сообщений.
+
+    Лимиты проверяются как у Telegram: не чаще chat_rate в секунду в один чат
+    и не больше global_rate за последнюю секунду во все чаты; при
+    превышении — 429 с retry_after. Допуск 10% на разброс сетевой задержки.
+    """
+
+    TOLERANCE = 0.9
+
+    def __init__(self, chat_rate: float = 0.0, global_rate: float = 0.0, latency: float = 0.0):
+        self.lock = threading.Lock()
+        self.calls = Counter()
+        self.message_id = 0
+        self.chat_rate = chat_rate
+        self.global_rate = global_rate
+        self.latency = latency
+        self.rejected = 0
+        # chat_id -> время последнего принятого сообщения
+        self.last_sent: Dict[str, float] = {}
+        self.recent: Deque[float] = deque()
+        # chat_id -> тексты в порядке приема (для проверки порядка)
+        self.texts: Dict[str, List[str]] = {}
+
+    def admit(self, chat_id: str, now: float) -> float:
+        """0 — сообщение принято, иначе через сколько секунд можно повторить"""
+        with self.lock:
+            if self.chat_rate and chat_id in self.last_sent:
+                wait = self.TOLERANCE / self.chat_rate - (now - self.last_sent[chat_id])
+                if wait > 0:
+                    self.rejected += 1
+                    return wait
+            if self.global_rate:
+                while self.recent and self.recent[0] <= now - 1:
+                    self.recent.popleft()
+                if len(self.recent) >= self.global_rate / self.TOLERANCE:
+                    self.rejected += 1
+                    return self.recent[0] + 1 - now
+                self.recent.append(now)
+            self.last_sent[chat_id] = now
+            return 0.0
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """POST /bot<token>/<method> с полями формы, как их отправляет aiogram"""
+
+    state: StubState = None
+
+    def do_POST(self):
+        method = self.path.rstrip("/").rsplit("/", 1)[-1]
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length).decode("utf-8", errors="replace")
+        fields = {key: values[0] for key, values in parse_qs(body).items()}
+
+        if self.state.latency:
+            time.sleep(self.state.latency)
+
+        if method.startswith(("send", "edit")) and method != "sendChatAction":
+            wait = self.state.admit(fields.get("chat_id", ""), time.monotonic())
+            if wait > 0:
+                retry_after = max(1, math.ceil(wait))
+                self._reply(429, {
+                    "ok": False, "error_code": 429,
+                    "description": f"Too Many Requests: retry after {retry_after}",
+                    "parameters": {"retry_after": retry_after}
+                })
+                return
+
+        with self.state.lock:
+            self.state.calls[method] += 1
+            self.state.message_id += 1
+            message_id = self.state.message_id
+            if "text" in fields:
+                self.state.texts.setdefault(fields.get("chat_id", ""), []).append(fields["text"])
+
+        if method in ("sendMessage", "editMessageText"):
+            chat_id = int(fields.get("chat_id") or 0)
+            result = {
+                "message_id": int(fields.get("message_id") or message_id),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": fields.get("text", "")
+            }
+        elif method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Daggerheart", "username": "daggerheart_stub_bot"}
+        else:
+            result = True
+
+        self._reply(200, {"ok": True, "result": result})
+
+    def _reply(self, status: int, data: dict):
+        payload = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub(host: str = "127.0.0.1", port: int = 8081, chat_rate: float = 0.0,
+               global_rate: float = 0.0, latency: float = 0.0):
+    """Заглушка Bot API в фоновом потоке; возвращает сервер и его состояние (счетчики вызовов)"""
+    state = StubState(chat_rate, global_rate, latency)
+    handler = type("Handler", (StubHandler,), {"state": state})
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, name="bot-api-stub", daemon=True).start()
+    return server, state
+
+
+# --- Отправка обновлений ---
+
+async def send_updates(updates: list, url: str, secret: str, concurrency: int) -> dict:
+    import httpx
+
+    statuses = Counter()
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(timeout=30) as client:
+        async def send(update):
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    response = await client.post(url, json=update,
+                                                 headers={"X-Telegram-Bot-Api-Secret-Token": secret})
+                    statuses[response.status_code] += 1
+                except Exception as e:
+                    statuses[type(e).__name__] += 1
+                    return
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(send(update) for update in updates))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "updates": len(updates),
+        "seconds": elapsed,
+        "statuses": dict(statuses),
+        "median_ms": statistics.median(latencies) * 1000 if latencies else None,
+        "p99_ms": latencies[max(int(len(latencies) * 0.99) - 1, 0)] * 1000 if latencies else None
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Проверка режима webhook без Telegram")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    stub_parser = commands.add_parser("stub", help="Заглушка Bot API")
+    stub_parser.add_argument("--host", default="127.0.0.1")
+    stub_parser.add_argument("--port", type=int, default=8081)
+    stub_parser.add_argument("--chat-rate", type=float, default=0.0, help="Лимит сообщений в секунду в чат (0 — без лимита)")
+    stub_parser.add_argument("--global-rate", type=float, default=0.0, help="Лимит сообщений в секунду во все чаты")
+    stub_parser.add_argument("--latency", type=float, default=0.0, help="Задержка ответа, сек")
+
+    sample_parser = commands.add_parser("sample", help="Файл примерных обновлений")
+    sample_parser.add_argument("-o", "--output", required=True)
+    sample_parser.add_argument("--count", type=int, default=1000)
+    sample_parser.add_argument("--users", type=int, default=50)
+
+    send_parser = commands.add_parser("send", help="Отправка обновлений на маршрут webhook")
+    send_parser.add_argument("file")
+    send_parser.add_argument("--url", help="Адрес webhook (по умолчанию из настроек)")
+    send_parser.add_argument("--secret", help="Секрет (по умолчанию из настроек)")
+    send_parser.add_argument("--concurrency", type=int, default=20)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "stub":
+        server, state = start_stub(args.host, args.port, args.chat_rate, args.global_rate, args.latency)
+        print(f"Заглушка Bot API: http://{args.host}:{args.port} (TELEGRAM_API_URL для API)", flush=True)
+        try:
+            while True:
+                time.sleep(10)
+                if state.calls:
+                    print(f"Вызовы: {dict(state.calls)}, отклонено по лимиту: {state.rejected}", flush=True)
+        except KeyboardInterrupt:
+            server.shutdown()
+        return 0
+
+    if args.command == "sample":
+        with open(args.output, "w", encoding="utf-8") as output:
+            for update_id in range(1, args.count + 1):
+                update = make_update(update_id, random.randint(1, args.users), random.choice(SAMPLE_TEXTS))
+                output.write(json.dumps(update, ensure_ascii=False) + "\n")
+        print(f"Записано обновлений: {args.count} в {args.output}")
+        return 0
+
+    url, secret = args.url, args.secret
+    if url is None or secret is None:
+        # Настройки и секрет — как у запущенного API (тот же .env)
+        from config.settings import settings
+        from bot.webhook import secret_token
+        url = url or f"http://127.0.0.1:{settings.API_PORT}{settings.WEBHOOK_PATH}"
+        secret = secret or secret_token()
+
+    report = asyncio.run(send_updates(read_updates(args.file), url, secret, args.concurrency))
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 0 if set(report["statuses"]) == {200} else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
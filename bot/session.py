@@ -0,0 +1,87 @@
+"""
+HTTP-сессии бота.
+
+В режиме webhook бот работает внутри процесса API: запросы к Bot API идут
+через httpx (как запросы к DeepSeek) в том же event loop, без второго
+HTTP-стека aiohttp. В режиме polling — стандартная сессия aiogram.
+"""
+
+from typing import Any, AsyncGenerator, Dict, Optional, cast
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.session.base import BaseSession
+from aiogram.client.telegram import PRODUCTION, TelegramAPIServer
+from aiogram.exceptions import TelegramNetworkError
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import TelegramType
+from config.settings import settings
+
+# Соединений с Bot API на процесс
+MAX_CONNECTIONS = 32
+
+
+class HttpxSession(BaseSession):
+    """Сессия aiogram поверх httpx.AsyncClient"""
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        self._client = None
+
+    def _get_client(self):
+        if self._client is None or self._client.is_closed:
+            import httpx
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS)
+            )
+        return self._client
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def make_request(self, bot: Bot, method: TelegramMethod[TelegramType],
+                           timeout: Optional[int] = None) -> TelegramType:
+        import httpx
+
+        url = self.api.api_url(token=bot.token, method=method.__api_method__)
+        data: Dict[str, str] = {}
+        input_files: Dict[str, Any] = {}
+        for key, value in method.model_dump(warnings=False).items():
+            value = self.prepare_value(value, bot=bot, files=input_files)
+            if value:
+                data[key] = value
+        files = {
+            key: (value.filename or key, b"".join([chunk async for chunk in value.read(bot)]))
+            for key, value in input_files.items()
+        }
+
+        try:
+            response = await self._get_client().post(
+                url, data=data, files=files or None, timeout=self.timeout if timeout is None else timeout
+            )
+        except httpx.TimeoutException:
+            raise TelegramNetworkError(method=method, message="Request timeout error")
+        except httpx.HTTPError as e:
+            raise TelegramNetworkError(method=method, message=f"{type(e).__name__}: {e}")
+
+        result = self.check_response(bot=bot, method=method, status_code=response.status_code, content=response.text)
+        return cast(TelegramType, result.result)
+
+    async def stream_content(self, url: str, headers: Optional[Dict[str, Any]] = None, timeout: int = 30,
+                             chunk_size: int = 65536, raise_for_status: bool = True) -> AsyncGenerator[bytes, None]:
+        async with self._get_client().stream("GET", url, headers=headers or {}, timeout=timeout) as response:
+            if raise_for_status:
+                response.raise_for_status()
+            async for chunk in response.aiter_bytes(chunk_size):
+                yield chunk
+
+
+def create_session() -> BaseSession:
+    """Сессия по режиму бота; TELEGRAM_API_URL перенаправляет запросы (например, на локальную заглушку)"""
+    api = TelegramAPIServer.from_base(settings.TELEGRAM_API_URL) if settings.TELEGRAM_API_URL else PRODUCTION
+    if settings.BOT_MODE == "webhook":
+        return HttpxSession(api=api)
+    return AiohttpSession(api=api)
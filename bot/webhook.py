@@ -0,0 +1,105 @@
+"""
+Режим webhook: Telegram присылает обновления на маршрут API, диспетчер
+aiogram обрабатывает их в event loop рабочего процесса API — с общим пулом
+соединений базы данных и без отдельного процесса бота.
+
+Модуль импортируется api/main.py только при BOT_MODE=webhook: импорт
+aiogram занимает заметное время и в режиме polling не нужен.
+"""
+
+import asyncio
+import hashlib
+import secrets
+from typing import Optional
+from fastapi import APIRouter, Header, HTTPException, Request
+from aiogram.types import Update
+from api.services.lifecycle import lifecycle
+from bot.main import bot, dp, outbox
+from config.settings import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# Webhook уже зарегистрирован (супервизором до fork или этим процессом)
+registered = False
+
+
+def secret_token() -> str:
+    """Секрет заголовка X-Telegram-Bot-Api-Secret-Token: WEBHOOK_SECRET или производный от токена бота.
+
+    Производный секрет одинаков во всех рабочих процессах и не раскрывает BOT_TOKEN.
+    """
+    return settings.WEBHOOK_SECRET or hashlib.sha256(f"webhook:{settings.BOT_TOKEN}".encode()).hexdigest()
+
+
+async def register() -> bool:
+    """Регистрация адреса webhook в Telegram"""
+    global registered
+    try:
+        await bot.set_webhook(
+            settings.webhook_url,
+            secret_token=secret_token(),
+            allowed_updates=dp.resolve_used_update_types(),
+            drop_pending_updates=False
+        )
+        registered = True
+        logger.info(f"Webhook зарегистрирован: {settings.webhook_url}")
+    except Exception as e:
+        logger.error(f"Ошибка регистрации webhook: {e}")
+    return registered
+
+
+async def register_before_fork():
+    """Регистрация в процессе-супервизоре: рабочие процессы не повторяют запрос к Telegram.
+
+    HTTP-клиент закрывается вместе с временным event loop, рабочие процессы создадут свои.
+    """
+    try:
+        await register()
+    finally:
+        await bot.session.close()
+
+
+async def startup():
+    if not registered:
+        await register()
+
+
+async def shutdown():
+    # Ответы, которые еще ждут лимита Telegram, отправляются до закрытия соединений
+    await outbox.close(settings.SHUTDOWN_TIMEOUT)
+    await bot.session.close()
+
+
+async def _process(update: Update):
+    try:
+        await dp.feed_update(bot, update)
+    except Exception as e:
+        logger.error(f"Ошибка обработки обновления {update.update_id}: {e}")
+
+
+@router.post(settings.WEBHOOK_PATH, include_in_schema=False)
+async def telegram_webhook(request: Request,
+                           x_telegram_bot_api_secret_token: Optional[str] = Header(None)):
+    """Прием обновления от Telegram.
+
+    Ответ отдается сразу, обработка идет в фоне: Telegram не ждет ответа DeepSeek
+    и не повторяет доставку по таймауту. При остановке процесса — 503, и Telegram
+    доставит обновление повторно другому процессу.
+    """
+    if not x_telegram_bot_api_secret_token or \
+            not secrets.compare_digest(x_telegram_bot_api_secret_token, secret_token()):
+        raise HTTPException(status_code=403, detail="Нет доступа")
+
+    if lifecycle.draining:
+        raise HTTPException(status_code=503, detail="Сервер останавливается")
+
+    try:
+        update = Update.model_validate(await request.json(), context={"bot": bot})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Некорректное обновление: {e}")
+
+    lifecycle.track(asyncio.create_task(_process(update)))
+    return {"ok": True}
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Сборка статики Telegram Mini App
+
+Минифицирует CSS/JS, добавляет хэш содержимого в имена файлов, заранее
+сжимает все файлы (gzip и, если установлен пакет brotli, br) и переписывает
+ссылки в index.html. Результат складывается в webapp/dist и раздается
+api.static.PrecompressedStaticFiles с долгим кэшированием.
+
+Запуск: python build_webapp.py [--base /webapp/]
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import re
+import shutil
+import sys
+from pathlib import Path
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ROOT = Path(__file__).parent
+SOURCE_DIR = ROOT / "webapp"
+DIST_DIR = SOURCE_DIR / "dist"
+
+# Ресурсы, на которые ссылается index.html
+ASSETS = ["css/style.css", "js/telegram.js", "js/app.js"]
+
+# Профиль медленной мобильной сети для оценки времени загрузки
+SLOW_NETWORK_KBIT = 400
+SLOW_NETWORK_RTT = 0.4
+
+
+def minify_css(source: str) -> str:
+    """Удаление комментариев и лишних пробелов в CSS"""
+    source = re.sub(r"/\*.*?\*/", "", source, flags=re.S)
+    source = re.sub(r"\s+", " ", source)
+    source = re.sub(r"\s*([{};:,>])\s*", r"\1", source)
+    return source.replace(";}", "}").strip()
+
+
+def minify_js(source: str) -> str:
+    """Консервативная минификация JS: комментарии и отступы, переносы строк сохраняются.
+
+    Строки внутри шаблонных литералов (`...`) не трогаем.
+    """
+    source = re.sub(r"^\s*/\*.*?\*/[ \t]*\n", "", source, flags=re.S | re.M)
+
+    lines = []
+    in_template = False
+    for line in source.splitlines():
+        if in_template:
+            lines.append(line)
+        else:
+            stripped = line.strip()
+            if stripped and not stripped.startswith("//"):
+                lines.append(stripped)
+        if (line.count("`") - line.count("\\`")) % 2:
+            in_template = not in_template
+
+    return "\n".join(lines) + "\n"
+
+
+def fingerprint(path: str, content: bytes) -> str:
+    """style.css -> style.<hash>.css"""
+    digest = hashlib.sha256(content).hexdigest()[:12]
+    stem, dot, ext = path.rpartition(".")
+    return f"{stem}.{digest}.{ext}"
+
+
+def write_variants(path: Path, content: bytes):
+    """Файл плюс заранее сжатые .gz и .br версии"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+    sizes = {"raw": len(content)}
+
+    # mtime=0 делает сборку воспроизводимой
+    gz = gzip.compress(content, compresslevel=9, mtime=0)
+    Path(f"{path}.gz").write_bytes(gz)
+    sizes["gzip"] = len(gz)
+
+    if brotli is not None:
+        br = brotli.compress(content, quality=11)
+        Path(f"{path}.br").write_bytes(br)
+        sizes["br"] = len(br)
+
+    return sizes
+
+
+def transfer_time(total_bytes: int, requests: int) -> float:
+    """Оценка времени загрузки: задержка на волну запросов + передача данных"""
+    waves = 1 + (1 if requests > 1 else 0)  # index.html, затем ресурсы параллельно
+    return waves * SLOW_NETWORK_RTT + total_bytes * 8 / (SLOW_NETWORK_KBIT * 1000)
+
+
+def build(base: str):
+    if DIST_DIR.exists():
+        shutil.rmtree(DIST_DIR)
+    DIST_DIR.mkdir(parents=True)
+
+    manifest = {}
+    report = []
+
+    for asset in ASSETS:
+        source = (SOURCE_DIR / asset).read_text(encoding="utf-8")
+        minified = minify_css(source) if asset.endswith(".css") else minify_js(source)
+        content = minified.encode("utf-8")
+
+        hashed = fingerprint(asset, content)
+        sizes = write_variants(DIST_DIR / hashed, content)
+        manifest[asset] = hashed
+        report.append((asset, len(source.encode("utf-8")), sizes))
+
+    # Переписываем ссылки в index.html на хэшированные имена
+    html = (SOURCE_DIR / "index.html").read_text(encoding="utf-8")
+    for asset, hashed in manifest.items():
+        html = re.sub(rf'(src|href)="(\./)?{re.escape(asset)}"', rf'\1="{base}{hashed}"', html)
+    sizes = write_variants(DIST_DIR / "index.html", html.encode("utf-8"))
+    report.append(("index.html", (SOURCE_DIR / "index.html").stat().st_size, sizes))
+
+    (DIST_DIR / "manifest.json").write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    print_report(report)
+
+
+def print_report(report):
+    best = "br" if brotli is not None else "gzip"
+
+    print(f"{'Файл':<16}{'исходный':>10}{'минифиц.':>10}{'gzip':>8}{'br':>8}")
+    for name, original, sizes in report:
+        print(f"{name:<16}{original:>10}{sizes['raw']:>10}{sizes['gzip']:>8}{sizes.get('br', '-'):>8}")
+
+    before = sum(original for _, original, _ in report)
+    after = sum(sizes[best] for _, _, sizes in report)
+    index_after = next(sizes[best] for name, _, sizes in report if name == "index.html")
+    requests = len(report)
+
+    print()
+    print(f"Передача при первом открытии: {before} -> {after} байт ({best})")
+    print(f"Оценка загрузки ({SLOW_NETWORK_KBIT} кбит/с, RTT {SLOW_NETWORK_RTT * 1000:.0f} мс):")
+    print(f"  первое открытие:    {transfer_time(before, requests):.2f} с -> {transfer_time(after, requests):.2f} с")
+    # Без кэш-заголовков повторное открытие скачивает все заново,
+    # с immutable-ресурсами остается только index.html
+    print(f"  повторное открытие: {transfer_time(before, requests):.2f} с -> {transfer_time(index_after, 1):.2f} с")
+    if brotli is None:
+        print("\nПакет brotli не установлен: .br версии не созданы (pip install brotli)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сборка статики Mini App")
+    parser.add_argument("--base", default="/webapp/", help="URL, по которому смонтирована статика")
+    args = parser.parse_args()
+
+    build(args.base if args.base.endswith("/") else args.base + "/")
+    print(f"\nГотово: {DIST_DIR}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -18,6 +18,12 @@ class Settings(BaseSettings):
     # API Server
     API_HOST: str = Field(default="0.0.0.0", description="API Host")
     API_PORT: int = Field(default=int(os.getenv("PORT", 8000)), description="API Port")
+    API_WORKERS: int = Field(default=0, description="Число рабочих процессов API в run.py (0 — по числу ядер; при BOT_MODE=webhook — всегда 1)")
+    WORKER_HEARTBEAT_TIMEOUT: float = Field(default=30.0, description="Перезапуск рабочего процесса, если его event loop не отвечает дольше, сек")
+    WORKER_STATE_DIR: str = Field(default="", description="Каталог общего состояния рабочих процессов: метрики и профилирование (пусто — run.py создает временный)")
+    WORKER_SYNC_INTERVAL: float = Field(default=1.0, description="Как часто рабочий процесс записывает метрики и проверяет команды профилировщика, сек")
+    WARMUP_SESSIONS: int = Field(default=100, description="Сколько недавно активных сессий загрузить в кэш после запуска")
+    SHUTDOWN_TIMEOUT: float = Field(default=30.0, description="Сколько ждать завершения запросов и ходов при остановке, сек")
 
     # WebApp - автоматически определяем URL в продакшене
     WEBAPP_URL: str = Field(default="", description="WebApp URL")
@@ -25,26 +31,69 @@ class Settings(BaseSettings):
     # Game Settings
     MAX_HOPE: int = Field(default=10, description="Максимальное количество Hope")
     MAX_FEAR: int = Field(default=10, description="Максимальное количество Fear")
+    RESPONSE_CACHE_SIZE: int = Field(default=10000, description="Сколько пользователей держать в кэше ответов")
+    RESPONSE_CACHE_TTL: float = Field(default=5.0, description="Время жизни кэшированного ответа, сек")
+    PROFILE_CARD_CACHE_SIZE: int = Field(default=10000, description="Сколько карточек профиля персонажей держать в памяти")
+    EVENT_SNAPSHOT_INTERVAL: int = Field(default=50, description="Снимок состояния сессии каждые N событий")
+    HISTORY_PAGE_SIZE: int = Field(default=50, description="Записей истории сессии на странице по умолчанию")
+    HISTORY_MAX_PAGE_SIZE: int = Field(default=200, description="Максимум записей истории сессии на странице")
+    DICE_POOL_BLOCK_SIZE: int = Field(default=1024, description="Размер блока заранее сгенерированных бросков")
+    WS_HEARTBEAT_INTERVAL: float = Field(default=20.0, description="Интервал ping в WebSocket-канале, сек")
+    WS_REPLAY_BUFFER: int = Field(default=200, description="Сколько сообщений канала хранить для переподключения")
+    WS_SEND_QUEUE: int = Field(default=64, description="Размер очереди отправки в WebSocket-канал")
+    IDEMPOTENCY_CACHE_SIZE: int = Field(default=10000, description="Сколько ответов по Idempotency-Key держать в памяти")
+    IDEMPOTENCY_TTL: int = Field(default=86400, description="Время хранения ответов по Idempotency-Key, сек")
+    IDEMPOTENCY_CLAIM_TIMEOUT: float = Field(default=120.0, description="Через сколько секунд незавершенный запрос с Idempotency-Key считается брошенным, сек")
+    IDEMPOTENCY_POLL_INTERVAL: float = Field(default=0.2, description="Интервал проверки ответа дубликатом, чей ключ занят другим процессом, сек")
+    USER_LOCK_SHARDS: int = Field(default=256, description="Число шардов таблицы блокировок пользователей")
+    DEEPSEEK_MAX_CONCURRENCY: int = Field(default=8, description="Максимум одновременных запросов к DeepSeek")
+    SERVER_TIMING_ENABLED: bool = Field(default=True, description="Отдавать заголовок Server-Timing с этапами запроса")
+    TRACE_SAMPLE_RATE: float = Field(default=0.01, description="Доля запросов, для которых выгружаются спаны")
+    TRACE_EXPORT_PATH: str = Field(default="", description="Файл JSON lines для трассировок (пусто — не выгружать)")
+    ADMIN_TOKEN: str = Field(default="", description="Токен административных эндпоинтов (пусто — отключены)")
+    PROFILER_SAMPLE_INTERVAL: float = Field(default=0.005, description="Интервал сэмплирования при профилировании запросов, сек")
+    PROFILER_CONTINUOUS_INTERVAL: float = Field(default=0.1, description="Интервал постоянного сэмплирования, сек")
+    BOT_MODE: str = Field(default="polling", description="Получение обновлений Telegram: polling (отдельный процесс) или webhook (маршрут API)")
+    WEBHOOK_PATH: str = Field(default="/telegram/webhook", description="Путь маршрута webhook в API")
+    WEBHOOK_BASE_URL: str = Field(default="", description="Внешний адрес API для webhook (пусто — по переменным хостинга)")
+    WEBHOOK_SECRET: str = Field(default="", description="Секрет заголовка X-Telegram-Bot-Api-Secret-Token (пусто — производный от BOT_TOKEN)")
+    TELEGRAM_API_URL: str = Field(default="", description="Адрес Bot API (пусто — api.telegram.org; для локальной проверки — заглушка)")
+    TELEGRAM_GLOBAL_RATE: float = Field(default=30.0, description="Исходящих сообщений бота в секунду во все чаты")
+    TELEGRAM_CHAT_RATE: float = Field(default=1.0, description="Исходящих сообщений в секунду в личный чат")
+    TELEGRAM_CHAT_BURST: float = Field(default=1.0, description="Сколько сообщений в чат можно отправить подряд без ожидания")
+    TELEGRAM_GROUP_RATE: float = Field(default=20 / 60, description="Исходящих сообщений в секунду в групповой чат")
+    BOT_MAX_IN_FLIGHT: int = Field(default=64, description="Сколько обновлений бот обрабатывает одновременно во всех чатах")
+    BOT_MAX_PENDING_UPDATES: int = Field(default=10000, description="Максимум обновлений бота, ожидающих обработки")
+    BOT_STREAM_EDIT_INTERVAL: float = Field(default=1.0, description="Интервал правок сообщения с потоковым ответом Мастера в чате, сек")
+    TELEGRAM_OUTBOX_MAX_PENDING: int = Field(default=10000, description="Максимум запросов в очереди исходящих сообщений")
 
     @property
-    def webapp_url(self) -> str:
-        """Автоматическое определение URL веб-приложения"""
-        if self.WEBAPP_URL:
-            return self.WEBAPP_URL
-
-        # Определяем URL на основе переменных окружения хостинга
+    def public_url(self) -> str:
+        """Внешний адрес приложения по переменным окружения хостинга"""
         railway_url = os.getenv("RAILWAY_STATIC_URL")
         render_url = os.getenv("RENDER_EXTERNAL_URL")
         heroku_url = os.getenv("HEROKU_APP_NAME")
 
         if railway_url:
-            return f"{railway_url}/webapp"
+            return railway_url
         elif render_url:
-            return f"{render_url}/webapp"
+            return render_url
         elif heroku_url:
-            return f"https://{heroku_url}.herokuapp.com/webapp"
+            return f"https://{heroku_url}.herokuapp.com"
         else:
-            return f"http://{self.API_HOST}:{self.API_PORT}/webapp"
+            return f"http://{self.API_HOST}:{self.API_PORT}"
+
+    @property
+    def webapp_url(self) -> str:
+        """Автоматическое определение URL веб-приложения"""
+        if self.WEBAPP_URL:
+            return self.WEBAPP_URL
+        return f"{self.public_url}/webapp"
+
+    @property
+    def webhook_url(self) -> str:
+        """Адрес, на который Telegram отправляет обновления в режиме webhook"""
+        return f"{self.WEBHOOK_BASE_URL or self.public_url}{self.WEBHOOK_PATH}"
 
     class Config:
         env_file = ".env"
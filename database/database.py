@@ -1,7 +1,9 @@
-from sqlalchemy import create_engine
+import os
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from config.settings import settings
+from database.errors import ConcurrentUpdateError
 import logging
 
 logger = logging.getLogger(__name__)
@@ -12,11 +14,93 @@ engine = create_engine(
     connect_args={"check_same_thread": False} if "sqlite" in settings.DATABASE_URL else {}
 )
 
-# Создание сессии
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Соединения пула, открытые до fork (run.py), в рабочих процессах не используются
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=lambda: engine.dispose(close=False))
+
+if "sqlite" in settings.DATABASE_URL:
+    @event.listens_for(engine, "connect")
+    def _enable_wal(dbapi_connection, connection_record):
+        """WAL: чтение не ждет записи из другого рабочего процесса"""
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.close()
+
+# Создание сессии (объекты не сбрасываются после commit, чтобы не перечитывать их при сериализации)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
 
 Base = declarative_base()
 
+# Подписчики на изменения данных пользователей (например, сброс кэшей ответов)
+_user_write_listeners = []
+
+
+def on_user_write(callback):
+    """Регистрация callback(user_id), вызываемого после commit изменений пользователя"""
+    _user_write_listeners.append(callback)
+    return callback
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _collect_written_users(db, flush_context):
+    """Запоминаем пользователей, чьи строки менялись в этой транзакции"""
+    written = db.info.setdefault("written_user_ids", set())
+    for obj in list(db.new) + list(db.dirty) + list(db.deleted):
+        user_id = getattr(obj, "user_id", None)
+        if user_id is not None:
+            written.add(user_id)
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _notify_user_writes(db):
+    for user_id in db.info.pop("written_user_ids", ()):
+        for callback in _user_write_listeners:
+            callback(user_id)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _forget_user_writes(db):
+    db.info.pop("written_user_ids", None)
+
+
+def _commit(db):
+    """Commit с проверкой версий строк (UPDATE ... WHERE version = ?)"""
+    from sqlalchemy.exc import IntegrityError
+    from sqlalchemy.orm.exc import StaleDataError
+
+    try:
+        db.commit()
+    except StaleDataError as e:
+        db.rollback()
+        raise ConcurrentUpdateError(str(e)) from e
+    except IntegrityError as e:
+        db.rollback()
+        raise ConcurrentUpdateError(str(e.orig)) from e
+
+
+def _flush(db):
+    """Flush без commit с той же проверкой версий: изменения войдут в следующий commit"""
+    from sqlalchemy.exc import IntegrityError
+    from sqlalchemy.orm.exc import StaleDataError
+
+    try:
+        db.flush()
+    except StaleDataError as e:
+        db.rollback()
+        raise ConcurrentUpdateError(str(e)) from e
+    except IntegrityError as e:
+        db.rollback()
+        raise ConcurrentUpdateError(str(e.orig)) from e
+
+
+def release_connection(db):
+    """Завершение транзакции перед долгим ожиданием (запрос к DeepSeek).
+
+    Загруженные объекты остаются доступны (expire_on_commit=False), а соединение
+    возвращается в пул и не простаивает, пока ход ждет повествования.
+    """
+    _commit(db)
+
 
 # Зависимость для получения сессии базы данных
 def get_db():
@@ -27,13 +111,126 @@ def get_db():
         db.close()
 
 
+# Версия схемы: увеличивается при каждом изменении моделей, переход с
+# предыдущей версии добавляется в MIGRATIONS (номер версии -> функция(conn))
+SCHEMA_VERSION = 2
+
+
+def _migrate_idempotency_claims(conn):
+    """idempotency_keys: status_code и body допускают NULL — ключ занят, ответ еще не готов"""
+    if conn.dialect.name != "sqlite":
+        conn.exec_driver_sql("ALTER TABLE idempotency_keys ALTER COLUMN status_code DROP NOT NULL")
+        conn.exec_driver_sql("ALTER TABLE idempotency_keys ALTER COLUMN body DROP NOT NULL")
+        return
+
+    # SQLite не меняет ограничения колонок: таблица пересоздается с переносом строк
+    from database.models import IdempotencyRecord
+
+    table = IdempotencyRecord.__table__
+    columns = ", ".join(column.name for column in table.columns)
+    conn.exec_driver_sql("ALTER TABLE idempotency_keys RENAME TO idempotency_keys_old")
+    for index in table.indexes:
+        conn.exec_driver_sql(f"DROP INDEX IF EXISTS {index.name}")
+    table.create(bind=conn)
+    conn.exec_driver_sql(f"INSERT INTO idempotency_keys ({columns}) SELECT {columns} FROM idempotency_keys_old")
+    conn.exec_driver_sql("DROP TABLE idempotency_keys_old")
+
+
+MIGRATIONS = {
+    2: _migrate_idempotency_claims,
+}
+
+
+def _get_schema_version(conn):
+    """Версия схемы: PRAGMA user_version в SQLite, таблица schema_version в остальных СУБД"""
+    if conn.dialect.name == "sqlite":
+        return conn.exec_driver_sql("PRAGMA user_version").scalar() or 0
+    conn.exec_driver_sql("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)")
+    return conn.exec_driver_sql("SELECT MAX(version) FROM schema_version").scalar() or 0
+
+
+def _set_schema_version(conn, version):
+    if conn.dialect.name == "sqlite":
+        conn.exec_driver_sql(f"PRAGMA user_version = {int(version)}")
+        return
+    conn.exec_driver_sql("DELETE FROM schema_version")
+    conn.exec_driver_sql(f"INSERT INTO schema_version (version) VALUES ({int(version)})")
+
+
+def _upgrade_unversioned(conn, existing_tables):
+    """База, созданная до учета версий: недостающие таблицы, колонки и индексы.
+
+    Повторный запуск безопасен — все проверяется перед изменением.
+    """
+    from database.models import Base, GameSession
+    from sqlalchemy import inspect, literal, func, select, update
+
+    Base.metadata.create_all(bind=conn, checkfirst=True)
+
+    inspector = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        columns = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in columns:
+                continue
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=conn.dialect)}"
+            default = column.default.arg if column.default is not None and column.default.is_scalar else None
+            if default is not None:
+                value = literal(default, column.type).compile(dialect=conn.dialect,
+                                                              compile_kwargs={"literal_binds": True})
+                ddl += f" DEFAULT {value}"
+                if not column.nullable:
+                    ddl += " NOT NULL"
+            conn.exec_driver_sql(ddl)
+            logger.info(f"Добавлена колонка {table.name}.{column.name}")
+
+    # Уникальный индекс активной сессии: лишние активные сессии пользователя закрываем
+    if "game_sessions" in existing_tables:
+        sessions = GameSession.__table__
+        latest = select(func.max(sessions.c.id)).where(sessions.c.is_active == True).group_by(sessions.c.user_id)
+        conn.execute(update(sessions).where(
+            sessions.c.is_active == True,
+            sessions.c.id.not_in(latest)
+        ).values(is_active=False))
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=conn, checkfirst=True)
+
+
+def _upgrade_schema(conn, version):
+    from database.models import Base
+    from sqlalchemy import inspect
+
+    if version == 0:
+        existing_tables = set(inspect(conn).get_table_names()) & set(Base.metadata.tables)
+        if not existing_tables:
+            Base.metadata.create_all(bind=conn)
+            return
+        _upgrade_unversioned(conn, existing_tables)
+        version = 1
+
+    for target in range(version + 1, SCHEMA_VERSION + 1):
+        logger.info(f"Миграция схемы базы данных до версии {target}")
+        MIGRATIONS[target](conn)
+
+
 # Инициализация базы данных
 async def init_db():
-    """Создание таблиц в базе данных"""
+    """Проверка версии схемы; таблицы создаются или обновляются, только если версия не совпала"""
     try:
-        from database.models import Base
-        Base.metadata.create_all(bind=engine)
-        logger.info("База данных инициализирована успешно")
+        with engine.begin() as conn:
+            version = _get_schema_version(conn)
+            if version == SCHEMA_VERSION:
+                logger.info(f"Схема базы данных актуальна (версия {version})")
+                return
+            if version > SCHEMA_VERSION:
+                raise RuntimeError(f"Схема базы данных (версия {version}) новее приложения ({SCHEMA_VERSION})")
+
+            _upgrade_schema(conn, version)
+            _set_schema_version(conn, SCHEMA_VERSION)
+        logger.info(f"База данных инициализирована успешно (схема версии {SCHEMA_VERSION})")
     except Exception as e:
         logger.error(f"Ошибка инициализации базы данных: {e}")
         raise
@@ -52,7 +249,7 @@ def create_character(db, character_data):
     )
 
     db.add(character)
-    db.commit()
+    _commit(db)
     db.refresh(character)
     return character
 
@@ -74,6 +271,13 @@ def get_character_by_id(db, character_id):
     return db.query(Character).filter(Character.id == character_id).first()
 
 
+def get_characters_by_ids(db, character_ids):
+    """Получение нескольких персонажей одним запросом"""
+    from database.models import Character
+
+    return db.query(Character).filter(Character.id.in_(character_ids)).all()
+
+
 def update_character(db, character_id, updates):
     """Обновление данных персонажа"""
     from database.models import Character
@@ -83,11 +287,41 @@ def update_character(db, character_id, updates):
         for key, value in updates.items():
             if hasattr(character, key):
                 setattr(character, key, value)
-        db.commit()
+        _commit(db)
         db.refresh(character)
     return character
 
 
+def modify_character(db, character_id, compute_updates, retries=3, commit=True):
+    """Чтение-изменение-запись персонажа с повтором при конфликте версий.
+
+    compute_updates(character) -> dict вызывается заново для перечитанной строки,
+    если ее успел изменить другой процесс. С commit=False изменение только
+    отправляется в базу (flush) и сохранится вместе с остальной транзакцией;
+    конфликт версий тогда не повторяется, а поднимается ConcurrentUpdateError.
+    """
+    from database.models import Character
+
+    for attempt in range(retries):
+        # Строка перечитывается из базы, даже если объект уже загружен в сессию
+        character = db.query(Character).populate_existing().filter(Character.id == character_id).first()
+        if not character:
+            return None
+        for key, value in compute_updates(character).items():
+            if hasattr(character, key):
+                setattr(character, key, value)
+        if not commit:
+            _flush(db)
+            return character
+        try:
+            _commit(db)
+            return character
+        except ConcurrentUpdateError:
+            logger.info(f"Конфликт версий персонажа {character_id}, попытка {attempt + 1}")
+            if attempt == retries - 1:
+                raise
+
+
 # Функции для работы с игровыми сессиями
 def create_game_session(db, session_data):
     """Создание новой игровой сессии"""
@@ -95,15 +329,23 @@ def create_game_session(db, session_data):
 
     session = GameSession(
         user_id=session_data["user_id"],
-        character_id=session_data["character_id"]
+        character_id=session_data["character_id"],
+        rng_seed=session_data.get("rng_seed")
     )
 
     db.add(session)
-    db.commit()
+    _commit(db)
     db.refresh(session)
     return session
 
 
+def get_game_session_by_id(db, session_id):
+    """Получение игровой сессии по ID"""
+    from database.models import GameSession
+
+    return db.query(GameSession).filter(GameSession.id == session_id).first()
+
+
 def get_active_game_session(db, user_id):
     """Получение активной игровой сессии пользователя"""
     from database.models import GameSession
@@ -114,6 +356,15 @@ def get_active_game_session(db, user_id):
     ).first()
 
 
+def get_recent_active_sessions(db, limit=100):
+    """Активные сессии, в которых недавно были ходы"""
+    from database.models import GameSession
+
+    return db.query(GameSession).filter(
+        GameSession.is_active == True
+    ).order_by(GameSession.last_action_at.desc()).limit(limit).all()
+
+
 def update_game_session(db, session_id, updates):
     """Обновление игровой сессии"""
     from database.models import GameSession
@@ -125,7 +376,7 @@ def update_game_session(db, session_id, updates):
             if hasattr(session, key):
                 setattr(session, key, value)
         session.last_action_at = datetime.utcnow()
-        db.commit()
+        _commit(db)
         db.refresh(session)
     return session
 
@@ -142,7 +393,7 @@ def add_narrative_to_session(db, session_id, narrative):
         else:
             session.narrative_log = narrative
         session.last_action_at = datetime.utcnow()
-        db.commit()
+        _commit(db)
         db.refresh(session)
     return session
 
@@ -163,14 +414,91 @@ def add_action_to_session(db, session_id, action):
         }
         session.action_log.append(action_entry)
         session.last_action_at = datetime.utcnow()
-        db.commit()
+        _commit(db)
         db.refresh(session)
     return session
 
 
+# Функции для работы с журналом событий
+def append_game_events(db, session_id, events, snapshot=None, character_updates=None):
+    """Добавление событий в журнал сессии одной транзакцией.
+
+    Вместе с событиями сохраняются снимок состояния и изменения персонажей, если переданы.
+    """
+    from database.models import GameSession, GameEvent, GameSnapshot, Character
+    from datetime import datetime
+
+    session = db.query(GameSession).filter(GameSession.id == session_id).first()
+    if not session:
+        return None
+
+    if character_updates:
+        characters = db.query(Character).filter(Character.id.in_(list(character_updates))).all()
+        for character in characters:
+            for key, value in character_updates[character.id].items():
+                setattr(character, key, value)
+
+    now = datetime.utcnow()
+    seq = session.event_seq or 0
+    for event_type, payload in events:
+        seq += 1
+        db.add(GameEvent(session_id=session_id, seq=seq, event_type=event_type, payload=payload, created_at=now))
+
+    if snapshot is not None:
+        db.add(GameSnapshot(session_id=session_id, seq=seq, state=snapshot, created_at=now))
+
+    session.event_seq = seq
+    session.last_action_at = now
+    _commit(db)
+    return session
+
+
+def get_latest_snapshot(db, session_id, at_seq=None):
+    """Последний снимок состояния сессии (не позже события at_seq)"""
+    from database.models import GameSnapshot
+
+    query = db.query(GameSnapshot).filter(GameSnapshot.session_id == session_id)
+    if at_seq is not None:
+        query = query.filter(GameSnapshot.seq <= at_seq)
+    return query.order_by(GameSnapshot.seq.desc()).first()
+
+
+def get_session_events(db, session_id, after_seq=0, until_seq=None):
+    """События сессии после after_seq (включительно до until_seq)"""
+    from database.models import GameEvent
+
+    query = db.query(GameEvent).filter(
+        GameEvent.session_id == session_id,
+        GameEvent.seq > after_seq
+    )
+    if until_seq is not None:
+        query = query.filter(GameEvent.seq <= until_seq)
+    return query.order_by(GameEvent.seq).all()
+
+
+def iter_session_history(db, session_id, event_types, cursor=None, limit=50, descending=True):
+    """Страница журнала сессии по курсору (seq последней выданной записи).
+
+    Поиск по индексу (session_id, seq) без OFFSET: время выборки не зависит
+    от номера страницы. Строки читаются порциями, без загрузки моделей целиком.
+    """
+    from database.models import GameEvent
+    from sqlalchemy import select
+
+    query = select(GameEvent.seq, GameEvent.event_type, GameEvent.payload, GameEvent.created_at).where(
+        GameEvent.session_id == session_id,
+        GameEvent.event_type.in_(event_types)
+    )
+    if cursor is not None:
+        query = query.where(GameEvent.seq < cursor if descending else GameEvent.seq > cursor)
+    query = query.order_by(GameEvent.seq.desc() if descending else GameEvent.seq).limit(limit)
+
+    yield from db.execute(query.execution_options(yield_per=limit))
+
+
 # Функции для работы с бросками костей
-def create_dice_roll(db, roll_data):
-    """Создание записи о броске костей"""
+def create_dice_roll(db, roll_data, commit=True):
+    """Создание записи о броске костей (с commit=False — в текущей транзакции, без commit)"""
     from database.models import DiceRoll
 
     dice_roll = DiceRoll(
@@ -182,12 +510,16 @@ def create_dice_roll(db, roll_data):
         action_type=roll_data["action_type"],
         difficulty=roll_data.get("difficulty", 12),
         success=roll_data.get("success", False),
+        rng_offset=roll_data.get("rng_offset"),
         description=roll_data.get("description", ""),
         result_description=roll_data.get("result_description", "")
     )
 
     db.add(dice_roll)
-    db.commit()
+    if not commit:
+        _flush(db)
+        return dice_roll
+    _commit(db)
     db.refresh(dice_roll)
     return dice_roll
 
@@ -201,6 +533,91 @@ def get_session_dice_rolls(db, session_id, limit=10):
     ).order_by(DiceRoll.created_at.desc()).limit(limit).all()
 
 
+# Функции для работы с ключами идемпотентности
+def get_idempotency_record(db, key):
+    """Сохраненный ответ или занятый ключ (status_code — NULL) по ключу идемпотентности"""
+    from database.models import IdempotencyRecord
+
+    return db.query(IdempotencyRecord).filter(IdempotencyRecord.key == key).first()
+
+
+def claim_idempotency_key(db, key, request_hash, stale_before, expired_before):
+    """Занятие ключа до выполнения запроса; False, если ключ уже занят или сохранен.
+
+    Незавершенная заявка старше stale_before (процесс упал, не завершив запрос)
+    и ответ старше expired_before снимаются, и ключ занимается заново.
+    """
+    from database.models import IdempotencyRecord
+    from sqlalchemy import and_, or_
+    from sqlalchemy.exc import IntegrityError
+
+    db.query(IdempotencyRecord).filter(
+        IdempotencyRecord.key == key,
+        or_(
+            and_(IdempotencyRecord.status_code.is_(None), IdempotencyRecord.created_at < stale_before),
+            IdempotencyRecord.created_at < expired_before
+        )
+    ).delete(synchronize_session=False)
+
+    db.add(IdempotencyRecord(key=key, request_hash=request_hash))
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        return False
+    return True
+
+
+def release_idempotency_key(db, key):
+    """Снятие заявки без сохраненного ответа: повтор выполнится заново"""
+    from database.models import IdempotencyRecord
+
+    db.query(IdempotencyRecord).filter(
+        IdempotencyRecord.key == key,
+        IdempotencyRecord.status_code.is_(None)
+    ).delete(synchronize_session=False)
+    db.commit()
+
+
+def save_idempotency_record(db, record_data):
+    """Сохранение ответа в занятый ключ (или новой строкой, если заявки нет)"""
+    from datetime import datetime
+    from database.models import IdempotencyRecord
+    from sqlalchemy.exc import IntegrityError
+
+    record = get_idempotency_record(db, record_data["key"])
+    if record is None:
+        record = IdempotencyRecord(key=record_data["key"])
+        db.add(record)
+    elif record.status_code is not None:
+        # Ответ уже сохранен — первый остается
+        return record
+
+    record.request_hash = record_data["request_hash"]
+    record.status_code = record_data["status_code"]
+    record.content_type = record_data.get("content_type", "application/json")
+    record.body = record_data["body"]
+    # Срок хранения отсчитывается от готового ответа
+    record.created_at = datetime.utcnow()
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        return None
+    return record
+
+
+def delete_expired_idempotency_records(db, older_than):
+    """Удаление ответов, сохраненных раньше older_than"""
+    from database.models import IdempotencyRecord
+
+    deleted = db.query(IdempotencyRecord).filter(
+        IdempotencyRecord.created_at < older_than
+    ).delete(synchronize_session=False)
+    db.commit()
+    return deleted
+
+
 # Вспомогательные функции
 def close_all_user_sessions(db, user_id):
     """Закрытие всех активных сессий пользователя"""
@@ -214,7 +631,7 @@ def close_all_user_sessions(db, user_id):
     for session in sessions:
         session.is_active = False
 
-    db.commit()
+    _commit(db)
     return len(sessions)
 
 
@@ -230,5 +647,5 @@ def deactivate_user_characters(db, user_id):
     for character in characters:
         character.is_active = False
 
-    db.commit()
+    _commit(db)
     return len(characters)
\ No newline at end of file
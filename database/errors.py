@@ -0,0 +1,2 @@
+class ConcurrentUpdateError(Exception):
+    """Строку успел изменить другой запрос: версия не совпала или нарушено ограничение"""
@@ -0,0 +1,281 @@
+"""
+Хранилище в памяти для упрощенного API (api_simple.py, Replit).
+
+Данные сгруппированы по пользователям: поиск персонажа и сессии — через
+индекс user_id, без перебора. Пользователи упорядочены по последнему
+обращению (LRU); сверх max_users самые давние выгружаются на диск
+(cold/<user_id>.json) и загружаются обратно при следующем обращении.
+
+Надежность — журнал и снимок в каталоге path:
+  journal.jsonl — каждое изменение одной строкой JSON, дописывается сразу;
+  snapshot.json — полное состояние, записывается каждые snapshot_every
+  изменений (атомарно, через временный файл), после чего журнал очищается.
+При запуске читается снимок и проигрывается журнал. Записи журнала
+идемпотентны (строка целиком), поэтому сбой между записью снимка и
+очисткой журнала не портит данные.
+
+Модуль не зависит от SQLAlchemy и настроек основного приложения.
+"""
+
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+TABLES = ("characters", "sessions")
+
+
+class _UserEntry:
+    """Строки одного пользователя по таблицам: id -> строка, и id активной строки"""
+
+    __slots__ = ("characters", "sessions", "active")
+
+    def __init__(self):
+        self.characters: Dict[int, Dict[str, Any]] = {}
+        self.sessions: Dict[int, Dict[str, Any]] = {}
+        self.active: Dict[str, int] = {}
+
+    def table(self, name: str) -> Dict[int, Dict[str, Any]]:
+        return self.characters if name == "characters" else self.sessions
+
+
+class MemoryStore:
+    """Персонажи и игровые сессии в памяти с индексом по user_id и журналом на диске"""
+
+    def __init__(self, path: Optional[str] = None, max_users: int = 10000,
+                 snapshot_every: int = 1000, fsync: bool = False):
+        self.path = path
+        self.max_users = max_users
+        self.snapshot_every = snapshot_every
+        # fsync после каждой записи переживает отключение питания, но медленнее;
+        # без него журнал переживает падение процесса
+        self.fsync = fsync
+
+        self._users: "OrderedDict[int, _UserEntry]" = OrderedDict()
+        # Монотонные id: не переиспользуются после удаления или выгрузки
+        self._next_ids = {name: 1 for name in TABLES}
+        self._journal = None
+        self._journal_records = 0
+
+    # Запуск и остановка
+
+    def load(self):
+        """Чтение снимка и проигрывание журнала"""
+        if not self.path:
+            logger.info("Хранилище в памяти без сохранения на диск")
+            return
+
+        started = time.perf_counter()
+        os.makedirs(os.path.join(self.path, "cold"), exist_ok=True)
+
+        snapshot_path = os.path.join(self.path, "snapshot.json")
+        if os.path.exists(snapshot_path):
+            with open(snapshot_path, "r", encoding="utf-8") as file:
+                snapshot = json.load(file)
+            self._next_ids.update(snapshot["next_ids"])
+            for name in TABLES:
+                for row in snapshot[name]:
+                    self._put(name, row)
+
+        replayed = 0
+        journal_path = os.path.join(self.path, "journal.jsonl")
+        if os.path.exists(journal_path):
+            valid_size = 0
+            with open(journal_path, "rb") as file:
+                for line in file:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Последняя строка могла не дописаться при падении
+                        logger.warning("Пропущена поврежденная запись в конце журнала")
+                        break
+                    self._apply(record)
+                    replayed += 1
+                    valid_size += len(line)
+            # Новые записи дописываются сразу после последней целой
+            os.truncate(journal_path, valid_size)
+
+        self._journal = open(journal_path, "a", encoding="utf-8")
+        self._journal_records = replayed
+        self._evict_idle()
+        logger.info(f"Хранилище загружено за {time.perf_counter() - started:.3f} с: "
+                    f"пользователей {len(self._users)}, записей журнала {replayed}")
+
+    def close(self):
+        """Снимок состояния при остановке: следующий запуск не проигрывает журнал"""
+        if self._journal is not None:
+            self.snapshot()
+            self._journal.close()
+            self._journal = None
+
+    def snapshot(self):
+        """Запись полного состояния и очистка журнала"""
+        if not self.path:
+            return
+        snapshot = {
+            "next_ids": self._next_ids,
+            "characters": [row for entry in self._users.values() for row in entry.characters.values()],
+            "sessions": [row for entry in self._users.values() for row in entry.sessions.values()]
+        }
+        self._write_atomic(os.path.join(self.path, "snapshot.json"), snapshot)
+        if self._journal is not None:
+            self._journal.truncate(0)
+            self._journal.seek(0)
+        self._journal_records = 0
+
+    # Персонажи
+
+    def create_character(self, user_id: int, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Новый персонаж становится активным, прежние персонажи пользователя — нет"""
+        previous = self.get_active_character(user_id)
+        if previous is not None:
+            self._save("characters", dict(previous, is_active=False))
+        else:
+            self._entry(user_id, create=True)
+
+        character = dict(data, id=self._new_id("characters"), user_id=user_id, is_active=True)
+        return self._save("characters", character)
+
+    def get_active_character(self, user_id: int) -> Optional[Dict[str, Any]]:
+        entry = self._entry(user_id)
+        if entry is None or "characters" not in entry.active:
+            return None
+        return entry.characters[entry.active["characters"]]
+
+    def get_character(self, user_id: int, character_id: int) -> Optional[Dict[str, Any]]:
+        entry = self._entry(user_id)
+        return entry.characters.get(character_id) if entry is not None else None
+
+    def update_character(self, user_id: int, character_id: int, updates: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        character = self.get_character(user_id, character_id)
+        if character is None:
+            return None
+        return self._save("characters", dict(character, **updates))
+
+    # Игровые сессии
+
+    def create_session(self, user_id: int, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Новая сессия становится активной, прежние сессии пользователя закрываются"""
+        previous = self.get_active_session(user_id)
+        if previous is not None:
+            self._save("sessions", dict(previous, is_active=False))
+        else:
+            self._entry(user_id, create=True)
+
+        session = dict(data, id=self._new_id("sessions"), user_id=user_id, is_active=True)
+        return self._save("sessions", session)
+
+    def get_active_session(self, user_id: int) -> Optional[Dict[str, Any]]:
+        entry = self._entry(user_id)
+        if entry is None or "sessions" not in entry.active:
+            return None
+        return entry.sessions[entry.active["sessions"]]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "users": len(self._users),
+            "characters": sum(len(entry.characters) for entry in self._users.values()),
+            "sessions": sum(len(entry.sessions) for entry in self._users.values()),
+            "journal_records": self._journal_records,
+            "persistent": bool(self.path)
+        }
+
+    # Внутреннее устройство
+
+    def _new_id(self, table: str) -> int:
+        new_id = self._next_ids[table]
+        self._next_ids[table] = new_id + 1
+        return new_id
+
+    def _entry(self, user_id: int, create: bool = False) -> Optional[_UserEntry]:
+        """Данные пользователя с отметкой обращения (LRU); выгруженные — с диска"""
+        entry = self._users.get(user_id)
+        if entry is not None:
+            self._users.move_to_end(user_id)
+            return entry
+
+        entry = self._restore(user_id)
+        if entry is None and create:
+            entry = _UserEntry()
+            self._users[user_id] = entry
+        if entry is not None:
+            self._evict_idle()
+        return entry
+
+    def _put(self, table: str, row: Dict[str, Any]):
+        entry = self._users.get(row["user_id"])
+        if entry is None:
+            entry = self._users[row["user_id"]] = _UserEntry()
+        entry.table(table)[row["id"]] = row
+        if row.get("is_active"):
+            entry.active[table] = row["id"]
+        elif entry.active.get(table) == row["id"]:
+            del entry.active[table]
+        if row["id"] >= self._next_ids[table]:
+            self._next_ids[table] = row["id"] + 1
+
+    def _save(self, table: str, row: Dict[str, Any]) -> Dict[str, Any]:
+        self._put(table, row)
+        self._log({"op": "put", "table": table, "row": row})
+        return row
+
+    def _apply(self, record: Dict[str, Any]):
+        if record["op"] == "put":
+            self._put(record["table"], record["row"])
+        elif record["op"] == "evict":
+            self._users.pop(record["user_id"], None)
+
+    def _log(self, record: Dict[str, Any]):
+        if self._journal is None:
+            return
+        self._journal.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._journal.flush()
+        if self.fsync:
+            os.fsync(self._journal.fileno())
+        self._journal_records += 1
+        if self._journal_records >= self.snapshot_every:
+            self.snapshot()
+
+    def _cold_path(self, user_id: int) -> str:
+        return os.path.join(self.path, "cold", f"{user_id}.json")
+
+    def _evict_idle(self):
+        while len(self._users) > self.max_users:
+            user_id, entry = self._users.popitem(last=False)
+            if not self.path:
+                logger.warning(f"Хранилище переполнено: данные пользователя {user_id} удалены из памяти")
+                continue
+            self._write_atomic(self._cold_path(user_id), {
+                "characters": list(entry.characters.values()),
+                "sessions": list(entry.sessions.values())
+            })
+            self._log({"op": "evict", "user_id": user_id})
+
+    def _restore(self, user_id: int) -> Optional[_UserEntry]:
+        if not self.path:
+            return None
+        cold_path = self._cold_path(user_id)
+        if not os.path.exists(cold_path):
+            return None
+
+        with open(cold_path, "r", encoding="utf-8") as file:
+            data = json.load(file)
+        self._users[user_id] = _UserEntry()
+        # Строки снова попадают в журнал: после снимка файл выгрузки не нужен
+        for table in TABLES:
+            for row in data[table]:
+                self._save(table, row)
+        os.remove(cold_path)
+        return self._users[user_id]
+
+    def _write_atomic(self, path: str, data: Any):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(data, file, ensure_ascii=False)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
@@ -1,6 +1,7 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, ForeignKey, JSON
+from sqlalchemy import Column, Integer, BigInteger, String, Boolean, DateTime, Text, ForeignKey, JSON, \
+    UniqueConstraint, Index, LargeBinary
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, deferred
 from datetime import datetime
 
 Base = declarative_base()
@@ -44,9 +45,14 @@ class Character(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     is_active = Column(Boolean, default=True)
 
+    # Версия строки: UPDATE ... WHERE version = <прочитанная> (оптимистичная блокировка)
+    version = Column(Integer, nullable=False, default=1)
+
     # Связи
     game_sessions = relationship("GameSession", back_populates="character")
 
+    __mapper_args__ = {"version_id_col": version}
+
     def to_dict(self):
         return {
             "id": self.id,
@@ -70,7 +76,8 @@ class Character(Base):
             "equipment": self.equipment,
             "spells": self.spells,
             "created_at": self.created_at.isoformat() if self.created_at else None,
-            "is_active": self.is_active
+            "is_active": self.is_active,
+            "version": self.version
         }
 
 
@@ -85,28 +92,46 @@ class GameSession(Base):
     # Состояние сессии
     is_active = Column(Boolean, default=True)
     current_scene = Column(String(200), default="")
-    game_state = Column(JSON, default=dict)  # Текущее состояние игры
+    game_state = Column(JSON, default=dict)  # Начальное состояние (текущее собирается из событий)
+    event_seq = Column(Integer, default=0)  # Номер последнего события сессии
 
     # История игры
-    narrative_log = Column(Text, default="")  # Полная история повествования
-    action_log = Column(JSON, default=list)  # Лог действий игрока
+    # Устаревшие монолитные логи: не загружаются вместе с сессией, история ведется в game_events
+    narrative_log = deferred(Column(Text, default=""))  # Полная история повествования
+    action_log = deferred(Column(JSON, default=list))  # Лог действий игрока
+
+    # Генератор случайных чисел сессии (для воспроизведения бросков)
+    rng_seed = Column(BigInteger, nullable=True)
+    rng_cursor = Column(Integer, default=0)  # Сколько чисел уже выдано из потока
 
     # Метаданные
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     last_action_at = Column(DateTime, default=datetime.utcnow)
 
+    # Версия строки (оптимистичная блокировка)
+    version = Column(Integer, nullable=False, default=1)
+
     # Связи
     character = relationship("Character", back_populates="game_sessions")
 
-    def to_dict(self):
+    __mapper_args__ = {"version_id_col": version}
+    # Не больше одной активной сессии на пользователя
+    __table_args__ = (
+        Index("uq_game_sessions_active_user", "user_id", unique=True,
+              sqlite_where=is_active == True, postgresql_where=is_active == True),
+    )
+
+    def to_dict(self, game_state=None):
         return {
             "id": self.id,
             "user_id": self.user_id,
             "character_id": self.character_id,
             "is_active": self.is_active,
             "current_scene": self.current_scene,
-            "game_state": self.game_state,
+            "game_state": game_state if game_state is not None else self.game_state,
+            "event_seq": self.event_seq,
+            "version": self.version,
             "created_at": self.created_at.isoformat() if self.created_at else None,
             "updated_at": self.updated_at.isoformat() if self.updated_at else None,
             "last_action_at": self.last_action_at.isoformat() if self.last_action_at else None
@@ -130,6 +155,7 @@ class DiceRoll(Base):
     action_type = Column(String(50), nullable=False)  # Тип действия
     difficulty = Column(Integer, default=12)  # Сложность
     success = Column(Boolean, default=False)  # Успех/неудача
+    rng_offset = Column(Integer, nullable=True)  # Позиция в потоке RNG сессии
 
     # Дополнительная информация
     description = Column(String(500), default="")
@@ -151,5 +177,60 @@ class DiceRoll(Base):
             "success": self.success,
             "description": self.description,
             "result_description": self.result_description,
+            "rng_offset": self.rng_offset,
             "created_at": self.created_at.isoformat() if self.created_at else None
-        }
\ No newline at end of file
+        }
+
+
+class GameEvent(Base):
+    """Модель события игровой сессии (журнал изменений состояния)"""
+    __tablename__ = "game_events"
+    __table_args__ = (UniqueConstraint("session_id", "seq", name="uq_game_events_session_seq"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    session_id = Column(Integer, ForeignKey("game_sessions.id"), nullable=False)
+    seq = Column(Integer, nullable=False)  # Порядковый номер внутри сессии
+
+    event_type = Column(String(50), nullable=False)
+    payload = Column(JSON, default=dict)
+
+    # Метаданные
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "session_id": self.session_id,
+            "seq": self.seq,
+            "event_type": self.event_type,
+            "payload": self.payload,
+            "created_at": self.created_at.isoformat() if self.created_at else None
+        }
+
+
+class GameSnapshot(Base):
+    """Модель снимка состояния сессии после события seq"""
+    __tablename__ = "game_snapshots"
+    __table_args__ = (Index("ix_game_snapshots_session_seq", "session_id", "seq"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    session_id = Column(Integer, ForeignKey("game_sessions.id"), nullable=False)
+    seq = Column(Integer, nullable=False)
+    state = Column(JSON, nullable=False)
+
+    # Метаданные
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class IdempotencyRecord(Base):
+    """Модель сохраненного ответа на запрос с Idempotency-Key"""
+    __tablename__ = "idempotency_keys"
+
+    key = Column(String(320), primary_key=True)  # "<путь> <ключ клиента>"
+    request_hash = Column(String(64), nullable=False)  # sha256 тела запроса
+    status_code = Column(Integer, nullable=True)  # NULL — ключ занят, запрос еще выполняется
+    content_type = Column(String(100), default="application/json")
+    body = Column(LargeBinary, nullable=True)
+
+    # Метаданные
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
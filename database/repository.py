@@ -0,0 +1,328 @@
+"""
+Хранилище персонажей и игровых сессий с взаимозаменяемыми реализациями.
+
+GameRepository — общий интерфейс для маршрутов api/routes/simple.py;
+строки передаются словарями в формате to_dict() моделей. Реализации:
+  memory        — MemoryStore (память + журнал на диске), без SQLAlchemy;
+  sqlite        — синхронный SQLAlchemy (вызовы выполняются в event loop,
+                  как в основном API);
+  sqlite_async  — SQLAlchemy asyncio поверх aiosqlite (нужен пакет aiosqlite).
+
+Реализация выбирается по имени в create_repository (в api_simple.py —
+переменная окружения STORAGE_BACKEND). Сравнение скорости и проверка
+одинакового поведения — python -m benchmarks.backends.
+"""
+
+from typing import Any, Callable, Dict, Optional, Protocol
+import logging
+
+from database.errors import ConcurrentUpdateError
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("memory", "sqlite", "sqlite_async")
+DEFAULT_DATABASE_URL = "sqlite:///./daggerheart.db"
+
+Row = Dict[str, Any]
+ComputeUpdates = Callable[[Row], Dict[str, Any]]
+
+
+class GameRepository(Protocol):
+    """Персонажи и сессии пользователя; у пользователя не больше одного активного персонажа и сессии"""
+
+    async def load(self) -> None:
+        """Подготовка хранилища (чтение журнала, создание таблиц)"""
+
+    async def close(self) -> None:
+        """Сохранение и освобождение ресурсов при остановке"""
+
+    async def create_character(self, user_id: int, data: Row) -> Row:
+        """Новый активный персонаж; прежний активный персонаж пользователя деактивируется"""
+
+    async def get_active_character(self, user_id: int) -> Optional[Row]:
+        ...
+
+    async def get_character(self, user_id: int, character_id: int) -> Optional[Row]:
+        """Персонаж по id, только если он принадлежит пользователю"""
+
+    async def modify_character(self, user_id: int, character_id: int,
+                               compute_updates: ComputeUpdates) -> Optional[Row]:
+        """Чтение-изменение-запись: compute_updates(строка) -> изменения, атомарно"""
+
+    async def create_session(self, user_id: int, data: Row) -> Row:
+        """Новая активная сессия; прежняя активная сессия пользователя закрывается"""
+
+    async def get_active_session(self, user_id: int) -> Optional[Row]:
+        ...
+
+
+class MemoryRepository:
+    """GameRepository поверх MemoryStore: все операции выполняются без ожидания, то есть атомарно"""
+
+    def __init__(self, path: Optional[str] = None, max_users: int = 10000, snapshot_every: int = 1000):
+        from database.memory_store import MemoryStore
+        self.store = MemoryStore(path, max_users=max_users, snapshot_every=snapshot_every)
+
+    async def load(self):
+        self.store.load()
+
+    async def close(self):
+        self.store.close()
+
+    async def create_character(self, user_id, data):
+        return self.store.create_character(user_id, data)
+
+    async def get_active_character(self, user_id):
+        return self.store.get_active_character(user_id)
+
+    async def get_character(self, user_id, character_id):
+        return self.store.get_character(user_id, character_id)
+
+    async def modify_character(self, user_id, character_id, compute_updates):
+        character = self.store.get_character(user_id, character_id)
+        if character is None:
+            return None
+        return self.store.update_character(user_id, character_id, compute_updates(character))
+
+    async def create_session(self, user_id, data):
+        return self.store.create_session(user_id, data)
+
+    async def get_active_session(self, user_id):
+        return self.store.get_active_session(user_id)
+
+
+def _character_columns(data: Row) -> Row:
+    """Словарь персонажа (ключ "class") -> колонки модели Character"""
+    from database.models import Character
+
+    columns = {key: value for key, value in data.items() if key in Character.__table__.c and key != "id"}
+    if "class" in data:
+        columns["character_class"] = data["class"]
+    return columns
+
+
+def _session_columns(data: Row) -> Row:
+    from database.models import GameSession
+    return {key: value for key, value in data.items() if key in GameSession.__table__.c and key != "id"}
+
+
+def _sqlite_connect_args(url: str) -> Dict[str, Any]:
+    return {"check_same_thread": False} if url.startswith("sqlite") else {}
+
+
+def _enable_wal(engine):
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "connect")
+    def _set_wal(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.close()
+
+
+class SqlRepository:
+    """GameRepository на синхронном SQLAlchemy: одна транзакция на операцию"""
+
+    def __init__(self, url: str = DEFAULT_DATABASE_URL, retries: int = 3):
+        from sqlalchemy import create_engine
+        from sqlalchemy.orm import sessionmaker
+
+        self.retries = retries
+        self.engine = create_engine(url, connect_args=_sqlite_connect_args(url))
+        if url.startswith("sqlite"):
+            _enable_wal(self.engine)
+        self._sessions = sessionmaker(bind=self.engine, expire_on_commit=False)
+
+    async def load(self):
+        from database.models import Base
+        # Недостающие таблицы; версию схемы при первом запуске основного API выставит init_db
+        Base.metadata.create_all(bind=self.engine, checkfirst=True)
+
+    async def close(self):
+        self.engine.dispose()
+
+    async def create_character(self, user_id, data):
+        from database.models import Character
+        from sqlalchemy import update
+
+        with self._sessions.begin() as db:
+            db.execute(update(Character).where(
+                Character.user_id == user_id, Character.is_active == True
+            ).values(is_active=False, version=Character.version + 1))
+            character = Character(**_character_columns(data), user_id=user_id, is_active=True)
+            db.add(character)
+        return character.to_dict()
+
+    async def get_active_character(self, user_id):
+        from database.models import Character
+        from sqlalchemy import select
+
+        with self._sessions() as db:
+            character = db.scalars(select(Character).where(
+                Character.user_id == user_id, Character.is_active == True
+            ).order_by(Character.id.desc()).limit(1)).first()
+            return character.to_dict() if character else None
+
+    async def get_character(self, user_id, character_id):
+        from database.models import Character
+
+        with self._sessions() as db:
+            character = db.get(Character, character_id)
+            return character.to_dict() if character and character.user_id == user_id else None
+
+    async def modify_character(self, user_id, character_id, compute_updates):
+        from database.models import Character
+        from sqlalchemy.orm.exc import StaleDataError
+
+        for attempt in range(self.retries):
+            try:
+                with self._sessions.begin() as db:
+                    character = db.get(Character, character_id)
+                    if character is None or character.user_id != user_id:
+                        return None
+                    for key, value in _character_columns(compute_updates(character.to_dict())).items():
+                        setattr(character, key, value)
+                return character.to_dict()
+            except StaleDataError as e:
+                logger.info(f"Конфликт версий персонажа {character_id}, попытка {attempt + 1}")
+                if attempt == self.retries - 1:
+                    raise ConcurrentUpdateError(str(e)) from e
+
+    async def create_session(self, user_id, data):
+        from database.models import GameSession
+        from sqlalchemy import update
+        from sqlalchemy.exc import IntegrityError
+
+        try:
+            with self._sessions.begin() as db:
+                db.execute(update(GameSession).where(
+                    GameSession.user_id == user_id, GameSession.is_active == True
+                ).values(is_active=False, version=GameSession.version + 1))
+                session = GameSession(**_session_columns(data), user_id=user_id, is_active=True)
+                db.add(session)
+        except IntegrityError as e:
+            raise ConcurrentUpdateError(str(e.orig)) from e
+        return session.to_dict()
+
+    async def get_active_session(self, user_id):
+        from database.models import GameSession
+        from sqlalchemy import select
+
+        with self._sessions() as db:
+            session = db.scalars(select(GameSession).where(
+                GameSession.user_id == user_id, GameSession.is_active == True
+            )).first()
+            return session.to_dict() if session else None
+
+
+class AsyncSqlRepository:
+    """GameRepository на SQLAlchemy asyncio: запросы не блокируют event loop"""
+
+    def __init__(self, url: str = DEFAULT_DATABASE_URL, retries: int = 3):
+        try:
+            from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+        except ImportError as e:
+            raise RuntimeError("Для STORAGE_BACKEND=sqlite_async нужен SQLAlchemy 2.0 с greenlet") from e
+
+        if url.startswith("sqlite:"):
+            url = "sqlite+aiosqlite:" + url[len("sqlite:"):]
+        self.retries = retries
+        self.engine = create_async_engine(url)
+        if url.startswith("sqlite"):
+            _enable_wal(self.engine.sync_engine)
+        self._sessions = async_sessionmaker(bind=self.engine, expire_on_commit=False)
+
+    async def load(self):
+        from database.models import Base
+
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all, checkfirst=True)
+
+    async def close(self):
+        await self.engine.dispose()
+
+    async def create_character(self, user_id, data):
+        from database.models import Character
+        from sqlalchemy import update
+
+        async with self._sessions.begin() as db:
+            # UPDATE первым: в SQLite транзакция сразу берет блокировку записи
+            await db.execute(update(Character).where(
+                Character.user_id == user_id, Character.is_active == True
+            ).values(is_active=False, version=Character.version + 1))
+            character = Character(**_character_columns(data), user_id=user_id, is_active=True)
+            db.add(character)
+        return character.to_dict()
+
+    async def get_active_character(self, user_id):
+        from database.models import Character
+        from sqlalchemy import select
+
+        async with self._sessions() as db:
+            character = (await db.scalars(select(Character).where(
+                Character.user_id == user_id, Character.is_active == True
+            ).order_by(Character.id.desc()).limit(1))).first()
+            return character.to_dict() if character else None
+
+    async def get_character(self, user_id, character_id):
+        from database.models import Character
+
+        async with self._sessions() as db:
+            character = await db.get(Character, character_id)
+            return character.to_dict() if character and character.user_id == user_id else None
+
+    async def modify_character(self, user_id, character_id, compute_updates):
+        from database.models import Character
+        from sqlalchemy.orm.exc import StaleDataError
+
+        for attempt in range(self.retries):
+            try:
+                async with self._sessions.begin() as db:
+                    character = await db.get(Character, character_id)
+                    if character is None or character.user_id != user_id:
+                        return None
+                    for key, value in _character_columns(compute_updates(character.to_dict())).items():
+                        setattr(character, key, value)
+                return character.to_dict()
+            except StaleDataError as e:
+                logger.info(f"Конфликт версий персонажа {character_id}, попытка {attempt + 1}")
+                if attempt == self.retries - 1:
+                    raise ConcurrentUpdateError(str(e)) from e
+
+    async def create_session(self, user_id, data):
+        from database.models import GameSession
+        from sqlalchemy import update
+        from sqlalchemy.exc import IntegrityError
+
+        try:
+            async with self._sessions.begin() as db:
+                await db.execute(update(GameSession).where(
+                    GameSession.user_id == user_id, GameSession.is_active == True
+                ).values(is_active=False, version=GameSession.version + 1))
+                session = GameSession(**_session_columns(data), user_id=user_id, is_active=True)
+                db.add(session)
+        except IntegrityError as e:
+            raise ConcurrentUpdateError(str(e.orig)) from e
+        return session.to_dict()
+
+    async def get_active_session(self, user_id):
+        from database.models import GameSession
+        from sqlalchemy import select
+
+        async with self._sessions() as db:
+            session = (await db.scalars(select(GameSession).where(
+                GameSession.user_id == user_id, GameSession.is_active == True
+            ))).first()
+            return session.to_dict() if session else None
+
+
+def create_repository(backend: str, url: Optional[str] = None, path: Optional[str] = None,
+                      **options) -> GameRepository:
+    """Хранилище по имени реализации: memory / sqlite / sqlite_async"""
+    if backend == "memory":
+        return MemoryRepository(path, **options)
+    if backend == "sqlite":
+        return SqlRepository(url or DEFAULT_DATABASE_URL)
+    if backend == "sqlite_async":
+        return AsyncSqlRepository(url or DEFAULT_DATABASE_URL)
+    raise ValueError(f"Неизвестное хранилище {backend!r}, доступны: {', '.join(BACKENDS)}")
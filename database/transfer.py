@@ -0,0 +1,325 @@
+"""
+Перенос кампаний между базами: потоковый экспорт в NDJSON (при необходимости
+gzip) и пакетный импорт.
+
+Формат — по одному JSON-объекту на строку:
+  {"type": "header", "format": "daggerheart-campaign", "schema_version": 1, ...}
+  {"type": "row", "table": "characters", "row": {...}}
+  ...
+  {"type": "footer", "counts": {"characters": 1, ...}}
+
+Строки читаются курсором порциями (yield_per), поэтому память не растет
+с размером кампании. При импорте идентификаторы сдвигаются за максимальные
+в целевой базе, ссылки между таблицами пересчитываются так же.
+
+Запуск:
+  python -m database.transfer export --user-id 123 -o campaign.ndjson.gz
+  python -m database.transfer export -o backup.ndjson.gz   # вся база
+  python -m database.transfer import campaign.ndjson.gz
+  python -m database.transfer import campaign.ndjson.gz --as-user 100000 --copies 50
+"""
+
+import argparse
+import gzip
+import json
+import sys
+import time
+import zlib
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+from sqlalchemy import DateTime, func, select, text
+from sqlalchemy.exc import IntegrityError
+
+FORMAT = "daggerheart-campaign"
+FORMAT_VERSION = 1
+# Порядок важен: родительские таблицы раньше ссылающихся на них
+TABLES = ("characters", "game_sessions", "game_events", "game_snapshots", "dice_rolls")
+# Таблица -> {колонка: таблица, на идентификаторы которой она ссылается}
+REFERENCES = {
+    "game_sessions": {"character_id": "characters"},
+    "game_events": {"session_id": "game_sessions"},
+    "game_snapshots": {"session_id": "game_sessions"},
+    "dice_rolls": {"session_id": "game_sessions"},
+}
+# Версии схемы с одинаковыми переносимыми таблицами: версия 2 изменила только idempotency_keys
+COMPATIBLE_SCHEMAS = ({1, 2},)
+FETCH_SIZE = 1000
+CHUNK_SIZE = 64 * 1024
+
+
+class TransferError(Exception):
+    """Файл кампании поврежден или не подходит к базе"""
+
+
+def _tables():
+    from database.models import Base
+    return [Base.metadata.tables[name] for name in TABLES]
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Тип {type(value).__name__} не сериализуется")
+
+
+def _dumps(record: Dict[str, Any]) -> bytes:
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":"), default=_encode).encode() + b"\n"
+
+
+def _campaign_query(table, user_id: Optional[int]):
+    query = select(table).order_by(table.c.id)
+    if user_id is None:
+        return query
+    if "user_id" in table.c:
+        return query.where(table.c.user_id == user_id)
+
+    from database.models import GameSession
+    sessions = select(GameSession.id).where(GameSession.user_id == user_id)
+    return query.where(table.c.session_id.in_(sessions))
+
+
+def iter_campaign(conn, user_id: Optional[int] = None) -> Iterator[bytes]:
+    """Строки NDJSON кампании пользователя (или всей базы, если user_id не указан)"""
+    from database.database import SCHEMA_VERSION
+
+    yield _dumps({
+        "type": "header",
+        "format": FORMAT,
+        "version": FORMAT_VERSION,
+        "schema_version": SCHEMA_VERSION,
+        "user_id": user_id,
+        "exported_at": datetime.utcnow()
+    })
+
+    counts = {}
+    for table in _tables():
+        counts[table.name] = 0
+        # stream_results: серверный курсор там, где драйвер его поддерживает (PostgreSQL)
+        result = conn.execution_options(yield_per=FETCH_SIZE).execute(_campaign_query(table, user_id))
+        for row in result.mappings():
+            counts[table.name] += 1
+            yield _dumps({"type": "row", "table": table.name, "row": dict(row)})
+
+    yield _dumps({"type": "footer", "counts": counts})
+
+
+def chunked(lines: Iterable[bytes], compress: bool = False) -> Iterator[bytes]:
+    """Склейка строк в блоки ~64 КБ (с потоковым сжатием gzip, если нужно)"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    buffer = []
+    size = 0
+    for line in lines:
+        buffer.append(line)
+        size += len(line)
+        if size >= CHUNK_SIZE:
+            data = b"".join(buffer)
+            buffer.clear()
+            size = 0
+            data = compressor.compress(data) if compressor else data
+            if data:
+                yield data
+
+    data = b"".join(buffer)
+    if compressor:
+        data = compressor.compress(data) + compressor.flush()
+    if data:
+        yield data
+
+
+def stream_campaign(user_id: Optional[int] = None, compress: bool = False) -> Iterator[bytes]:
+    """Экспорт со своим соединением: подходит для StreamingResponse"""
+    from database.database import engine
+
+    with engine.connect() as conn:
+        yield from chunked(iter_campaign(conn, user_id), compress)
+
+
+def _parse_lines(lines: Iterable[bytes]) -> Iterator[Dict[str, Any]]:
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            raise TransferError(f"Строка {number}: некорректный JSON ({e})")
+
+
+class _Importer:
+    """Пакетная вставка строк одной кампании"""
+
+    def __init__(self, conn, batch_size: int, as_user: Optional[int]):
+        self.conn = conn
+        self.batch_size = batch_size
+        self.as_user = as_user
+        self.tables = {table.name: table for table in _tables()}
+        self.datetime_columns = {
+            table.name: [column.name for column in table.columns if isinstance(column.type, DateTime)]
+            for table in self.tables.values()
+        }
+        # Сдвиг идентификаторов: новые строки идут после уже существующих
+        self.offsets = {
+            name: conn.execute(select(func.coalesce(func.max(table.c.id), 0))).scalar()
+            for name, table in self.tables.items()
+        }
+        self.counts = {name: 0 for name in self.tables}
+        self.table = None
+        self.batch = []
+
+    def add(self, name: str, row: Dict[str, Any]):
+        table = self.tables.get(name)
+        if table is None:
+            raise TransferError(f"Неизвестная таблица: {name}")
+        if name != self.table:
+            # Родительские строки должны быть вставлены раньше ссылающихся
+            self.flush()
+            self.table = name
+
+        values = {column.name: row.get(column.name) for column in table.columns}
+        values["id"] += self.offsets[name]
+        for column, target in REFERENCES.get(name, {}).items():
+            if values[column] is not None:
+                values[column] += self.offsets[target]
+        if self.as_user is not None and "user_id" in values:
+            values["user_id"] = self.as_user
+        for column in self.datetime_columns[name]:
+            if values[column] is not None:
+                values[column] = datetime.fromisoformat(values[column])
+
+        self.batch.append(values)
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.batch:
+            try:
+                # Список параметров -> executemany
+                self.conn.execute(self.tables[self.table].insert(), self.batch)
+            except IntegrityError as e:
+                # Например, у пользователя в базе уже есть активная сессия
+                raise TransferError(f"Конфликт с данными в базе ({self.table}): {e.orig}")
+            self.counts[self.table] += len(self.batch)
+            self.batch = []
+
+    def finish(self):
+        self.flush()
+        if self.conn.dialect.name == "postgresql":
+            # Явные id не двигают последовательности: выравниваем по максимуму
+            for name in self.tables:
+                self.conn.execute(text(
+                    f"SELECT setval(pg_get_serial_sequence('{name}', 'id'), "
+                    f"COALESCE((SELECT MAX(id) FROM {name}), 0) + 1, false)"
+                ))
+
+
+def import_campaign(conn, lines: Iterable[bytes], batch_size: int = 1000,
+                    as_user: Optional[int] = None) -> Dict[str, int]:
+    """Импорт кампании из строк NDJSON; возвращает число вставленных строк по таблицам.
+
+    as_user — записать кампанию на другого пользователя (только для экспорта одного пользователя).
+
+    Вызывается внутри транзакции: при ошибке или обрезанном файле ничего не сохраняется.
+    """
+    from database.database import SCHEMA_VERSION
+
+    records = _parse_lines(lines)
+    header = next(records, None)
+    if not header or header.get("type") != "header" or header.get("format") != FORMAT:
+        raise TransferError("Файл не является экспортом кампании")
+    if header.get("version") != FORMAT_VERSION:
+        raise TransferError(f"Неподдерживаемая версия формата: {header.get('version')}")
+    exported = header.get("schema_version")
+    if exported != SCHEMA_VERSION and not any({exported, SCHEMA_VERSION} <= group for group in COMPATIBLE_SCHEMAS):
+        raise TransferError(f"Экспорт сделан со схемой версии {header.get('schema_version')}, "
+                            f"в базе — {SCHEMA_VERSION}")
+    if as_user is not None and header.get("user_id") is None:
+        raise TransferError("Экспорт всей базы нельзя записать на одного пользователя")
+
+    importer = _Importer(conn, batch_size, as_user)
+    footer = None
+    for record in records:
+        if record.get("type") == "row":
+            importer.add(record["table"], record["row"])
+        elif record.get("type") == "footer":
+            footer = record
+            break
+
+    if footer is None:
+        raise TransferError("Файл обрезан: нет завершающей записи")
+    importer.finish()
+
+    expected = footer.get("counts", {})
+    if any(importer.counts.get(name, 0) != count for name, count in expected.items()):
+        raise TransferError(f"Число строк не совпадает: ожидалось {expected}, вставлено {importer.counts}")
+    return importer.counts
+
+
+def _open_lines(path: str):
+    """Файл построчно; gzip определяется по сигнатуре"""
+    with open(path, "rb") as probe:
+        compressed = probe.read(2) == b"\x1f\x8b"
+    return gzip.open(path, "rb") if compressed else open(path, "rb")
+
+
+def _export_command(args):
+    compress = args.gzip or args.output.endswith(".gz")
+    started = time.perf_counter()
+    size = 0
+    with open(args.output, "wb") as output:
+        for chunk in stream_campaign(args.user_id, compress):
+            output.write(chunk)
+            size += len(chunk)
+    print(f"Экспорт записан в {args.output}: {size / 1024:.1f} КБ за {time.perf_counter() - started:.2f} с")
+
+
+def _import_command(args):
+    import asyncio
+    from database.database import engine, init_db
+
+    if args.copies > 1 and args.as_user is None:
+        raise SystemExit("--copies требует --as-user: копии одной кампании получают разных пользователей")
+
+    # Целевая база может быть новой (перенос на другой хост): схема создается, как при запуске API
+    try:
+        asyncio.run(init_db())
+    except Exception as e:
+        raise TransferError(f"Не удалось подготовить схему целевой базы: {e}")
+
+    for copy in range(args.copies):
+        as_user = args.as_user + copy if args.as_user is not None else None
+        started = time.perf_counter()
+        with engine.begin() as conn, _open_lines(args.input) as lines:
+            counts = import_campaign(conn, lines, args.batch_size, as_user)
+        summary = ", ".join(f"{name} {count}" for name, count in counts.items())
+        print(f"Импорт {copy + 1}/{args.copies}: {summary} за {time.perf_counter() - started:.2f} с")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Экспорт и импорт кампаний Daggerheart")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = commands.add_parser("export", help="Экспорт кампании пользователя или всей базы")
+    export_parser.add_argument("-o", "--output", required=True, help="Файл (.gz — со сжатием)")
+    export_parser.add_argument("--user-id", type=int, default=None, help="Пользователь (по умолчанию вся база)")
+    export_parser.add_argument("--gzip", action="store_true", help="Сжимать независимо от расширения")
+    export_parser.set_defaults(handler=_export_command)
+
+    import_parser = commands.add_parser("import", help="Импорт кампании из файла экспорта")
+    import_parser.add_argument("input")
+    import_parser.add_argument("--as-user", type=int, default=None,
+                               help="Записать данные на этого пользователя вместо исходного")
+    import_parser.add_argument("--copies", type=int, default=1,
+                               help="Число копий (пользователи --as-user, --as-user+1, ...)")
+    import_parser.add_argument("--batch-size", type=int, default=1000)
+    import_parser.set_defaults(handler=_import_command)
+
+    args = parser.parse_args(argv)
+    try:
+        args.handler(args)
+    except TransferError as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
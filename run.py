@@ -1,14 +1,37 @@
 #!/usr/bin/env python3
 """
 Скрипт запуска Daggerheart Telegram Bot
+
+По умолчанию — режим продакшена: приложение импортируется один раз
+(preload), затем N рабочих процессов uvicorn принимают соединения на общем
+сокете. Процесс-супервизор перезапускает упавшие и зависшие (нет heartbeat
+от event loop) рабочие процессы и бота, а по SIGTERM/SIGINT дает им
+доработать: запросы и ходы с обращением к DeepSeek завершаются, буферы
+записываются, и только затем процессы останавливаются.
+
+Запуск:
+  python run.py                      # API (по числу ядер) + бот
+  python run.py --workers 4 --no-bot # только API
+  python run.py --reload             # разработка: один процесс с перезагрузкой
+
+При BOT_MODE=webhook бот работает внутри процесса API (bot/webhook.py), и
+рабочий процесс запускается один: лимиты Telegram (bot/outbox.py) и порядок
+обновлений чата (bot/ordering.py) соблюдаются в пределах процесса.
 """
 
+import argparse
 import asyncio
 import logging
 import multiprocessing
+import os
+import shutil
 import signal
 import sys
+import tempfile
+import time
+from dataclasses import dataclass
 from pathlib import Path
+from typing import Dict, Optional
 
 # Добавляем корневую папку в PYTHONPATH
 sys.path.insert(0, str(Path(__file__).parent))
@@ -18,7 +41,7 @@ from config.settings import settings
 # Настройка логирования
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    format='%(asctime)s - %(process)d - %(name)s - %(levelname)s - %(message)s',
     handlers=[
         logging.StreamHandler(),
         logging.FileHandler('daggerheart_bot.log')
@@ -27,6 +50,10 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+# Процесс, проработавший меньше, считается упавшим при запуске: перезапуск с задержкой
+MIN_UPTIME = 10.0
+MAX_RESTART_DELAY = 60.0
+
 
 def run_bot():
     """Запуск телеграм бота"""
@@ -39,16 +66,17 @@ def run_bot():
         logger.error(f"Ошибка запуска телеграм бота: {e}")
 
 
-def run_api():
-    """Запуск FastAPI сервера"""
+def run_api(reload: bool = True):
+    """Запуск FastAPI сервера в одном процессе"""
     try:
         import uvicorn
         uvicorn.run(
             "api.main:app",
             host=settings.API_HOST,
             port=settings.API_PORT,
-            reload=True,
-            log_level="info"
+            reload=reload,
+            log_level="info",
+            timeout_graceful_shutdown=settings.SHUTDOWN_TIMEOUT
         )
     except KeyboardInterrupt:
         logger.info("API сервер остановлен пользователем")
@@ -56,76 +84,309 @@ def run_api():
         logger.error(f"Ошибка запуска API сервера: {e}")
 
 
-def signal_handler(signum, frame):
-    """Обработчик сигналов завершения"""
-    logger.info("Получен сигнал завершения, останавливаем все процессы...")
-    sys.exit(0)
+def default_workers() -> int:
+    """Число рабочих процессов по доступным ядрам"""
+    if settings.API_WORKERS > 0:
+        return settings.API_WORKERS
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
 
 
-def main():
-    """Главная функция запуска"""
-    logger.info("🎲 Запуск Daggerheart Telegram Bot...")
+@dataclass
+class Child:
+    """Дочерний процесс супервизора"""
+    name: str
+    pid: int = 0
+    started: float = 0.0
+    restarts: int = 0
+    restart_at: Optional[float] = None
 
-    # Проверяем наличие необходимых переменных окружения
-    if not settings.BOT_TOKEN:
-        logger.error("❌ BOT_TOKEN не найден в переменных окружения!")
-        sys.exit(1)
 
-    if not settings.DEEPSEEK_API_KEY:
-        logger.error("❌ DEEPSEEK_API_KEY не найден в переменных окружения!")
-        sys.exit(1)
+def _make_worker_server(config, heartbeats, index):
+    import uvicorn
+    from api.services.lifecycle import lifecycle
 
-    # Настраиваем обработчики сигналов
-    signal.signal(signal.SIGINT, signal_handler)
-    signal.signal(signal.SIGTERM, signal_handler)
+    class WorkerServer(uvicorn.Server):
+        """Сервер рабочего процесса: отмечает heartbeat на каждом такте event loop (раз в 0.1 с)"""
 
-    try:
-        # Создаем процессы для бота и API
-        bot_process = multiprocessing.Process(target=run_bot, name="TelegramBot")
-        api_process = multiprocessing.Process(target=run_api, name="FastAPI")
+        async def on_tick(self, counter: int) -> bool:
+            heartbeats[index] = time.monotonic()
+            return await super().on_tick(counter)
 
-        # Запускаем процессы
-        logger.info("🚀 Запуск API сервера...")
-        api_process.start()
+        def handle_exit(self, sig, frame):
+            lifecycle.begin_drain()
+            super().handle_exit(sig, frame)
 
-        logger.info("🤖 Запуск Telegram бота...")
-        bot_process.start()
+    return WorkerServer(config)
 
-        logger.info("✅ Все сервисы запущены успешно!")
-        logger.info(f"📡 API доступно по адресу: http://{settings.API_HOST}:{settings.API_PORT}")
-        logger.info(f"🌐 Web App доступно по адресу: http://{settings.API_HOST}:{settings.API_PORT}/webapp")
-        logger.info("📚 API документация: http://localhost:8000/docs")
-        logger.info("🛑 Для остановки нажмите Ctrl+C")
 
-        # Ожидаем завершения процессов
-        bot_process.join()
-        api_process.join()
+class Supervisor:
+    """Рабочие процессы API на общем сокете и процесс бота под наблюдением"""
 
-    except KeyboardInterrupt:
-        logger.info("🛑 Получен сигнал остановки...")
+    def __init__(self, workers: int, host: str, port: int, with_bot: bool = True):
+        self.host = host
+        self.port = port
+        self.workers: Dict[int, Child] = {index: Child(f"worker-{index}") for index in range(workers)}
+        self.bot: Optional[Child] = Child("bot") if with_bot else None
+        # Время последнего такта event loop каждого рабочего процесса (0 — еще запускается)
+        self.heartbeats = multiprocessing.RawArray("d", workers)
+        self.stopping = False
+        self.force = False
+        self.ready_logged = False
+        self.config = None
+        self.socket = None
+        self.state_dir_created = False
+
+    def preload(self):
+        """Импорт приложения и подготовка базы до fork: рабочие процессы получают готовые модули"""
+        started = time.perf_counter()
+        self._prepare_state_dir()
+        import uvicorn
+        from api.main import app
+        from database.database import init_db, engine
+
+        asyncio.run(init_db())
+        engine.dispose()
+
+        if settings.BOT_MODE == "webhook":
+            # Один запрос setWebhook на все рабочие процессы
+            from bot.webhook import register_before_fork
+            asyncio.run(register_before_fork())
+
+        self.config = uvicorn.Config(
+            app,
+            host=self.host,
+            port=self.port,
+            log_level="info",
+            proxy_headers=True,
+            forwarded_allow_ips="*",
+            timeout_graceful_shutdown=settings.SHUTDOWN_TIMEOUT
+        )
+        self.socket = self.config.bind_socket()
+        logger.info(f"Приложение загружено за {time.perf_counter() - started:.2f} с")
+
+    def _prepare_state_dir(self):
+        """Общий каталог рабочих процессов (метрики, профилирование) — до импорта приложения"""
+        if not settings.WORKER_STATE_DIR:
+            settings.WORKER_STATE_DIR = tempfile.mkdtemp(prefix="daggerheart-workers-")
+            self.state_dir_created = True
+            return
+        # Значения процессов прошлого запуска не должны попасть в сумму
+        for name in ("metrics", "profiler"):
+            shutil.rmtree(os.path.join(settings.WORKER_STATE_DIR, name), ignore_errors=True)
+
+    def run(self):
+        self.preload()
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+
+        for index in self.workers:
+            self._spawn_worker(index)
+        if self.bot is not None:
+            self._spawn(self.bot, run_bot)
+
+        logger.info(f"📡 API: http://{self.host}:{self.port}, рабочих процессов: {len(self.workers)}")
+        while not self.stopping:
+            self._reap()
+            self._restart_due()
+            self._check_health()
+            time.sleep(0.5)
+
+        self._shutdown()
+
+    def _request_stop(self, signum, frame):
+        if self.stopping:
+            # Повторный сигнал — не ждем завершения
+            self.force = True
+            return
+        logger.info(f"Получен сигнал {signal.Signals(signum).name}, плавная остановка...")
+        self.stopping = True
+
+    def _spawn_worker(self, index: int):
+        self.heartbeats[index] = 0.0
+
+        def target():
+            server = _make_worker_server(self.config, self.heartbeats, index)
+            server.run(sockets=[self.socket])
+
+        self._spawn(self.workers[index], target)
+
+    def _spawn(self, child: Child, target):
+        pid = os.fork()
+        if pid == 0:
+            # Дочерний процесс: сигналы обрабатывает uvicorn / aiogram
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            code = 0
+            try:
+                target()
+            except BaseException as e:
+                logger.error(f"Процесс {child.name} завершился с ошибкой: {e}")
+                code = 1
+            finally:
+                logging.shutdown()
+                os._exit(code)
 
-        # Завершаем процессы
-        if 'bot_process' in locals() and bot_process.is_alive():
+        child.pid = pid
+        child.started = time.monotonic()
+        child.restart_at = None
+        logger.info(f"Запущен процесс {child.name} (pid {pid})")
+
+    def _children(self):
+        children = list(self.workers.values())
+        if self.bot is not None:
+            children.append(self.bot)
+        return children
+
+    def _reap(self):
+        """Учет завершившихся процессов и планирование перезапуска"""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+
+            child = next((child for child in self._children() if child.pid == pid), None)
+            if child is None:
+                continue
+            child.pid = 0
+            if self.stopping:
+                continue
+
+            uptime = time.monotonic() - child.started
+            delay = 0.0
+            if uptime < MIN_UPTIME:
+                child.restarts += 1
+                delay = min(MAX_RESTART_DELAY, 2 ** child.restarts)
+            else:
+                child.restarts = 0
+            logger.warning(f"Процесс {child.name} (pid {pid}) завершился с кодом "
+                           f"{os.waitstatus_to_exitcode(status)}, перезапуск через {delay:.0f} с")
+            child.restart_at = time.monotonic() + delay
+
+    def _restart_due(self):
+        now = time.monotonic()
+        for index, child in self.workers.items():
+            if child.pid == 0 and child.restart_at is not None and child.restart_at <= now:
+                self._spawn_worker(index)
+        if self.bot is not None and self.bot.pid == 0 and self.bot.restart_at is not None \
+                and self.bot.restart_at <= now:
+            self._spawn(self.bot, run_bot)
+
+    def _check_health(self):
+        """Перезапуск рабочих процессов, event loop которых перестал отвечать"""
+        now = time.monotonic()
+        timeout = settings.WORKER_HEARTBEAT_TIMEOUT
+        for index, child in self.workers.items():
+            if child.pid == 0:
+                continue
+            heartbeat = self.heartbeats[index]
+            last_seen = heartbeat if heartbeat else child.started
+            if now - last_seen > timeout:
+                state = "не отвечает" if heartbeat else "не запустился"
+                logger.error(f"Процесс {child.name} (pid {child.pid}) {state} {now - last_seen:.0f} с, перезапуск")
+                self._kill(child, signal.SIGKILL)
+
+        if not self.ready_logged and all(self.heartbeats[index] for index in self.workers):
+            self.ready_logged = True
+            logger.info("✅ Все рабочие процессы готовы принимать запросы")
+
+    def _kill(self, child: Child, signum):
+        try:
+            os.kill(child.pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def _shutdown(self):
+        """SIGTERM всем процессам и ожидание: сначала соединения, затем ходы и буферы"""
+        # Сокет супервизора тоже закрываем, иначе новые соединения будут ждать в очереди
+        self.socket.close()
+        running = [child for child in self._children() if child.pid]
+        for child in running:
+            self._kill(child, signal.SIGTERM)
+
+        deadline = time.monotonic() + settings.SHUTDOWN_TIMEOUT * 2 + 5
+        while any(child.pid for child in running) and time.monotonic() < deadline and not self.force:
+            self._reap()
+            time.sleep(0.1)
+
+        for child in running:
+            if child.pid:
+                logger.warning(f"Процесс {child.name} (pid {child.pid}) не завершился, принудительная остановка")
+                self._kill(child, signal.SIGKILL)
+        self._reap()
+        if self.state_dir_created:
+            shutil.rmtree(settings.WORKER_STATE_DIR, ignore_errors=True)
+        logger.info("✅ Все сервисы остановлены")
+
+
+def run_development(with_bot: bool, reload: bool):
+    """Один процесс API (с перезагрузкой при изменении файлов) и бот рядом"""
+    bot_process = None
+    if with_bot:
+        bot_process = multiprocessing.Process(target=run_bot, name="TelegramBot")
+        logger.info("🤖 Запуск Telegram бота...")
+        bot_process.start()
+
+    logger.info("🚀 Запуск API сервера...")
+    logger.info(f"🌐 Web App доступно по адресу: http://{settings.API_HOST}:{settings.API_PORT}/webapp")
+    logger.info("📚 API документация: http://localhost:8000/docs")
+    try:
+        run_api(reload=reload)
+    finally:
+        if bot_process is not None and bot_process.is_alive():
             logger.info("🤖 Остановка Telegram бота...")
             bot_process.terminate()
             bot_process.join(timeout=5)
 
-        if 'api_process' in locals() and api_process.is_alive():
-            logger.info("📡 Остановка API сервера...")
-            api_process.terminate()
-            api_process.join(timeout=5)
 
-        logger.info("✅ Все сервисы остановлены")
+def main():
+    """Главная функция запуска"""
+    parser = argparse.ArgumentParser(description="Запуск Daggerheart API и Telegram бота")
+    parser.add_argument("--workers", type=int, default=None, help="Число рабочих процессов API (по умолчанию по ядрам)")
+    parser.add_argument("--host", default=settings.API_HOST)
+    parser.add_argument("--port", type=int, default=settings.API_PORT)
+    parser.add_argument("--no-bot", action="store_true", help="Не запускать Telegram бота")
+    parser.add_argument("--reload", action="store_true", help="Режим разработки: один процесс с перезагрузкой")
+    args = parser.parse_args()
 
-    except Exception as e:
-        logger.error(f"❌ Критическая ошибка: {e}")
+    logger.info("🎲 Запуск Daggerheart Telegram Bot...")
+
+    # Проверяем наличие необходимых переменных окружения
+    if not args.no_bot and not settings.BOT_TOKEN:
+        logger.error("❌ BOT_TOKEN не найден в переменных окружения!")
+        sys.exit(1)
+
+    if not settings.DEEPSEEK_API_KEY:
+        logger.error("❌ DEEPSEEK_API_KEY не найден в переменных окружения!")
         sys.exit(1)
 
+    # В режиме webhook обновления принимают рабочие процессы API, отдельный процесс бота не нужен
+    with_bot = not args.no_bot and settings.BOT_MODE == "polling"
+
+    if args.reload or not hasattr(os, "fork"):
+        # Без fork (Windows) рабочие процессы не запускаются: один процесс без перезагрузки
+        settings.API_HOST, settings.API_PORT = args.host, args.port
+        run_development(with_bot=with_bot, reload=args.reload)
+        return
+
+    workers = args.workers or default_workers()
+    if settings.BOT_MODE == "webhook" and workers > 1:
+        # Обновления и отправки бота должен обслуживать один процесс: иначе лимиты
+        # Telegram умножаются на число процессов, а обновления чата идут параллельно
+        logger.warning(f"BOT_MODE=webhook: запускается 1 рабочий процесс вместо {workers}")
+        workers = 1
+    Supervisor(workers, args.host, args.port, with_bot=with_bot).run()
+
 
 if __name__ == "__main__":
     # Проверяем версию Python
-    if sys.version_info < (3, 8):
-        print("❌ Требуется Python 3.8 или выше")
+    if sys.version_info < (3, 9):
+        print("❌ Требуется Python 3.9 или выше")
         sys.exit(1)
 
-    main()
\ No newline at end of file
+    main()
@@ -1,4 +1,4 @@
 #!/bin/bash
 
-# Запуск только API сервера для Render
-uvicorn api.main:app --host 0.0.0.0 --port $PORT
\ No newline at end of file
+# Запуск только API сервера для Render (рабочие процессы по числу ядер, плавная остановка)
+exec python run.py --no-bot --host 0.0.0.0 --port $PORT
@@ -12,7 +12,10 @@ class GameApp {
             isGameActive: false
         };
         this.screenHistory = [];
-        this.apiUrl = 'http://localhost:8000/api';
+        this.session = null;
+        this.tables = null;
+        // API обслуживается тем же сервером, что и Mini App
+        this.apiUrl = '/api';
         
         this.init();
     }
@@ -20,13 +23,30 @@ class GameApp {
     init() {
         console.log('GameApp initialized');
         
-        // Имитируем загрузку
-        setTimeout(() => {
-            this.showScreen('main-menu');
-        }, 2000);
-        
         // Настраиваем обработчики форм
         this.setupEventListeners();
+
+        // Загружаем все стартовые данные одним запросом
+        this.bootstrap();
+    }
+
+    async bootstrap() {
+        const userId = window.telegramApp.getUserId();
+
+        try {
+            if (userId) {
+                const response = await this.apiRequest('GET', `/bootstrap/${userId}`);
+
+                this.tables = response.tables;
+                this.gameState.character = response.character;
+                this.session = response.session;
+                this.narrative = response.narrative || [];
+            }
+        } catch (error) {
+            console.error('Error loading bootstrap data:', error);
+        }
+
+        this.showScreen('main-menu');
     }
 
     setupEventListeners() {
@@ -102,7 +122,17 @@ class GameApp {
 
     loadGame() {
         window.telegramApp.hapticFeedback('light');
-        window.telegramApp.showAlert('Загрузка игры пока не реализована');
+
+        if (!this.session || !this.gameState.character) {
+            window.telegramApp.showAlert('Нет активной игры');
+            return;
+        }
+
+        // Продолжаем активную сессию из данных bootstrap
+        this.gameState.isGameActive = true;
+        this.showScreen('game-screen');
+        (this.narrative || []).forEach(text => this.updateStoryText(text));
+        this.updateCharacterStatus();
     }
 
     showCharacter() {
@@ -293,14 +323,40 @@ Fear: ${char.fear}
             options.body = JSON.stringify(data);
         }
 
-        const response = await fetch(this.apiUrl + endpoint, options);
-        
+        // Повтор POST с тем же ключом не выполнит действие второй раз
+        const retries = method === 'POST' ? 2 : 0;
+        if (method === 'POST') {
+            options.headers['Idempotency-Key'] = this.newIdempotencyKey();
+        }
+
+        let response;
+        for (let attempt = 0; ; attempt++) {
+            try {
+                response = await fetch(this.apiUrl + endpoint, options);
+                if (response.status < 500 || attempt >= retries) {
+                    break;
+                }
+            } catch (error) {
+                if (attempt >= retries) {
+                    throw error;
+                }
+            }
+            await new Promise(resolve => setTimeout(resolve, 500 * (attempt + 1)));
+        }
+
         if (!response.ok) {
             throw new Error(`HTTP error! status: ${response.status}`);
         }
 
         return await response.json();
     }
+
+    newIdempotencyKey() {
+        if (window.crypto && window.crypto.randomUUID) {
+            return window.crypto.randomUUID();
+        }
+        return Date.now().toString(36) + Math.random().toString(36).slice(2);
+    }
 }
 
 // Глобальные функции для кнопок